@@ -0,0 +1,64 @@
+"""
+Download size and time of a whole collection as CSV, Arrow IPC and GeoParquet
+
+    python benchmarks/bulk_formats.py \
+        "http://localhost:8080/api/bench/points?page_size=10000"
+
+Every format is downloaded `--repeat` times, the fastest download is
+reported, together with the time to read the body into an Arrow table.
+"""
+import argparse
+import io
+import time
+import urllib.request
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet
+
+FORMATS = {
+    "text/csv": lambda body: pa.csv.read_csv(io.BytesIO(body)),
+    "application/vnd.apache.arrow.stream": lambda body: pa.ipc.open_stream(
+        body
+    ).read_all(),
+    "application/vnd.apache.parquet": lambda body: pa.parquet.read_table(
+        io.BytesIO(body)
+    ),
+}
+
+
+def download(url, content_type, encoding):
+    request = urllib.request.Request(
+        url, headers={"Accept": content_type, "Accept-Encoding": encoding}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+    return body, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--encoding", default="identity")
+    args = parser.parse_args()
+
+    for content_type, read in FORMATS.items():
+        downloads = [
+            download(args.url, content_type, args.encoding) for _ in range(args.repeat)
+        ]
+        body = downloads[0][0]
+        elapsed = min(elapsed for _, elapsed in downloads)
+        start = time.perf_counter()
+        table = read(body) if args.encoding == "identity" else None
+        read_time = time.perf_counter() - start
+        rows = table.num_rows if table is not None else "-"
+        print(
+            f"{content_type:<38} {len(body):12} bytes  download {elapsed:7.3f} s  "
+            f"read {read_time:7.3f} s  {rows} rows"
+        )
+
+
+if __name__ == "__main__":
+    main()
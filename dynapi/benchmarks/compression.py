@@ -0,0 +1,51 @@
+"""
+Size and compression time of a response, per content encoding and level
+
+    python benchmarks/compression.py --levels 1,3,6,9 \
+        "http://localhost:8080/api/example/steden?page_size=1000&content-type=application/geojson"
+
+The body is fetched once without compression, then compressed the way it is
+streamed: in chunks of STREAM_CHUNK_SIZE, each of them flushed.
+"""
+import argparse
+import time
+import urllib.request
+
+from dynapi import compression, const
+
+
+def compress(body, encoding, level, chunk_size):
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    start = time.perf_counter()
+    size = sum(len(part) for part in compression.encoded(chunks, encoding, level))
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("--levels", default="1,3,5,6,9")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    request = urllib.request.Request(args.url, headers={"Accept-Encoding": "identity"})
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+    print(f"identity {len(body):12} bytes")
+
+    for encoding in compression.OFFERED:
+        for level in args.levels.split(","):
+            timings = [
+                compress(body, encoding, int(level), const.STREAM_CHUNK_SIZE)
+                for _ in range(args.repeat)
+            ]
+            size = timings[0][0]
+            elapsed = min(elapsed for _, elapsed in timings)
+            print(
+                f"{encoding:<4} {level:>3} {size:12} bytes "
+                f"{len(body) / size:6.1f}x {len(body) / elapsed / 2 ** 20:8.1f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
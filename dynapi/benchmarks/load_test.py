@@ -0,0 +1,82 @@
+"""
+Load test of the WSGI (uwsgi) and the ASGI (uvicorn) app with many concurrent clients
+
+Start both apps on the same database, with the example dataset imported:
+
+    uwsgi --http :8080 --module dynapi.wsgi --processes 4 --threads 2
+    uvicorn dynapi.asgi:app --port 8081
+
+    python benchmarks/load_test.py --concurrency 200 --requests 4000 \
+        --path "/api/example/steden?near=4.89,52.37&distance=5km" \
+        http://localhost:8080 http://localhost:8081
+
+The bodies of the first response of every app are compared, then every app
+gets `--requests` requests from `--concurrency` clients at the same time.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def load(url, n_requests, concurrency, timeout):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: fetch(url, timeout), range(n_requests)))
+        elapsed = time.perf_counter() - start
+    timings = sorted(timing for ok, timing in results if ok)
+    errors = sum(1 for ok, _ in results if not ok)
+    if not timings:
+        return f"{errors} errors"
+    throughput = len(timings) / elapsed
+    # At least two timings are needed for the quantiles
+    quantiles = statistics.quantiles(timings * 2, n=100)
+    return (
+        f"{throughput:8.1f} req/s  "
+        f"p50 {quantiles[49] * 1000:7.1f} ms  "
+        f"p95 {quantiles[94] * 1000:7.1f} ms  "
+        f"p99 {quantiles[98] * 1000:7.1f} ms  "
+        f"{errors} errors"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_urls", nargs="+")
+    parser.add_argument("--path", default="/api/example/steden?page_size=100")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    bodies = {}
+    for base_url in args.base_urls:
+        with urllib.request.urlopen(base_url + args.path) as response:
+            bodies[base_url] = response.read()
+    if len(set(bodies.values())) > 1:
+        print("The responses differ:")
+        for base_url, body in bodies.items():
+            print(f"  {base_url}: {len(body)} bytes")
+
+    for base_url in args.base_urls:
+        result = load(
+            base_url + args.path, args.requests, args.concurrency, args.timeout
+        )
+        print(f"{base_url:<28} {result}")
+
+
+if __name__ == "__main__":
+    main()
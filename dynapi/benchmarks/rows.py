@@ -0,0 +1,65 @@
+"""
+Memory and latency of turning database rows into renderable resources
+
+    python benchmarks/rows.py --rows 10000 --columns 12
+
+Compares the per-row `make_dataclass` + `asdict` approach with the
+`RowType` that is built once per collection.
+"""
+import argparse
+import time
+import tracemalloc
+from dataclasses import asdict, make_dataclass
+
+from dynapi.domain.types import RowType
+
+
+def make_rows(n_rows, properties):
+    return [
+        {
+            **{name: f"{name}-{i}" for name in properties},
+            "geometry": {"type": "Point", "coordinates": [4.9 + i, 52.3]},
+        }
+        for i in range(n_rows)
+    ]
+
+
+def per_row_dataclass(rows, properties):
+    rendered = []
+    for row in rows:
+        fields_class = make_dataclass("Fields", properties)
+        fields = fields_class(**{k: v for k, v in row.items() if k in set(properties)})
+        rendered.append(asdict(fields))
+    return rendered
+
+
+def shared_row_type(rows, properties):
+    row_type = RowType(properties)
+    return [row_type(row).as_dict() for row in rows]
+
+
+def measure(label, func, rows, properties):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(rows, properties)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed * 1000:10.1f} ms {peak / 2 ** 20:10.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--columns", type=int, default=12)
+    args = parser.parse_args()
+
+    properties = [f"field{i}" for i in range(args.columns)] + ["geometry"]
+    rows = make_rows(args.rows, properties)
+    print(f"{args.rows} rows, {len(properties)} columns")
+    measure("make_dataclass per row", per_row_dataclass, rows, properties)
+    measure("shared RowType", shared_row_type, rows, properties)
+
+
+if __name__ == "__main__":
+    main()
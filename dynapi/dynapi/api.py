@@ -1,154 +1,283 @@
 import os
 import functools
-import csv
-import io
-import json
-from dataclasses import dataclass
-from dataclasses import asdict
+from urllib.parse import urlencode
 
 
 from flask import Blueprint
-from flask import jsonify
 from flask import request
 from flask import current_app
 from flask import render_template
 from flask import abort
 from flask import Response
+from flask import send_from_directory
 
+from dataservices.tiles import WEB_MERCATOR_SRID
 
 from dynapi import services
 from . import const
-
-from .exceptions import InvalidInputException, NotFoundException
+from .compression import compressed, compressible, negotiate_encoding
+from .infra.cache import get_response_cache, get_tile_cache
+from .renderers import (  # NoQA
+    MVT_MIMETYPE,
+    JSONRenderer,
+    batch_body_params,
+    geo_body_params,
+    get_renderer,
+    json_dumps,
+    negotiate,
+    query_params,
+    streamed,
+)
+from .snapshots import (
+    SNAPSHOT_MIMETYPES,
+    download_name,
+    latest_snapshot,
+    snapshot_etag,
+    snapshot_file,
+    snapshot_headers,
+)
+from .validators import is_not_modified, make_etag, set_validators, set_vary
+
+from .exceptions import (
+    InvalidInputException,
+    NotAcceptableException,
+    NotFoundException,
+)
 
 
 api = Blueprint("v1", __name__)
 
 SCHEMA_URL = os.getenv("SCHEMA_URL")
 
-uri_path_prefix = os.getenv("URI_PATH_PREFIX")
-
-
-# XXX instead of explicitly stating multiple
-# we could also check in the renderer if the content is iterable
-@dataclass
-class Renderer:
-    multiple: bool
-
-    def render(self, resource):
-        pass
-
-
-class JSONRenderer(Renderer):
-    def get_self_link(self, resource):
-        document_id = getattr(resource.fields, resource.collection.primary_name)
-        return (
-            f"{uri_path_prefix}{resource.collection.coll_ref.catalog}/"
-            f"{resource.collection.coll_ref.collection}/{document_id}"
-        )
-
-    def render(self, resource):
-
-        rendered = asdict(resource.fields)
-        rendered["_links"] = {"self": {"href": self.get_self_link(resource)}}
-        return rendered
-
-    def __call__(self, content):
-        if self.multiple:
-            return jsonify([self.render(resource) for resource in content])
-        return jsonify(self.render(content))
-
-
-class NDJSONRenderer(Renderer):
-    def render(self, resource):
-        return json.dumps(asdict(resource.fields), separators=(",", ":"))
-
-    def __call__(self, content):
-        if self.multiple:
-            response_content = "\n".join(
-                [self.render(resource) for resource in content]
-            )
+uri_path_prefix = const.URI_PATH_PREFIX
+
+
+def cache_response(cache, response, etag, version, catalog, collection, **kwargs):
+    """ Stores the body in the cache, a streamed body once it has been sent """
+    headers = [(k, v) for k, v in response.headers.items() if k != "Content-Length"]
+    if response.is_sequence:
+        cache.put(etag, catalog, collection, version.version, headers, response.data)
+        return
+    body_parts = response.iter_encoded()
+
+    def tee():
+        parts, size = [], 0
+        for part in body_parts:
+            yield part
+            if parts is not None:
+                parts.append(part)
+                size += len(part)
+                if size > cache.max_item_bytes:
+                    parts = None
+        if parts is not None:
+            body = b"".join(parts)
+            cache.put(etag, catalog, collection, version.version, headers, body)
+
+    response.response = tee()
+
+
+def encode_response(response, encoding):
+    """ Compresses the body in the negotiated encoding, see `compression` """
+    response.vary.add("Accept-Encoding")
+    if encoding is None or not compressible(response.mimetype):
+        return response
+    chunks, encoding = compressed(
+        response.iter_encoded(), encoding, response.mimetype
+    )
+    if encoding is not None and not response.is_sequence:
+        # Still streamed, compressed while it is sent
+        response.response = chunks
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(b"".join(chunks))
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def cached_response(cache, etag, version):
+    """ Not Modified or the cached response, None when it has to be rendered """
+    if is_not_modified(request, etag, version):
+        return set_validators(Response(status=304), etag, version)
+    cached = cache.get(etag) if cache is not None else None
+    if cached is None:
+        return None
+    response = Response(cached.body, headers=cached.headers)
+    response.headers["X-Cache"] = "HIT"
+    return response
+
+
+def store_response(cache, response, etag, version, **kwargs):
+    set_validators(response, etag, version)
+    if cache is not None and response.status_code == 200:
+        cache_response(cache, response, etag, version, **kwargs)
+        response.headers["X-Cache"] = "MISS"
+    return response
+
+
+def handler(
+    catalog_service_method,
+    multiple,
+    table_version,
+    body_params=geo_body_params,
+    **kwargs,
+):
+    try:
+        negotiated = negotiate(request, multiple)
+    except NotAcceptableException:
+        abort(406)
+    filter_params = query_params(request, kwargs)
+    encoding = negotiate_encoding(request.accept_encodings)
+    cache = get_response_cache()
+    try:
+        if request.method == "POST":
+            body = request.get_json(silent=True)
+            filter_params.update(body_params(body, request.headers))
+        # Only the version marker is read to answer a conditional request
+        version = table_version(kwargs["catalog"], kwargs["collection"])
+        # An expanded representation also depends on the related tables
+        expanded = "expand" in request.args
+        if version is None or request.method == "POST" or expanded:
+            etag = None
         else:
-            response_content = self.render(content)
-        return Response(response_content, mimetype="application/x-ndjson")
+            etag = make_etag(
+                request,
+                version,
+                negotiated.content_type,
+                negotiated.srid,
+                negotiated.json_format,
+                encoding,
+                **kwargs,
+            )
+            response = cached_response(cache, etag, version)
+            if response is not None:
+                return set_vary(response)
+        content = catalog_service_method(
+            srid=negotiated.srid,
+            geo_format=negotiated.geo_format,
+            json_format=negotiated.json_format,
+            columnar=negotiated.columnar,
+            table_version=version,
+            **filter_params,
+        )
+        # Compressed variants are cached as they are sent
+        response = encode_response(negotiated.renderer(content), encoding)
+    except InvalidInputException:
+        abort(400)
+    except NotFoundException:
+        abort(404)
+    if etag is not None:
+        store_response(cache, response, etag, version, **kwargs)
+    return set_vary(response)
 
 
-class CSVRenderer(Renderer):
-    def __call__(self, content):
-        # XXX fix when content is empty
-        if not self.multiple:
-            content = [asdict(content.fields)]
+def tile_handler(catalog_service, **kwargs):
+    """ Mapbox Vector Tile, with the same validators and caching as documents """
+    cache = get_tile_cache()
+    encoding = negotiate_encoding(request.accept_encodings)
+    try:
+        version = catalog_service.table_version(kwargs["catalog"], kwargs["collection"])
+        if version is None:
+            etag = None
         else:
-            content = [asdict(r.fields) for r in content]
-        mem_file = io.StringIO()
-        writer = csv.writer(mem_file)
-        writer.writerow(content[0].keys())
-        writer.writerows([d.values() for d in content])
-
-        return Response(
-            mem_file.getvalue(),
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=output.csv"},
+            etag = make_etag(
+                request,
+                version,
+                MVT_MIMETYPE,
+                WEB_MERCATOR_SRID,
+                None,
+                encoding,
+                **kwargs,
+            )
+            response = cached_response(cache, etag, version)
+            if response is not None:
+                return response
+        response = Response(
+            catalog_service.get_tile(
+                table_version=version, **{**request.args, **kwargs}
+            ),
+            mimetype=MVT_MIMETYPE,
         )
+        response = encode_response(response, encoding)
+    except InvalidInputException:
+        abort(400)
+    except NotFoundException:
+        abort(404)
+    if etag is not None:
+        store_response(cache, response, etag, version, **kwargs)
+    return response
 
 
-class GeoJSONRenderer(Renderer):
-    def render(self, resource):
-        resource = asdict(resource.fields)
-        return {
-            "type": "Feature",
-            "id": resource["id"],
-            "properties": {k: v for k, v in resource.items() if k != "id"},
+def download_handler(catalog_service, catalog, collection, format_):
+    """ Snapshot of a whole collection, sent with the `wsgi.file_wrapper` of the
+    server, e.g. sendfile, and resumable with a Range request
+    """
+    if const.SNAPSHOT_PATH is None or format_ not in SNAPSHOT_MIMETYPES:
+        abort(404)
+    try:
+        version = catalog_service.table_version(catalog, collection)
+    except NotFoundException:
+        abort(404)
+    if version is None:
+        abort(404)
+    # An older snapshot while the one of the current version is written
+    snapshot = latest_snapshot(
+        const.SNAPSHOT_PATH, catalog, collection, version, format_
+    )
+    if snapshot is None:
+        abort(404)
+    response = send_from_directory(
+        const.SNAPSHOT_PATH,
+        snapshot_file(catalog, collection, snapshot, format_),
+        mimetype=SNAPSHOT_MIMETYPES[format_],
+        as_attachment=True,
+        download_name=download_name(collection, snapshot, format_),
+        etag=snapshot_etag(catalog, collection, snapshot, format_),
+        last_modified=snapshot.updated_at,
+    )
+    response.headers.update(snapshot_headers(snapshot, version))
+    response.cache_control.no_cache = True
+    return response
+
+
+def iter_search_parts(outcome):
+    """ Search results in their global order, each with its collection as type """
+    renderer = JSONRenderer(False)
+    yield '{"_embedded":{"results":['
+    for i, result in enumerate(outcome.results):
+        rendered = {
+            "type": result.collection.coll_ref.collection,
+            **renderer.render(result.resource),
         }
-
-    def __call__(self, content):
-        # For NL-API compliance add Content-Crs header
-        if not self.multiple:
-            response = jsonify(self.render(content))
+        if result.distance is not None:
+            rendered["_distance"] = result.distance
         else:
-            response = jsonify(
-                {
-                    "type": "FeatureCollection",
-                    "features": [self.render(resource) for resource in content],
-                }
-            )
-        response.headers["Content-Crs"] = "EPSG:4326"
-        return response
-
-
-def get_renderer(content_type, multiple):
-    # XXX 7.2.10 API-25: Check the Content-Type header settings
-    # Check the Content-Type header is application/json or another supported
-    # content types, otherwise send the HTTP status code 415 Unsupported Media Type.
-    return {
-        "application/json": JSONRenderer(multiple),
-        "application/ndjson": NDJSONRenderer(multiple),
-        "text/csv": CSVRenderer(multiple),
-        "application/geojson": GeoJSONRenderer(multiple),
-    }.get(content_type, JSONRenderer(multiple))
+            rendered["_score"] = result.score
+        yield ("," if i else "") + json_dumps(rendered)
+    yield (
+        f']}},"_timed_out":{json_dumps(outcome.timed_out)},'
+        f'"_failed":{json_dumps(outcome.failed)},'
+        f'"_queued":{json_dumps(outcome.queued)},'
+        f'"_links":{{"self":{{"href":{json_dumps(search_link())}}}}}}}'
+    )
 
 
-def handler(catalog_service_method, multiple, **kwargs):
-    srid = const.DB_SRID
-    geo_format = "geojson"
+def search_link():
+    query = urlencode(list(request.args.items(multi=True)))
+    return f"{uri_path_prefix}_zoek?{query}" if query else f"{uri_path_prefix}_zoek"
 
-    content_type = request.headers.get("Accept", "application/json")
-    content_type = request.args.get("content-type", content_type)
-    filter_params = {**kwargs, **request.args}
 
-    if content_type == "text/csv":
-        geo_format = "csv"
-    if content_type == "application/geojson":
-        srid = const.LAT_LON_SRID
-    renderer = get_renderer(content_type, multiple)
+def search_handler(search_service):
     try:
-        return renderer(
-            catalog_service_method(srid=srid, geo_format=geo_format, **filter_params)
-        )
+        outcome = search_service.search(**request.args)
     except InvalidInputException:
         abort(400)
     except NotFoundException:
         abort(404)
+    return encode_response(
+        streamed(iter_search_parts(outcome), mimetype="application/json"),
+        negotiate_encoding(request.accept_encodings),
+    )
 
 
 def db_con_factory():
@@ -163,18 +292,77 @@ def make_routes(schema_url):
     api.add_url_rule(
         f"/<catalog>/<collection>/<document_id>",
         "get_document",
-        functools.partial(handler, catalog_service.get_document, False),
+        functools.partial(
+            handler,
+            catalog_service.get_document,
+            False,
+            catalog_service.table_version,
+        ),
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        "get_tile",
+        functools.partial(tile_handler, catalog_service),
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_batch",
+        "get_documents",
+        functools.partial(
+            handler,
+            catalog_service.get_documents,
+            True,
+            catalog_service.table_version,
+            body_params=batch_body_params,
+        ),
+        methods=["GET", "POST"],
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_zoek",
+        "search_collection",
+        functools.partial(
+            handler,
+            catalog_service.list_resources,
+            True,
+            catalog_service.table_version,
+        ),
+        methods=["POST"],
     )
 
     api.add_url_rule(
         f"/<catalog>/<collection>",
         "get_collection",
-        functools.partial(handler, catalog_service.list_resources, True),
+        functools.partial(
+            handler,
+            catalog_service.list_resources,
+            True,
+            catalog_service.table_version,
+        ),
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_download.<format_>",
+        "download_collection",
+        functools.partial(download_handler, catalog_service),
+    )
+
+    search_service = services.SearchService(schema_url, lambda: current_app.db.engine)
+    api.add_url_rule(
+        "/_zoek", "search", functools.partial(search_handler, search_service)
     )
 
     oa_context = services.OpenAPIContext(uri_path_prefix, schema_url)
     oa_service = services.OpenAPIService(oa_context)
-    api.add_url_rule("/spec", "openapi-spec", oa_service.create_openapi_spec)
+
+    def openapi_spec():
+        spec = oa_service.encoded_openapi_spec()
+        response = Response(spec.body, mimetype="application/json")
+        response.set_etag(spec.etag)
+        return response.make_conditional(request)
+
+    api.add_url_rule("/spec", "openapi-spec", openapi_spec)
 
 
 make_routes(SCHEMA_URL)
@@ -0,0 +1,320 @@
+"""
+ASGI variant of dynapi, on an asyncpg connection pool
+
+    uvicorn dynapi.asgi:app --port 8000
+
+Documents, batches, collections and geo queries are served with the same bodies,
+headers and validators as the WSGI app. A slow query holds a pooled
+connection while it runs, not a worker, so one process serves many slow
+requests at the same time. Vector tiles, the global search and the
+response cache are only served by the WSGI app.
+"""
+import asyncio
+import functools
+import json
+import os
+
+import asyncpg
+from quart import Blueprint, Quart, Response, abort, render_template, request
+from quart import send_from_directory, stream_with_context
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import remove_entity_headers
+
+from dynapi import services
+from . import const
+from .compression import compressed, compressible, negotiate_encoding
+from .exceptions import (
+    InvalidInputException,
+    NotAcceptableException,
+    NotFoundException,
+)
+from .infra.prepared import statement_timings
+from .renderers import (
+    batch_body_params,
+    chunked,
+    geo_body_params,
+    negotiate,
+    query_params,
+)
+from .snapshots import (
+    SNAPSHOT_MIMETYPES,
+    download_name,
+    latest_snapshot,
+    snapshot_etag,
+    snapshot_file,
+    snapshot_headers,
+)
+from .validators import is_not_modified, make_etag, set_validators, set_vary
+
+
+dsn = os.getenv("DATABASE_URL")
+
+SCHEMA_URL = os.getenv("SCHEMA_URL")
+
+api = Blueprint("v1", __name__)
+status = Blueprint("status", __name__)
+
+
+async def init_connection(connection):
+    """ JSON values are decoded, like psycopg2 does for the WSGI app """
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+
+
+async def iter_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def not_modified(response):
+    """ Without the entity headers, as werkzeug sends a 304 in the WSGI app """
+    response.status_code = 304
+    response.set_data(b"")
+    remove_entity_headers(response.headers)
+    return response
+
+
+def make_response(rendered, encoding):
+    """ Compressed like the responses of the WSGI app, see `api.encode_response` """
+    chunks = chunked(rendered.parts)
+    if not rendered.binary:
+        chunks = (chunk.encode() for chunk in chunks)
+    if not compressible(rendered.mimetype):
+        encoding = None
+    if encoding is not None:
+        chunks, encoding = compressed(chunks, encoding, rendered.mimetype)
+    if rendered.stream:
+        # The links are rendered last, in the context of the request
+        body = stream_with_context(iter_chunks)(chunks)
+    else:
+        body = b"".join(chunks)
+    response = Response(body, mimetype=rendered.mimetype, headers=rendered.headers)
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+async def handler(
+    catalog_service_method,
+    multiple,
+    table_version,
+    body_params=geo_body_params,
+    **kwargs,
+):
+    try:
+        negotiated = negotiate(request, multiple)
+    except NotAcceptableException:
+        abort(406)
+    filter_params = query_params(request, kwargs)
+    encoding = negotiate_encoding(request.accept_encodings)
+    try:
+        if request.method == "POST":
+            body = await request.get_json(silent=True)
+            filter_params.update(body_params(body, request.headers))
+        version = await table_version(kwargs["catalog"], kwargs["collection"])
+        # An expanded representation also depends on the related tables
+        expanded = "expand" in request.args
+        if version is None or request.method == "POST" or expanded:
+            etag = None
+        else:
+            etag = make_etag(
+                request,
+                version,
+                negotiated.content_type,
+                negotiated.srid,
+                negotiated.json_format,
+                encoding,
+                **kwargs,
+            )
+            if is_not_modified(request, etag, version):
+                response = set_validators(Response(""), etag, version)
+                return not_modified(set_vary(response))
+        content = await catalog_service_method(
+            srid=negotiated.srid,
+            geo_format=negotiated.geo_format,
+            json_format=negotiated.json_format,
+            columnar=negotiated.columnar,
+            table_version=version,
+            **filter_params,
+        )
+    except InvalidInputException:
+        abort(400)
+    except NotFoundException:
+        abort(404)
+    response = make_response(negotiated.renderer.rendered_content(content), encoding)
+    if etag is not None:
+        set_validators(response, etag, version)
+    return set_vary(response)
+
+
+async def download_handler(catalog_service, catalog, collection, format_):
+    """ Snapshot of a whole collection, like `api.download_handler` """
+    if const.SNAPSHOT_PATH is None or format_ not in SNAPSHOT_MIMETYPES:
+        abort(404)
+    try:
+        version = await catalog_service.table_version(catalog, collection)
+    except NotFoundException:
+        abort(404)
+    if version is None:
+        abort(404)
+    snapshot = latest_snapshot(
+        const.SNAPSHOT_PATH, catalog, collection, version, format_
+    )
+    if snapshot is None:
+        abort(404)
+    # The arguments of Quart 0.18, pinned in setup.py: later versions name
+    # them download_name and etag
+    response = await send_from_directory(
+        const.SNAPSHOT_PATH,
+        snapshot_file(catalog, collection, snapshot, format_),
+        mimetype=SNAPSHOT_MIMETYPES[format_],
+        as_attachment=True,
+        attachment_filename=download_name(collection, snapshot, format_),
+        add_etags=False,
+        last_modified=snapshot.updated_at,
+        conditional=False,
+    )
+    response.set_etag(snapshot_etag(catalog, collection, snapshot, format_))
+    response.headers.update(snapshot_headers(snapshot, version))
+    # Revalidated like the WSGI app, without the max age of static files
+    response.cache_control.public = None
+    response.cache_control.max_age = None
+    response.cache_control.no_cache = True
+    response.headers.pop("Expires", None)
+    size = response.content_length
+    await response.make_conditional(request, accept_ranges=True, complete_length=size)
+    if response.status_code == 304:
+        return not_modified(response)
+    if response.status_code == 206:
+        # Quart 0.18 renders the last byte of the range one byte short
+        body = response.response
+        response.content_range = ContentRange("bytes", body.begin, body.end, size)
+    return response
+
+
+def make_routes(app, schema_url):
+
+    catalog_context = services.AsyncCatalogContext(schema_url, lambda: app.pool)
+    catalog_service = services.CatalogService(catalog_context)
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/<document_id>",
+        "get_document",
+        functools.partial(
+            handler,
+            catalog_service.get_document,
+            False,
+            catalog_service.table_version,
+        ),
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_batch",
+        "get_documents",
+        functools.partial(
+            handler,
+            catalog_service.get_documents,
+            True,
+            catalog_service.table_version,
+            body_params=batch_body_params,
+        ),
+        methods=["GET", "POST"],
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_zoek",
+        "search_collection",
+        functools.partial(
+            handler,
+            catalog_service.list_resources,
+            True,
+            catalog_service.table_version,
+        ),
+        methods=["POST"],
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>",
+        "get_collection",
+        functools.partial(
+            handler,
+            catalog_service.list_resources,
+            True,
+            catalog_service.table_version,
+        ),
+    )
+
+    api.add_url_rule(
+        f"/<catalog>/<collection>/_download.<format_>",
+        "download_collection",
+        functools.partial(download_handler, catalog_service),
+    )
+
+    oa_context = services.OpenAPIContext(const.URI_PATH_PREFIX, schema_url)
+    oa_service = services.OpenAPIService(oa_context)
+
+    async def openapi_spec():
+        # Built from all schemas of the registry, which can fetch them over HTTP
+        spec = await asyncio.get_running_loop().run_in_executor(
+            None, oa_service.encoded_openapi_spec
+        )
+        response = Response(spec.body, mimetype="application/json")
+        response.set_etag(spec.etag)
+        if request.if_none_match.contains(spec.etag):
+            return not_modified(response)
+        return response
+
+    api.add_url_rule("/spec", "openapi-spec", openapi_spec)
+
+
+@api.route("/")
+async def index():
+    return await render_template("index.html", openapi_spec_path="./spec")
+
+
+@status.route("/health")
+async def health():
+    return {"status": "OK"}
+
+
+@status.route("/statements")
+async def statements():
+    """ Execution times per statement, asyncpg prepares every statement """
+    return statement_timings.stats()
+
+
+def create_app():
+    app = Quart(__name__)
+    app.pool = None
+
+    @app.before_serving
+    async def create_pool():
+        app.pool = await asyncpg.create_pool(
+            dsn,
+            min_size=const.ASYNC_POOL_MIN_SIZE,
+            max_size=const.ASYNC_POOL_MAX_SIZE,
+            statement_cache_size=const.STATEMENT_CACHE_SIZE,
+            init=init_connection,
+        )
+
+    @app.after_serving
+    async def close_pool():
+        await app.pool.close()
+
+    @app.after_request
+    async def allow_origin(response):
+        # Like Flask-Cors with its defaults in the WSGI app
+        if "Origin" in request.headers:
+            response.headers.setdefault("Access-Control-Allow-Origin", "*")
+        return response
+
+    make_routes(app, SCHEMA_URL)
+    app.register_blueprint(api, url_prefix="/api")
+    app.register_blueprint(status, url_prefix="/status")
+    return app
+
+
+app = create_app()
@@ -0,0 +1,157 @@
+"""
+Columnar bulk formats: Apache Arrow IPC streams and GeoParquet
+
+The rows are turned into Arrow record batches as they are fetched, a column
+at a time, without a dict or a resource per row. Geometries are WKB, as
+selected by Postgres. The Arrow schema follows the JSON schema of the
+collection, so every batch has the same schema, also a batch with only nulls
+in a column. Needs pyarrow, `pip install dynapi[columnar]`.
+"""
+import io
+import json
+
+from . import const
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+GEOMETRY_TYPES = {
+    "Point",
+    "LineString",
+    "Polygon",
+    "MultiPoint",
+    "MultiLineString",
+    "MultiPolygon",
+    "GeometryCollection",
+}
+
+
+def available():
+    return pa is not None
+
+
+def arrow_type(spec):
+    """ Arrow type of a property, objects and arrays become JSON text """
+    if spec.get("format") == "date":
+        return pa.date32()
+    if spec.get("format") == "date-time":
+        return pa.timestamp("us")
+    return {
+        "integer": pa.int64(),
+        "number": pa.float64(),
+        "boolean": pa.bool_(),
+    }.get(spec.get("type"), pa.string())
+
+
+def arrow_schema(collection, metadata=None):
+    fields = []
+    for name in collection.properties:
+        if name == collection.geometry_name:
+            fields.append(pa.field(name, pa.binary()))
+        else:
+            fields.append(pa.field(name, arrow_type(collection.specs.get(name, {}))))
+    return pa.schema(fields, metadata=metadata)
+
+
+def _converted(value, type_):
+    if type_ == pa.string():
+        return value if isinstance(value, str) else json.dumps(value, default=str)
+    if type_ == pa.float64():
+        return float(value)
+    return value
+
+
+def arrow_array(values, type_):
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. the Decimals of a numeric column, or the values of a JSON column
+        return pa.array(
+            [None if value is None else _converted(value, type_) for value in values],
+            type=type_,
+        )
+
+
+def record_batch(schema, rows):
+    """ Record batch of rows as fetched, their values in the order of `schema` """
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = [
+        arrow_array(list(values), field.type) for values, field in zip(columns, schema)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def geo_metadata(collection, srid):
+    """ GeoParquet metadata of the geometry column, WKB in the given SRID """
+    name = collection.geometry_name
+    ref = collection.specs.get(name, {}).get("$ref", "")
+    geometry_type = ref.rsplit("/", 1)[-1].split(".")[0]
+    column = {
+        "encoding": "WKB",
+        "geometry_types": [geometry_type] if geometry_type in GEOMETRY_TYPES else [],
+        # The identifier of the CRS, a PROJJSON object without its definition
+        "crs": {"id": {"authority": "EPSG", "code": srid}},
+    }
+    return {
+        "version": "1.0.0",
+        "primary_column": name,
+        "columns": {name: column},
+    }
+
+
+class _Sink(io.RawIOBase):
+    """ Output stream of a writer, drained after every record batch """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_arrow_stream(collection, batches):
+    """ Arrow IPC stream of the batches of rows, uncompressed so a client can
+    map the buffers as they are
+    """
+    schema = arrow_schema(collection)
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_geoparquet(collection, batches, srid):
+    """ GeoParquet file of the batches of rows, a row group per batch. The
+    footer of the file comes last, a client reads it once the file is complete.
+    """
+    metadata = None
+    if collection.geometry_name:
+        metadata = {"geo": json.dumps(geo_metadata(collection, srid))}
+    schema = arrow_schema(collection, metadata)
+    sink = _Sink()
+    with pq.ParquetWriter(
+        sink, schema, compression=const.PARQUET_COMPRESSION
+    ) as writer:
+        for rows in batches:
+            writer.write_batch(record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,139 @@
+"""
+Content encoding of responses, shared by the WSGI and the ASGI app
+
+The encoding is negotiated with Accept-Encoding among COMPRESSION_ENCODINGS,
+in their order of preference when a client accepts several equally. Brotli
+and Zstandard need their packages, `pip install dynapi[compression]`.
+
+A body is compressed chunk by chunk while it streams. Every chunk is flushed,
+so a client can decode the rows that have been sent so far. The first chunks
+are read before the response starts: a body that ends before
+COMPRESSION_MIN_SIZE bytes is sent as it is. The minimum size and the levels
+can be set per content type, with COMPRESSION_MIN_SIZES and COMPRESSION_LEVELS.
+"""
+import itertools
+import zlib
+
+from . import const
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        compressor = zstandard.ZstdCompressor(level=level)
+        self._compressor = compressor.compressobj()
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+ENCODERS = {
+    "gzip": GzipEncoder,
+    "br": BrotliEncoder if brotli is not None else None,
+    "zstd": ZstdEncoder if zstandard is not None else None,
+}
+
+# Setting of the default level of each encoding
+LEVEL_SETTINGS = {"gzip": "GZIP_LEVEL", "br": "BROTLI_QUALITY", "zstd": "ZSTD_LEVEL"}
+
+# The configured encodings that are installed, by preference
+OFFERED = [
+    encoding
+    for encoding in const.COMPRESSION_ENCODINGS
+    if ENCODERS.get(encoding) is not None
+]
+
+
+# The column chunks of GeoParquet are compressed already
+PRECOMPRESSED_MIMETYPES = {"application/vnd.apache.parquet"}
+
+
+def compression_min_size(mimetype):
+    """ Size in bytes below which a body of the content type is not compressed """
+    return const.COMPRESSION_MIN_SIZES.get(mimetype, const.COMPRESSION_MIN_SIZE)
+
+
+def compression_level(encoding, mimetype=None):
+    """ Compression level of the encoding for a body of the content type """
+    default = getattr(const, LEVEL_SETTINGS[encoding])
+    return const.COMPRESSION_LEVELS.get(f"{mimetype}:{encoding}", default)
+
+
+def compressible(mimetype):
+    if mimetype in PRECOMPRESSED_MIMETYPES:
+        return False
+    return compression_min_size(mimetype) >= 0
+
+
+def negotiate_encoding(accept_encodings):
+    """ The encoding for the Accept-Encoding of a request, None for identity """
+    return accept_encodings.best_match(OFFERED)
+
+
+def split_head(chunks, min_size):
+    """ The first chunks, up to `min_size` bytes, and the iterator with the
+    rest of them, None when the body ends before
+    """
+    chunks = iter(chunks)
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            return head, chunks
+    return head, None
+
+
+def encoded(chunks, encoding, level):
+    encoder = ENCODERS[encoding](level)
+    for chunk in chunks:
+        if chunk:
+            yield encoder.compress(chunk)
+    yield encoder.finish()
+
+
+def compressed(chunks, encoding, mimetype=None):
+    """ The chunks of the body in bytes, and the encoding they are in """
+    head, rest = split_head(chunks, compression_min_size(mimetype))
+    if rest is None:
+        return head, None
+    level = compression_level(encoding, mimetype)
+    return encoded(itertools.chain(head, rest), encoding, level), encoding
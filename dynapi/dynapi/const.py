@@ -1,3 +1,103 @@
+import os
+
+
+def _int_overrides(name):
+    """ The "key=value,..." pairs of an environment variable, values as int """
+    items = filter(None, os.getenv(name, "").split(","))
+    return {
+        key.strip(): int(value)
+        for key, _, value in (item.rpartition("=") for item in items)
+    }
+
+
 LAT_LON_SRID = 4326
 DB_SRID = 28992
 ID_REF = "https://ams-schema.glitch.me/schema@v0.1#/definitions/id"
+
+URI_PATH_PREFIX = os.getenv("URI_PATH_PREFIX")
+
+# Seconds before a cached dataset schema is revalidated, and the maximum
+# staleness before revalidation blocks the request
+SCHEMA_TTL = float(os.getenv("SCHEMA_TTL", 60))
+SCHEMA_MAX_STALE = float(os.getenv("SCHEMA_MAX_STALE", 3600))
+
+# Rows fetched per round trip from a server-side cursor, and the approximate
+# size in characters of the chunks written to streaming responses
+FETCH_SIZE = int(os.getenv("FETCH_SIZE", 1000))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 64 * 1024))
+
+# Default and maximum number of resources per page of a collection
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 10000))
+
+# Maximum number of ids in a batch lookup
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 1000))
+
+# Matches counted at most for `count` on a filtered collection
+COUNT_MAX = int(os.getenv("COUNT_MAX", 10000))
+
+# Relations embedded with `expand`: the number of relations and their depth.
+# Every relation is a batch lookup per BATCH_MAX_IDS keys.
+EXPAND_MAX_RELATIONS = int(os.getenv("EXPAND_MAX_RELATIONS", 5))
+EXPAND_MAX_DEPTH = int(os.getenv("EXPAND_MAX_DEPTH", 2))
+
+# CRSs a response can be rendered in (NL-API API-40), as EPSG codes
+SUPPORTED_SRIDS = [
+    int(srid)
+    for srid in os.getenv("SUPPORTED_SRIDS", "28992,4258,4326,3857").split(",")
+]
+
+# Let Postgres render JSON, NDJSON and GeoJSON bodies, see SQLStrategy
+DB_RENDERING = os.getenv("DB_RENDERING", "0") == "1"
+
+# Response cache shared by the workers on a host, disabled without a path.
+# Bodies larger than the item size are not cached.
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 256 * 2 ** 20))
+RESPONSE_CACHE_MAX_ITEM_BYTES = int(
+    os.getenv("RESPONSE_CACHE_MAX_ITEM_BYTES", 8 * 2 ** 20)
+)
+# Seconds a worker keeps the access times and counters of cache hits in memory,
+# so a hit only reads. They are written together afterwards.
+RESPONSE_CACHE_FLUSH_INTERVAL = float(os.getenv("RESPONSE_CACHE_FLUSH_INTERVAL", 5))
+
+# Content encodings offered, by preference, and the compression level of each.
+# Bodies smaller than the minimum size in bytes are not compressed.
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+# Overrides per content type: the minimum size, e.g. "application/json=256", -1
+# to not compress it, and the level of an encoding, e.g. "text/csv:zstd=9"
+COMPRESSION_MIN_SIZES = _int_overrides("COMPRESSION_MIN_SIZES")
+COMPRESSION_LEVELS = _int_overrides("COMPRESSION_LEVELS")
+
+# Compression of the column chunks in GeoParquet responses
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+# Cache of rendered vector tiles, disabled without a path
+TILE_CACHE_PATH = os.getenv("TILE_CACHE_PATH")
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", 2 ** 30))
+
+# Directory of the download snapshots written by schema ingest, the downloads
+# are not served without it
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+
+# Global search: connections used at the same time, the time budget in
+# seconds and the default and maximum number of results per collection
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", 8))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", 2))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 10))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 100))
+
+# asyncpg pool of the ASGI app: connections kept open, connections at most and
+# the prepared statements kept per connection
+ASYNC_POOL_MIN_SIZE = int(os.getenv("ASYNC_POOL_MIN_SIZE", 5))
+ASYNC_POOL_MAX_SIZE = int(os.getenv("ASYNC_POOL_MAX_SIZE", 40))
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", 1024))
+
+# Run the statements of a request as server-side prepared statements, kept per
+# database connection up to the maximum. Disable behind a transaction pooler.
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "1") == "1"
+PREPARED_STATEMENTS_MAX = int(os.getenv("PREPARED_STATEMENTS_MAX", 256))
@@ -1,21 +1,31 @@
-import os
 from dataservices import amsterdam_schema as aschema
+from dataservices.amsterdam_schema.registry import get_registry
 from dataclasses import dataclass
 from dataclasses import field
-from dataclasses import make_dataclass
+from dataclasses import replace
 from dataclasses import InitVar
+from datetime import datetime
+import re
 
-from typing import List, Any
+from typing import List, Any, Dict, Optional
 
-SCHEMA_URL = os.getenv("SCHEMA_URL")
+from .. import const
+from ..exceptions import InvalidInputException, NotFoundException
 
 
 class Type(aschema.DatasetSchema):
     ID_REF = "https://schemas.data.amsterdam.nl/schema@v1.0#/definitions/id"
+    GEOMETRY_REF_PREFIX = "https://geojson.org/schema/"
+    # e.g. https://ams-schema.glitch.me/dataset/example/provincies.objects@v0.1
+    CLASS_REF_RE = re.compile(r"/(?P<catalog>[^/]+)/(?P<collection>[^/.@]+)\.objects")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.primary_names = {table["id"]: self.primary_name(table) for table in self.tables}
+        self.row_types = {
+            table["id"]: RowType(table["schema"]["properties"].keys())
+            for table in self.tables
+        }
 
     def primary_name(self, table):
         id_fields = [
@@ -25,13 +35,122 @@ class Type(aschema.DatasetSchema):
         ]
         return id_fields and id_fields[0] or None
 
+    def geometry_name(self, table):
+        geometry_fields = [
+            k
+            for k, v in table["schema"]["properties"].items()
+            if v.get("$ref", "").startswith(self.GEOMETRY_REF_PREFIX)
+        ]
+        return geometry_fields and geometry_fields[0] or None
+
+    def relations(self, table) -> Dict[str, "Relation"]:
+        """ Related collection of every relation field, keyed on field name
+
+        A relation is given as `"relation": "<dataset>:<table>"` or as an
+        `ams.$ref.class` URL, on the field or on the items of an array field.
+        """
+        relations = {}
+        for name, spec in table["schema"]["properties"].items():
+            many = spec.get("type") == "array"
+            target = self._relation_target(spec.get("items", {}) if many else spec)
+            if target is not None:
+                relations[name] = Relation(target, many)
+        return relations
+
+    def _relation_target(self, spec) -> Optional["CollectionRef"]:
+        if "relation" in spec:
+            catalog, _, collection = spec["relation"].rpartition(":")
+            return CollectionRef(catalog or self.id, collection)
+        match = self.CLASS_REF_RE.search(spec.get("ams.$ref.class", ""))
+        if match is None:
+            return None
+        return CollectionRef(match.group("catalog"), match.group("collection"))
+
+    @classmethod
+    def from_registry(cls, schema_url: str, catalog: str) -> "Type":
+        """ Returns the type for a catalog, rebuilt only when its schema changed """
+        registry = get_registry(schema_url, const.SCHEMA_TTL, const.SCHEMA_MAX_STALE)
+        try:
+            schema = registry.get(catalog)
+        except KeyError:
+            raise NotFoundException()
+        cached = _types.get(catalog)
+        if cached is None or cached[0] is not schema:
+            cached = _types[catalog] = (schema, cls(schema.data))
+        return cached[1]
+
     @classmethod
     def fetch_class_info(cls, schema_url: str, catalog: str, collection: str):
-        schema = aschema.schema_def_from_url(SCHEMA_URL, catalog)
-        type_ = cls(schema)
+        type_ = cls.from_registry(schema_url, catalog)
+        if collection not in type_.primary_names:
+            raise NotFoundException()
         primary_name = type_.primary_names[collection]
-        properties = [k for k in type_.get_table_by_id(collection)["schema"]["properties"].keys()]
-        return primary_name, properties
+        row_type = type_.row_types[collection]
+        table = type_.get_table_by_id(collection)
+        return (
+            primary_name,
+            list(row_type.names),
+            row_type,
+            type_.geometry_name(table),
+            table["schema"]["properties"],
+            type_.relations(table),
+        )
+
+
+class RowType:
+    """ Field layout shared by all rows of a collection
+
+    Built once per collection schema, calling it turns a database row
+    into a compact tuple-backed `Row`.
+    """
+
+    __slots__ = ("names", "index")
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def __call__(self, row) -> "Row":
+        return Row(self, tuple(map(row.get, self.names)))
+
+
+class Row:
+    """ The values of one row, in the order of its `RowType` """
+
+    __slots__ = ("row_type", "values")
+
+    def __init__(self, row_type: RowType, values: tuple):
+        self.row_type = row_type
+        self.values = values
+
+    def __getattr__(self, name):
+        try:
+            return self.values[self.row_type.index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self.values[self.row_type.index[name]]
+
+    def keys(self):
+        return self.row_type.names
+
+    def items(self):
+        return zip(self.row_type.names, self.values)
+
+    def as_dict(self) -> dict:
+        """ Shallow dict of the row, values are not copied """
+        return dict(zip(self.row_type.names, self.values))
+
+
+# Parsed types per catalog, together with the registry schema they stem from
+_types = {}
+
+
+def schema_version(schema_url: str, catalog: str) -> Optional[str]:
+    """ Version marker of the schema of a catalog, see `SchemaRegistry.versions` """
+    registry = get_registry(schema_url, const.SCHEMA_TTL, const.SCHEMA_MAX_STALE)
+    return registry.versions().get(catalog)
 
 
 @dataclass
@@ -40,18 +159,82 @@ class CollectionRef:
     collection: str
 
 
+@dataclass
+class Relation:
+    """ Collection a relation field refers to, `many` for an array of keys """
+
+    target: CollectionRef
+    many: bool = False
+
+
 @dataclass
 class Collection:
     coll_ref: CollectionRef
     schema_url: str
     primary_name: str = None
     properties: List[Any] = field(default_factory=list)
+    row_type: RowType = None
+    geometry_name: Optional[str] = "geometry"
+    # JSON schema of every property, keyed on property name
+    specs: Dict[str, dict] = field(default_factory=dict)
+    relations: Dict[str, Relation] = field(default_factory=dict)
 
     def __post_init__(self):
-        self.primary_name, self.properties = Type.fetch_class_info(
+        if self.row_type is not None:
+            # Collection info was given, no need to look at the schema
+            return
+        (
+            self.primary_name,
+            self.properties,
+            self.row_type,
+            self.geometry_name,
+            self.specs,
+            self.relations,
+        ) = Type.fetch_class_info(
             self.schema_url, self.coll_ref.catalog, self.coll_ref.collection
         )
 
+    def project(self, fields: Optional[str], required=()) -> "Collection":
+        """ Collection limited to the comma separated `fields`
+
+        The primary name and the `required` fields are always included,
+        they are needed for links and pagination. Unknown fields are
+        invalid input.
+        """
+        if not fields:
+            return self
+        names = list(dict.fromkeys(name.strip() for name in fields.split(",")))
+        if not set(names) <= set(self.properties):
+            raise InvalidInputException()
+        for name in reversed([self.primary_name, *required]):
+            if name not in names:
+                names.insert(0, name)
+        return replace(self, properties=names, row_type=RowType(names))
+
+
+@dataclass
+class TableVersion:
+    """ Version marker of a table, bumped by schema ingest on every import """
+
+    version: int
+    updated_at: datetime
+    # Rows in the table, counted by schema ingest, None when not known
+    row_count: Optional[int] = None
+    # Version of the dataset schema in the registry, the representation of the
+    # rows changes with it too
+    schema_version: Optional[str] = None
+
+
+@dataclass
+class Count:
+    """ Number of resources of a collection, or of the matches of a query """
+
+    value: int
+    # False for an estimate of the planner, and for a capped count
+    exact: bool = True
+    # More resources match than are counted, see COUNT_MAX
+    capped: bool = False
+
 
 @dataclass
 class Resource:
@@ -59,8 +242,8 @@ class Resource:
     row: InitVar[Any] = None
 
     def __post_init__(self, row):
-        properties = self.collection.properties
-        fields_class = make_dataclass('Fields', properties)
-        self.fields = fields_class(
-            **{k: v for k, v in row.items() if k in set(properties)}
-        )
+        self.fields = self.collection.row_type(row)
+        # JSON text of the row when it was rendered by the database
+        self.raw = row.get("_json")
+        # Related resources per relation name, see infra.expand
+        self.embedded = row.get("_embedded")
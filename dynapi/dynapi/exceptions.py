@@ -8,3 +8,7 @@ class InvalidInputException(Exception):
 
 class NotFoundException(Exception):
     pass
+
+
+class NotAcceptableException(Exception):
+    pass
@@ -0,0 +1,80 @@
+"""
+Data strategy on an asyncpg connection pool, used by the ASGI app
+
+The statements are built by `SQLStrategy`, only their placeholders are
+numbered for asyncpg. asyncpg prepares every statement it runs and keeps the
+prepared statements per pooled connection, so a repeated query is parsed
+and analyzed once per connection instead of once per request.
+"""
+from dataclasses import dataclass
+
+from dynapi.domain.types import Count, TableVersion
+from ..exceptions import NotFoundException
+from .. import const
+from . import sql
+from .prepared import numbered_placeholders, statement_timings
+from .sql import GEOMETRY_COLUMNS_SQL, SQLStrategy, VERSION_SQL, VERSIONS_TABLE
+
+
+@dataclass
+class AsyncSQLStrategy(SQLStrategy):
+    """ `db_con_factory` returns the asyncpg pool """
+
+    async def _fetch(self, sql_text, args):
+        async with self.db_con_factory().acquire() as con:
+            return await con.fetch(numbered_placeholders(sql_text), *args)
+
+    async def _run(self, statement):
+        with statement_timings.timed(self.statement_label(statement), "prepared"):
+            rows = await self._fetch(statement.sql, statement.args)
+        return list(statement.convert(rows))
+
+    async def version(self):
+        if not sql._versions_table_exists:
+            rows = await self._fetch(
+                f"SELECT to_regclass('{VERSIONS_TABLE}') IS NOT NULL AS found", []
+            )
+            if not rows[0]["found"]:
+                return None
+            sql._versions_table_exists = True
+        rows = await self._fetch(
+            VERSION_SQL, [self.coll_ref.catalog, self.coll_ref.collection]
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return TableVersion(row["version"], row["updated_at"], row["row_count"])
+
+    async def load_geometry_columns(self, srid):
+        if self.needs_geometry_columns(srid):
+            rows = await self._fetch(
+                GEOMETRY_COLUMNS_SQL, [self.coll_ref.catalog, self.coll_ref.collection]
+            )
+            self.set_geometry_columns(rows)
+
+    async def count(self, **filter_params):
+        query = self.count_query(**filter_params)
+        if not query.where:
+            version = self.table_version or await self.version()
+            if version is not None and version.row_count is not None:
+                return Count(version.row_count)
+            rows = await self._run(self.estimate_statement())
+            if rows and rows[0]["count"] >= 0:
+                return Count(rows[0]["count"], exact=False)
+        rows = await self._run(self.count_statement(query))
+        return self.counted(rows[0]["count"])
+
+    async def list(self, **kwargs):
+        await self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        return await self._run(self.list_statement(**kwargs))
+
+    async def get(self, *args, **kwargs):
+        await self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        rows = await self._run(self.get_statement(*args, **kwargs))
+        if not rows:
+            raise NotFoundException()
+        return rows[0]
+
+    async def get_many(self, *args, **kwargs):
+        await self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        return await self._run(self.get_many_statement(*args, **kwargs))
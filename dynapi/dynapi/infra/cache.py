@@ -0,0 +1,263 @@
+"""
+Response cache, shared by all worker processes on a host
+
+The rendered responses are stored in a SQLite database on local disk. An
+entry is keyed on the ETag of the response, which covers the catalog,
+collection, normalized query args, content type, SRID and the version of
+the table. An import bumps the version, so outdated entries are never hit
+again; they are removed on the next store for that table, or evicted.
+Entries are evicted least recently used first, when the total size of the
+bodies exceeds the byte budget.
+
+A hit only reads, so hits of many workers do not wait for the write lock of
+SQLite. Every worker keeps the access times and the counters in memory, and
+writes them in one transaction at most once per flush interval, or with the
+next store. The order of eviction and the stats lag by that interval.
+"""
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .. import const
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("hits", "misses", "stores", "evictions")
+
+
+@dataclass
+class CachedResponse:
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path,
+        max_bytes,
+        max_item_bytes,
+        flush_interval=const.RESPONSE_CACHE_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._reset_pending()
+        self._execute_script(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                catalog TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed_idx
+                ON responses (accessed);
+            CREATE INDEX IF NOT EXISTS responses_table_idx
+                ON responses (catalog, collection, version);
+            CREATE TABLE IF NOT EXISTS metrics (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+
+    def _connection(self):
+        """ One connection per thread, a forked worker opens its own """
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            local.pid = os.getpid()
+        return local.connection
+
+    def _execute_script(self, script):
+        self._connection().executescript(script)
+
+    def _count(self, connection, name, n=1):
+        self._count_many(connection, [(name, n)])
+
+    def _count_many(self, connection, counts):
+        connection.executemany(
+            "INSERT INTO metrics (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            counts,
+        )
+
+    def _reset_pending(self):
+        self._pending_pid = os.getpid()
+        self._pending_accessed = {}
+        self._pending_counts = Counter()
+        self._flushed_at = time.monotonic()
+
+    def _record(self, name, key=None):
+        """ Kept in memory until the next flush """
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                # Forked, the parent writes what it recorded itself
+                self._reset_pending()
+            self._pending_counts[name] += 1
+            if key is not None:
+                self._pending_accessed[key] = time.time()
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _take_pending(self):
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                self._reset_pending()
+            accessed, counts = self._pending_accessed, self._pending_counts
+            self._pending_accessed, self._pending_counts = {}, Counter()
+            self._flushed_at = time.monotonic()
+        return accessed, counts
+
+    def _write_pending(self, connection, accessed, counts):
+        connection.executemany(
+            "UPDATE responses SET accessed = MAX(accessed, ?) WHERE key = ?",
+            [(at, key) for key, at in accessed.items()],
+        )
+        self._count_many(connection, counts.items())
+
+    def flush(self):
+        """ Writes the access times and counters recorded by this worker """
+        accessed, counts = self._take_pending()
+        if not accessed and not counts:
+            return
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_pending(connection, accessed, counts)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.exception("Response cache flush failed")
+
+    def get(self, key) -> Optional[CachedResponse]:
+        try:
+            row = (
+                self._connection()
+                .execute("SELECT headers, body FROM responses WHERE key = ?", (key,))
+                .fetchone()
+            )
+        except sqlite3.Error:
+            logger.exception("Response cache lookup failed")
+            return None
+        if row is None:
+            self._record("misses")
+            return None
+        self._record("hits", key)
+        headers, body = row
+        return CachedResponse([tuple(header) for header in json.loads(headers)], body)
+
+    def put(self, key, catalog, collection, version, headers, body):
+        if len(body) > self.max_item_bytes:
+            return
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # The write lock is held anyway, the recorded hits go along
+                self._write_pending(connection, *self._take_pending())
+                # Responses for older versions of the table are never hit again
+                connection.execute(
+                    "DELETE FROM responses "
+                    "WHERE catalog = ? AND collection = ? AND version < ?",
+                    (catalog, collection, version),
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, catalog, collection, "
+                    "version, headers, body, size, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        catalog,
+                        collection,
+                        version,
+                        json.dumps(headers),
+                        body,
+                        len(body),
+                        time.time(),
+                    ),
+                )
+                self._count(connection, "stores")
+                self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.exception("Response cache store failed")
+
+    def _evict(self, connection):
+        """ Removes the least recently used entries that exceed the budget """
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            evicted += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._count(connection, "evictions", evicted)
+
+    def stats(self):
+        self.flush()
+        connection = self._connection()
+        stats = dict.fromkeys(METRICS, 0)
+        stats.update(connection.execute("SELECT name, value FROM metrics").fetchall())
+        stats["entries"], stats["bytes"] = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+@functools.lru_cache()
+def get_response_cache() -> Optional[ResponseCache]:
+    """ The configured response cache, None when caching is disabled """
+    if not const.RESPONSE_CACHE_PATH:
+        return None
+    return ResponseCache(
+        const.RESPONSE_CACHE_PATH,
+        const.RESPONSE_CACHE_MAX_BYTES,
+        const.RESPONSE_CACHE_MAX_ITEM_BYTES,
+    )
+
+
+@functools.lru_cache()
+def get_tile_cache() -> Optional[ResponseCache]:
+    """ The configured vector tile cache, None when caching is disabled """
+    if not const.TILE_CACHE_PATH:
+        return None
+    return ResponseCache(
+        const.TILE_CACHE_PATH,
+        const.TILE_CACHE_MAX_BYTES,
+        const.RESPONSE_CACHE_MAX_ITEM_BYTES,
+    )
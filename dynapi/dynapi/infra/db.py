@@ -1,28 +1,496 @@
-from dataclasses import dataclass
-from typing import Any
+import base64
+import binascii
+import itertools
+import json
+from collections import Counter
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Tuple
 
 # abort: more specific Exception, handled in api.py
 # db connection: pass in through the context
 
-from dynapi.domain.types import Resource, Collection
+from dataservices.amsterdam_schema.sorting import (
+    format_sort,
+    parse_sort,
+    with_tiebreaker,
+)
+from dataservices.tiles import tile_envelope
+from dynapi.domain.types import Resource, Collection, schema_version
+from .expand import embed, key_chunks, parse_expand, relation_keys
+from .filters import field_cast
+from ..exceptions import InvalidInputException
 from .. import const
 
 
+# Sort specifications requested per collection, input for the index tooling
+observed_sorts = Counter()
+
+
+def encode_cursor(direction, key):
+    """ Opaque cursor pointing just past (`next`) or before (`prev`) a key """
+    raw = json.dumps([direction, key], separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, key = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidInputException()
+    if direction not in ("next", "prev") or not isinstance(key, list):
+        raise InvalidInputException()
+    return direction, key
+
+
+# Dates in a cursor are strings, see `encode_cursor`
+KEY_PARSERS = {"date": date.fromisoformat, "date-time": datetime.fromisoformat}
+
+
+def parse_key(collection, sort_keys, key):
+    """ Values of the sort keys in a cursor, typed like their columns """
+    if len(key) != len(sort_keys):
+        raise InvalidInputException()
+    values = []
+    for sort_key, value in zip(sort_keys, key):
+        spec = collection.specs.get(sort_key.name, {})
+        parser = KEY_PARSERS.get(spec.get("format"))
+        try:
+            values.append(parser(value) if parser and value is not None else value)
+        except (TypeError, ValueError):
+            raise InvalidInputException()
+    return values
+
+
+def parse_ids(ids, cast):
+    """ Ids of a batch lookup, from a comma separated string or a list
+
+    The ids are cast to the type of the primary key, duplicates are dropped.
+    """
+    if isinstance(ids, str):
+        ids = ids.split(",")
+    if not isinstance(ids, list) or not 0 < len(ids) <= const.BATCH_MAX_IDS:
+        raise InvalidInputException()
+    parsed = []
+    for id_ in ids:
+        if isinstance(id_, bool) or not isinstance(id_, (str, int)):
+            raise InvalidInputException()
+        try:
+            parsed.append(cast(str(id_)))
+        except ValueError:
+            raise InvalidInputException()
+    return list(dict.fromkeys(parsed))
+
+
+def parse_page_size(page_size):
+    if page_size is None:
+        return const.PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise InvalidInputException()
+    if not 0 < page_size <= const.MAX_PAGE_SIZE:
+        raise InvalidInputException()
+    return page_size
+
+
+def parse_count(count):
+    """ Whether the matches are to be counted, `?count=true` """
+    try:
+        return {None: False, "true": True, "false": False}[count and count.lower()]
+    except KeyError:
+        raise InvalidInputException()
+
+
+class Page:
+    """ One page of resources
+
+    The rows are fetched while the page is iterated. The cursors of the
+    next and previous pages are known once iteration has finished, or
+    before it with `resolve_cursors`.
+    Without a page size, all rows of the query are in the page. Without
+    `keyset` there are no cursors either, the rows are ordered on something
+    else than the sort keys, e.g. the distance of a near search.
+    """
+
+    def __init__(
+        self,
+        collection,
+        rows,
+        page_size,
+        direction=None,
+        cursor=None,
+        key_names=None,
+        keyset=True,
+    ):
+        self.collection = collection
+        self.rows = rows
+        self.page_size = page_size
+        self.direction = direction
+        self.cursor = cursor
+        self.key_names = key_names or [collection.primary_name]
+        self.keyset = keyset
+        self.next_cursor = None
+        self.prev_cursor = None
+        # Number of matches when asked for, see `SQLStrategy.count`
+        self.count = None
+        # Sort keys of the last row of the page and of the row after it,
+        # see `SQLStrategy.next_keys`
+        self.next_keys = None
+
+    def _key(self, row):
+        return [row[name] for name in self.key_names]
+
+    def __iter__(self):
+        return (Resource(self.collection, row) for row in self.iter_rows())
+
+    def resolve_cursors(self):
+        """ Sets the cursors before the rows are iterated, for the formats
+        that send the links in a header
+
+        Streamed rows are not buffered: the first row is read ahead and the
+        key of the last row comes from `next_keys`, a query on the sort keys
+        only. A previous page is fetched in reverse order and buffered anyway.
+        """
+        if self.page_size is None or not self.keyset:
+            return
+        if self.direction == "prev" or self.next_keys is None:
+            # At most one page, bounded by MAX_PAGE_SIZE
+            self.rows = list(self.rows)
+        if isinstance(self.rows, list):
+            for _ in self.iter_rows():
+                pass
+            return
+        rows = iter(self.rows)
+        first = next(rows, None)
+        if first is None:
+            self.rows = []
+            return
+        self.rows = itertools.chain([first], rows)
+        if self.direction == "next":
+            self.prev_cursor = encode_cursor("prev", self._key(first))
+        next_keys = self.next_keys()
+        if len(next_keys) > 1:
+            self.next_cursor = encode_cursor("next", self._key(next_keys[0]))
+
+    def batches(self, size):
+        """ The rows in lists of at most `size`, for the columnar renderers """
+        rows = self.iter_rows()
+        return iter(lambda: list(itertools.islice(rows, size)), [])
+
+    def iter_rows(self):
+        rows = self.rows
+        if self.direction == "prev":
+            # Fetched in reverse order, at most one page is buffered
+            rows = list(rows)
+            has_more = len(rows) > self.page_size
+            rows = rows[: self.page_size][::-1]
+            if rows:
+                self.next_cursor = encode_cursor("next", self._key(rows[-1]))
+                if has_more:
+                    self.prev_cursor = encode_cursor("prev", self._key(rows[0]))
+            yield from rows
+            return
+
+        first = last = None
+        for i, row in enumerate(rows):
+            if i == self.page_size:
+                if self.keyset:
+                    self.next_cursor = encode_cursor("next", self._key(last))
+                break
+            if first is None:
+                first = row
+            last = row
+            yield row
+        if self.direction == "next" and first is not None:
+            self.prev_cursor = encode_cursor("prev", self._key(first))
+
+
+class Batch:
+    """ Resources of a batch lookup, in the order of the requested ids
+
+    The ids that were not found are listed in `missing`.
+    """
+
+    def __init__(self, collection, ids, rows):
+        self.collection = collection
+        by_id = {row[collection.primary_name]: row for row in rows}
+        self.rows = [by_id[id_] for id_ in ids if id_ in by_id]
+        self.missing = [id_ for id_ in ids if id_ not in by_id]
+
+    def __iter__(self):
+        return (Resource(self.collection, row) for row in self.rows)
+
+
 @dataclass
 class EntityRepository:
     collection: Collection
     data_strategy: Any
+    # Repository of another collection by catalog and collection, for `expand`
+    repo_factory: Callable[[str, str], "EntityRepository"] = None
 
-    def list(self, srid=const.DB_SRID, geo_format="geojson", **filter_params):
-        return [
-            Resource(self.collection, row)
-            for row in self.data_strategy.list(srid, geo_format, **filter_params)
-        ]
+    def _prepare_list(
+        self,
+        srid=const.DB_SRID,
+        geo_format="geojson",
+        page_size=None,
+        cursor=None,
+        fields=None,
+        sorteer=None,
+        json_format=None,
+        columnar=False,
+        relations=(),
+        **filter_params,
+    ):
+        """ The page without its rows, the arguments of the strategy and the
+        filter parameters among them
+
+        `columnar` rows are passed on as fetched, for the columnar renderers.
+        Without a page size they get all rows, streamed from the database.
+        """
+        if columnar and relations:
+            # Embedded resources do not fit in the columns
+            raise InvalidInputException()
+        sort_keys = self.sort_keys(sorteer)
+        key_names = [sort_key.name for sort_key in sort_keys]
+        collection = self.collection.project(
+            fields, required=[*key_names, *relations]
+        )
+        if not columnar or page_size is not None:
+            page_size = parse_page_size(page_size)
+        direction, key = decode_cursor(cursor) if cursor else (None, None)
+        if "near" in filter_params and (direction is not None or sorteer):
+            raise InvalidInputException()
+        if page_size is None and direction is not None:
+            # All rows are in the one page, there are no cursors
+            raise InvalidInputException()
+        if key is not None:
+            key = parse_key(collection, sort_keys, key)
+        # A near search is ordered on distance, it only has a first page
+        keyset = "near" not in filter_params
+        page = Page(
+            collection, None, page_size, direction, cursor, key_names, keyset
+        )
+        list_args = dict(
+            srid=srid,
+            geo_format=geo_format,
+            # One extra row tells whether there is a next page
+            limit=page_size + 1 if page_size is not None else None,
+            after=key if direction == "next" else None,
+            before=key if direction == "prev" else None,
+            fields=collection.properties,
+            sort_keys=sort_keys,
+            # The keys of the relations are needed, rows are rendered in Python
+            json_format=None if relations else json_format,
+            columnar=columnar,
+            **filter_params,
+        )
+        return page, list_args, filter_params
+
+    def list(self, expand=None, count=None, **params):
+        tree = self.expand_tree(expand)
+        page, list_args, filter_params = self._prepare_list(
+            relations=list(tree), **params
+        )
+        if parse_count(count):
+            page.count = self.data_strategy.count(**filter_params)
+        # The query runs here, the rows are fetched while the response streams
+        page.rows = self.data_strategy.list(**list_args)
+        if tree:
+            # All rows are needed for the keys, a page is bounded by MAX_PAGE_SIZE
+            page.rows = list(page.rows)
+            self.expand(page.rows, tree, list_args["srid"], list_args["geo_format"])
+        elif page.page_size is not None:
+            page.next_keys = lambda: self.data_strategy.next_keys(
+                page.page_size, **list_args
+            )
+        return page
+
+    def expand_tree(self, expand):
+        tree = parse_expand(expand)
+        for name in tree:
+            self.related(name)
+        return tree
 
-    def get(self, document_id, srid=const.DB_SRID, geo_format="geojson"):
-        return Resource(
-            self.collection,
-            self.data_strategy.get(
-                document_id, self.collection.primary_name, srid, geo_format
+    def related(self, name):
+        """ The relation and the repository of the related collection """
+        relation = self.collection.relations.get(name)
+        if relation is None or self.repo_factory is None:
+            raise InvalidInputException()
+        target = relation.target
+        return relation, self.repo_factory(target.catalog, target.collection)
+
+    def expand(self, rows, tree, srid=const.DB_SRID, geo_format="geojson"):
+        """ Embeds the related resources in the rows, a lookup per relation and
+        per BATCH_MAX_IDS keys
+        """
+        for name, subtree in tree.items():
+            relation, repo = self.related(name)
+            keys = relation_keys(rows, name, relation.many)
+            related_rows = []
+            for chunk in key_chunks(keys):
+                batch = repo.get_many(chunk, srid=srid, geo_format=geo_format)
+                related_rows.extend(batch.rows)
+            repo.expand(related_rows, subtree, srid, geo_format)
+            embed(rows, name, relation, repo.collection, related_rows)
+
+    def sort_keys(self, sorteer=None):
+        """ Sort keys for `sorteer`, the primary key makes the order stable """
+        primary_name = self.collection.primary_name
+        if not sorteer:
+            return with_tiebreaker([], primary_name)
+        try:
+            sort_keys = parse_sort(sorteer)
+        except ValueError:
+            raise InvalidInputException()
+        for sort_key in sort_keys:
+            spec = self.collection.specs.get(sort_key.name)
+            if spec is None or field_cast(spec) is None:
+                raise InvalidInputException()
+        sort_keys = with_tiebreaker(sort_keys, primary_name)
+        coll_ref = self.collection.coll_ref
+        observed_sorts[
+            (coll_ref.catalog, coll_ref.collection, format_sort(sort_keys))
+        ] += 1
+        return sort_keys
+
+    def version(self):
+        return self.with_schema_version(self.data_strategy.version())
+
+    def with_schema_version(self, version):
+        """ The table version, with the version of the schema it is rendered by """
+        if version is None:
+            return None
+        collection = self.collection
+        return replace(
+            version,
+            schema_version=schema_version(
+                collection.schema_url, collection.coll_ref.catalog
             ),
         )
+
+    def tile(self, z, x, y, fields=None, **filter_params):
+        """ Vector tile with the scalar fields as attributes """
+        try:
+            envelope = tile_envelope(z, x, y)
+        except ValueError:
+            raise InvalidInputException()
+        collection = self.collection.project(fields)
+        names = [
+            name
+            for name in collection.properties
+            if field_cast(collection.specs.get(name, {})) is not None
+        ]
+        return self.data_strategy.tile(envelope, fields=names, **filter_params)
+
+    def _prepare_get(
+        self,
+        srid=const.DB_SRID,
+        geo_format="geojson",
+        json_format=None,
+        columnar=False,
+        fields=None,
+        relations=(),
+        **params,
+    ):
+        """ The projected collection, and the arguments of the strategy
+
+        Documents are rendered from their resources, also in a columnar format.
+        """
+        collection = self.collection.project(fields, required=relations)
+        get_args = dict(
+            primary_name=collection.primary_name,
+            srid=srid,
+            geo_format=geo_format,
+            json_format=None if relations else json_format,
+            fields=collection.properties,
+            **params,
+        )
+        return collection, get_args
+
+    def _parse_ids(self, ids):
+        primary_name = self.collection.primary_name
+        cast = field_cast(self.collection.specs.get(primary_name, {})) or str
+        return parse_ids(ids, cast)
+
+    def get(self, document_id, expand=None, **params):
+        tree = self.expand_tree(expand)
+        collection, get_args = self._prepare_get(relations=list(tree), **params)
+        row = self.data_strategy.get(document_id, **get_args)
+        self.expand([row], tree, get_args["srid"], get_args["geo_format"])
+        return Resource(collection, row)
+
+    def get_many(self, ids=None, expand=None, **params):
+        """ One query for all ids, see `Batch` """
+        ids = self._parse_ids(ids)
+        tree = self.expand_tree(expand)
+        collection, get_args = self._prepare_get(relations=list(tree), **params)
+        rows = self.data_strategy.get_many(ids, **get_args)
+        self.expand(rows, tree, get_args["srid"], get_args["geo_format"])
+        return Batch(collection, ids, rows)
+
+
+@dataclass
+class AsyncEntityRepository(EntityRepository):
+    """ The same queries, awaited on an async strategy, see infra.asyncsql
+
+    Without a collection, the collection and the strategy are set by awaiting
+    `loader` before the first query, see `AsyncCatalogContext.load`.
+    """
+
+    loader: Callable[[], Awaitable[Tuple[Collection, Any]]] = None
+
+    async def load(self):
+        if self.collection is None:
+            self.collection, self.data_strategy = await self.loader()
+
+    async def list(self, expand=None, count=None, **params):
+        await self.load()
+        if params.get("columnar") and params.get("page_size") is None:
+            # The rows are fetched at once, all rows of a table do not fit in
+            # memory. Whole tables stream from the WSGI app or a snapshot.
+            raise InvalidInputException()
+        tree = self.expand_tree(expand)
+        page, list_args, filter_params = self._prepare_list(
+            relations=list(tree), **params
+        )
+        if parse_count(count):
+            page.count = await self.data_strategy.count(**filter_params)
+        # A page is bounded by MAX_PAGE_SIZE, its rows are fetched at once
+        page.rows = await self.data_strategy.list(**list_args)
+        await self.expand(page.rows, tree, list_args["srid"], list_args["geo_format"])
+        return page
+
+    async def expand(self, rows, tree, srid=const.DB_SRID, geo_format="geojson"):
+        for name, subtree in tree.items():
+            relation, repo = self.related(name)
+            await repo.load()
+            keys = relation_keys(rows, name, relation.many)
+            related_rows = []
+            for chunk in key_chunks(keys):
+                batch = await repo.get_many(chunk, srid=srid, geo_format=geo_format)
+                related_rows.extend(batch.rows)
+            await repo.expand(related_rows, subtree, srid, geo_format)
+            embed(rows, name, relation, repo.collection, related_rows)
+
+    async def version(self):
+        await self.load()
+        return self.with_schema_version(await self.data_strategy.version())
+
+    async def get(self, document_id, expand=None, **params):
+        await self.load()
+        tree = self.expand_tree(expand)
+        collection, get_args = self._prepare_get(relations=list(tree), **params)
+        row = await self.data_strategy.get(document_id, **get_args)
+        await self.expand([row], tree, get_args["srid"], get_args["geo_format"])
+        return Resource(collection, row)
+
+    async def get_many(self, ids=None, expand=None, **params):
+        await self.load()
+        ids = self._parse_ids(ids)
+        tree = self.expand_tree(expand)
+        collection, get_args = self._prepare_get(relations=list(tree), **params)
+        rows = await self.data_strategy.get_many(ids, **get_args)
+        await self.expand(rows, tree, get_args["srid"], get_args["geo_format"])
+        return Batch(collection, ids, rows)
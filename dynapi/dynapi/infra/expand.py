@@ -0,0 +1,77 @@
+"""
+Embedding of related resources (`expand`)
+
+    GET /api/example/steden?expand=ligtInProvincie,heeftBezienswaardigheden
+    GET /api/example/steden?expand=ligtInProvincie.hoofdstad
+
+The relations of a collection are read from its schema, see `Type.relations`.
+Once the rows of a page are fetched, the keys of a relation are collected
+from all rows and the related resources are fetched with one batch lookup
+per BATCH_MAX_IDS keys, so the number of queries hardly grows with the number
+of rows. A dotted
+path expands the relations of the related resources in turn.
+"""
+from typing import Dict
+
+from dynapi.domain.types import Resource
+from ..exceptions import InvalidInputException
+from .. import const
+
+
+def parse_expand(expand) -> Dict[str, dict]:
+    """ Relations to expand as a tree, `{name: {name of a nested relation: ...}}` """
+    if not expand:
+        return {}
+    tree = {}
+    n_relations = 0
+    for path in expand.split(","):
+        names = path.strip().split(".")
+        if not all(names) or len(names) > const.EXPAND_MAX_DEPTH:
+            raise InvalidInputException()
+        node = tree
+        for name in names:
+            if name not in node:
+                node[name] = {}
+                n_relations += 1
+            node = node[name]
+    if n_relations > const.EXPAND_MAX_RELATIONS:
+        raise InvalidInputException()
+    return tree
+
+
+def relation_keys(rows, name, many):
+    """ Distinct keys of a relation in the rows """
+    keys = []
+    for row in rows:
+        value = row.get(name)
+        if many:
+            keys.extend(value if isinstance(value, list) else [])
+        elif value is not None:
+            keys.append(value)
+    return list(dict.fromkeys(keys))
+
+
+def key_chunks(keys, size=None):
+    """ The keys in lists of at most BATCH_MAX_IDS, one batch lookup each """
+    size = size or const.BATCH_MAX_IDS
+    return [keys[i : i + size] for i in range(0, len(keys), size)]
+
+
+def embed(rows, name, relation, collection, related_rows):
+    """ Adds the related resources to the `_embedded` of every row
+
+    Keys are compared as text, a relation field holds the key as a string
+    also when the primary key of the related collection is a number.
+    """
+    related = {
+        str(row[collection.primary_name]): Resource(collection, row)
+        for row in related_rows
+    }
+    for row in rows:
+        value = row.get(name)
+        if relation.many:
+            keys = value if isinstance(value, list) else []
+            embedded = [related[str(k)] for k in keys if str(k) in related]
+        else:
+            embedded = related.get(str(value)) if value is not None else None
+        row.setdefault("_embedded", {})[name] = embedded
@@ -0,0 +1,92 @@
+"""
+Query parameters on the queryable fields of a collection (NL-API API-30)
+
+    ?name=Amsterdam
+    ?name[in]=Amsterdam,Haarlem
+    ?inwoners[gte]=100000&inwoners[lt]=500000
+    ?name[prefix]=Haar
+
+Values are checked against the JSON schema type of the field.
+"""
+import re
+from dataclasses import dataclass
+from typing import Any, List
+
+from ..exceptions import InvalidInputException
+
+
+# Parameters that are handled elsewhere and are no field filters
+NON_FILTER_PARAMS = {
+    "near",
+    "distance",
+    "srid",
+    "near-crs",
+    "content-type",
+    "geometry-format",
+    "bbox",
+    "bbox-crs",
+    "_geo",
+    "simplify",
+    "precision",
+    "bbox-only",
+}
+
+OPERATORS = {"eq", "in", "gt", "gte", "lt", "lte", "prefix"}
+
+PARAM_RE = re.compile(r"^(?P<name>[^\[\]]+)(\[(?P<operator>\w+)\])?$")
+
+
+def _to_boolean(value):
+    try:
+        return {"true": True, "false": False}[value.lower()]
+    except KeyError:
+        raise ValueError(value)
+
+
+CASTS = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": _to_boolean,
+}
+
+
+@dataclass
+class Filter:
+    name: str
+    operator: str
+    value: Any
+
+
+def field_cast(spec):
+    """ Cast for the query values of a field, None when it can not be filtered """
+    if "$ref" in spec:
+        # Identifiers, classes etc. are strings, geometries are not queryable
+        return None if spec["$ref"].startswith("https://geojson.org/") else str
+    return CASTS.get(spec.get("type"))
+
+
+def parse_filters(collection, params) -> List[Filter]:
+    filters = []
+    for param, value in params.items():
+        if param in NON_FILTER_PARAMS:
+            continue
+        match = PARAM_RE.match(param)
+        if match is None:
+            raise InvalidInputException()
+        name, operator = match.group("name"), match.group("operator") or "eq"
+        spec = collection.specs.get(name)
+        cast = field_cast(spec) if spec is not None else None
+        if cast is None or operator not in OPERATORS:
+            raise InvalidInputException()
+        if operator == "prefix" and cast is not str:
+            raise InvalidInputException()
+        try:
+            if operator == "in":
+                value = [cast(v) for v in value.split(",")]
+            else:
+                value = cast(value)
+        except ValueError:
+            raise InvalidInputException()
+        filters.append(Filter(name, operator, value))
+    return filters
@@ -0,0 +1,141 @@
+"""
+Spatial queries on collections (NL-API API-36)
+
+    GET /api/example/steden?bbox=4.85,52.33,4.95,52.40
+
+    POST /api/example/steden/_zoek
+    Content-Crs: EPSG:4326
+
+    {"_geo": {"intersects": {"type": "Polygon", "coordinates": [...]}}}
+
+Coordinates are in EPSG:4326 unless another CRS is given, with `bbox-crs`
+for a bounding box and the `Content-Crs` header for a posted geometry.
+"""
+import json
+import re
+from dataclasses import dataclass
+from numbers import Number
+from typing import List, Optional
+
+from ..exceptions import InvalidInputException
+from .. import const
+
+
+GEO_OPERATORS = {"intersects", "within", "contains"}
+
+GEOMETRY_TYPES = {
+    "Point": 0,
+    "MultiPoint": 1,
+    "LineString": 1,
+    "MultiLineString": 2,
+    "Polygon": 2,
+    "MultiPolygon": 3,
+}
+
+# Query geometries with more vertices are subdivided before matching,
+# so every part has a small bounding box for the GiST index
+SUBDIVIDE_VERTICES = 256
+
+# Bounds of the simplification tolerance in meters and of the decimals
+MAX_SIMPLIFY = 10000.0
+MAX_PRECISION = 15
+
+CRS_RE = re.compile(r"^(?:EPSG:|.*/EPSG/\d+/)?(?P<srid>\d+)$", re.IGNORECASE)
+
+
+def parse_srid(crs, default=const.LAT_LON_SRID) -> int:
+    """ SRID of `EPSG:28992`, `28992` or an OGC CRS URI, one of SUPPORTED_SRIDS """
+    if crs is None:
+        return default
+    match = CRS_RE.match(crs.strip())
+    if match is None:
+        raise InvalidInputException()
+    srid = int(match.group("srid"))
+    if srid not in const.SUPPORTED_SRIDS:
+        # Postgres fails on a transformation to an unknown SRID
+        raise InvalidInputException()
+    return srid
+
+
+def parse_bbox(bbox) -> List[float]:
+    try:
+        coords = [float(c) for c in bbox.split(",")]
+    except ValueError:
+        raise InvalidInputException()
+    if len(coords) != 4 or coords[0] > coords[2] or coords[1] > coords[3]:
+        raise InvalidInputException()
+    return coords
+
+
+def count_vertices(coordinates, depth):
+    """ Number of positions in GeoJSON coordinates, raises on a bad nesting """
+    if not isinstance(coordinates, list):
+        raise InvalidInputException()
+    if depth == 0:
+        if not 2 <= len(coordinates) <= 3 or not all(
+            isinstance(c, Number) and not isinstance(c, bool) for c in coordinates
+        ):
+            raise InvalidInputException()
+        return 1
+    if not coordinates:
+        raise InvalidInputException()
+    return sum(count_vertices(c, depth - 1) for c in coordinates)
+
+
+@dataclass
+class GeometryOutput:
+    """ How geometries are rendered in a response
+
+        ?simplify=5         simplified with a tolerance of 5 meters
+        ?precision=6        at most 6 decimals per coordinate
+        ?bbox-only=true     only the bounding box of the geometry
+    """
+
+    simplify: Optional[float] = None
+    precision: Optional[int] = None
+    bbox_only: bool = False
+
+    @classmethod
+    def from_params(cls, params) -> "GeometryOutput":
+        try:
+            simplify = params.get("simplify")
+            simplify = float(simplify) if simplify is not None else None
+            precision = params.get("precision")
+            precision = int(precision) if precision is not None else None
+            bbox_only = {"true": True, "false": False}[
+                params.get("bbox-only", "false").lower()
+            ]
+        except (KeyError, ValueError):
+            raise InvalidInputException()
+        if simplify is not None and not 0 < simplify <= MAX_SIMPLIFY:
+            raise InvalidInputException()
+        if precision is not None and not 0 <= precision <= MAX_PRECISION:
+            raise InvalidInputException()
+        return cls(simplify, precision, bbox_only)
+
+
+@dataclass
+class GeoQuery:
+    """ Posted geometry and the spatial relation the features must have with it """
+
+    operator: str
+    geojson: str
+    srid: int
+    n_vertices: int
+
+    @classmethod
+    def from_body(cls, body, content_crs=None) -> "GeoQuery":
+        if not isinstance(body, dict) or not isinstance(body.get("_geo"), dict):
+            raise InvalidInputException()
+        if len(body["_geo"]) != 1:
+            raise InvalidInputException()
+        ((operator, geometry),) = body["_geo"].items()
+        if operator not in GEO_OPERATORS or not isinstance(geometry, dict):
+            raise InvalidInputException()
+        depth = GEOMETRY_TYPES.get(geometry.get("type"))
+        if depth is None:
+            raise InvalidInputException()
+        coordinates = geometry.get("coordinates")
+        n_vertices = count_vertices(coordinates, depth)
+        geojson = json.dumps({"type": geometry["type"], "coordinates": coordinates})
+        return cls(operator, geojson, parse_srid(content_crs), n_vertices)
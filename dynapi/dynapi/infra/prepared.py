@@ -0,0 +1,120 @@
+"""
+Server-side prepared statements and statement timings
+
+The SQL text of a statement only depends on the schema of its collection
+and the shape of the query, the values are arguments. A statement is
+prepared once per pooled connection, named after its text and the version
+of the table, and executed by name from then on. Postgres then skips parsing
+and analysis, and reuses the plan once a generic plan is as good as the
+custom ones. A re-import that changes the type of a column bumps the
+version, Postgres would refuse to run the statement prepared before it
+("cached plan must not change result type").
+
+Streamed statements run on a server-side cursor, which can not execute a
+prepared statement, so they are sent as text. The timings per statement and
+phase show what preparing saves, see `/status/statements`.
+"""
+import functools
+import hashlib
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from .. import const
+
+
+PLACEHOLDER_RE = re.compile(r"%([s%])")
+
+# Prepared statements of a database connection, kept in its `info`
+PREPARED_KEY = "dynapi_prepared"
+
+
+@functools.lru_cache(maxsize=1024)
+def numbered_placeholders(sql_text):
+    """ The `%s` placeholders of the DB-API as the `$1, $2, ...` of Postgres """
+    numbers = itertools.count(1)
+    return PLACEHOLDER_RE.sub(
+        lambda match: f"${next(numbers)}" if match.group(1) == "s" else "%", sql_text
+    )
+
+
+def statement_name(sql_text, generation=None):
+    """ Named after the text, and the version of the table it was prepared for """
+    key = sql_text if generation is None else f"{generation}:{sql_text}"
+    return "dynapi_" + hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+class StatementTimings:
+    """ Number and total duration of the statements, per label and phase
+
+    The phases are `prepare`, `prepared` for the executions of a prepared
+    statement and `text` for statements sent as text.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = defaultdict(lambda: [0, 0.0])
+
+    @contextmanager
+    def timed(self, label, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                timing = self._timings[label, phase]
+                timing[0] += 1
+                timing[1] += elapsed
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+
+    def stats(self):
+        with self._lock:
+            timings = sorted(self._timings.items())
+        stats = {}
+        for (label, phase), (count, total) in timings:
+            stats.setdefault(label, {})[phase] = {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3),
+            }
+        return stats
+
+
+statement_timings = StatementTimings()
+
+
+def execute_prepared(con, label, sql_text, args, generation=None):
+    """ Executes the statement by name, it is prepared on first use
+
+    A statement prepared for an older `generation` of the table is not used
+    again, it is deallocated once it is the least recently used.
+    """
+    dbapi_con = con.connection
+    prepared = dbapi_con.info.setdefault(PREPARED_KEY, OrderedDict())
+    name = statement_name(sql_text, generation)
+    if name in prepared:
+        prepared.move_to_end(name)
+    else:
+        cursor = dbapi_con.cursor()
+        try:
+            if len(prepared) >= const.PREPARED_STATEMENTS_MAX:
+                oldest, _ = prepared.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {oldest}")
+            with statement_timings.timed(label, "prepare"):
+                # Without arguments the text is sent as is, `%` included
+                cursor.execute(f"PREPARE {name} AS {numbered_placeholders(sql_text)}")
+        finally:
+            cursor.close()
+        prepared[name] = label
+    with statement_timings.timed(label, "prepared"):
+        if not args:
+            return con.execute(f"EXECUTE {name}")
+        placeholders = ", ".join(["%s"] * len(args))
+        return con.execute(f"EXECUTE {name}({placeholders})", args)
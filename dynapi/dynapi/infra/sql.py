@@ -1,69 +1,807 @@
+import functools
 import json
-from dataclasses import dataclass
-from typing import Callable, Any
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Any, Iterable, Iterator, List, Optional
 
 from pint import UnitRegistry
-from pint.errors import UndefinedUnitError
+from pint.errors import DimensionalityError, UndefinedUnitError
 
-from dynapi.domain.types import CollectionRef
+from dataservices.amsterdam_schema.sorting import SortKey
+from dataservices.tiles import WEB_MERCATOR_SRID
+from dynapi.domain.types import Collection, CollectionRef, Count, TableVersion
 from ..exceptions import InvalidInputException, NotFoundException
 from .. import const
+from .filters import field_cast, parse_filters
+from .prepared import execute_prepared, statement_timings
+from .geo import (
+    GeoQuery,
+    GeometryOutput,
+    SUBDIVIDE_VERTICES,
+    parse_bbox,
+    parse_srid,
+)
 
 
 ureg = UnitRegistry()
 
 
+def quote_ident(name):
+    """ Quotes an identifier, the camelCase column names need it """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def parse_near(params):
+    """ Coordinates, distance in meters and SRID of the point of a near search """
+    try:
+        near = [float(a) for a in params.get("near").split(",")]
+        distance = ureg.parse_expression(params.get("distance"))
+        # A plain number is a distance in meters
+        if isinstance(distance, (int, float)):
+            distance = float(distance)
+        elif distance.dimensionless:
+            distance = float(distance.magnitude)
+        else:
+            distance = distance.to(ureg.meter).magnitude
+    except (ValueError, AttributeError, UndefinedUnitError, DimensionalityError):
+        raise InvalidInputException()
+    # `srid` is the name used before `near-crs`, still used by the global search
+    srid_near_coords = parse_srid(params.get("near-crs", params.get("srid")))
+    if len(near) != 2:
+        raise InvalidInputException()
+    return near, distance, srid_near_coords
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Every operator compiles to a plain comparison on the column,
+# so a btree index on the column can be used
+FILTER_SQL = {
+    "eq": "{} = %s",
+    "in": "{} = ANY(%s)",
+    "gt": "{} > %s",
+    "gte": "{} >= %s",
+    "lt": "{} < %s",
+    "lte": "{} <= %s",
+    # Needs a text_pattern_ops index when the database collation is not C
+    "prefix": "{} LIKE %s",
+}
+
+# Function rendering the geometries in every `geo_format`. A `geojson`
+# geometry is parsed into an object, a `geojson-text` geometry is passed on as
+# its text, `ewkb` is hex encoded and `wkb` is binary.
+GEOMETRY_RENDERERS = {
+    "geojson": "ST_AsGeoJSON",
+    "geojson-text": "ST_AsGeoJSON",
+    "wkt": "ST_AsText",
+    "ewkb": "ST_AsHEXEWKB",
+    "wkb": "ST_AsBinary",
+}
+
+# Renderers with a number of decimals, the others get rounded coordinates
+PRECISION_RENDERERS = {"ST_AsGeoJSON", "ST_AsText"}
+
+NEAR_POINT_SQL = "ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), %s), %s)"
+
+# Relation of the feature geometry with the query geometry, all of them
+# are matched on the bounding boxes through the GiST index first
+GEO_SQL = {
+    "intersects": "ST_Intersects({}, {})",
+    "within": "ST_Within({}, {})",
+    "contains": "ST_Contains({}, {})",
+}
+
+
+# Tile coordinate space and the margin around a tile, in tile units
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+
+def keyset_condition(columns, descending, nulls_first, key):
+    """ Condition for the rows after `key` in the order of the columns, and its
+    arguments. `nulls_first` tells where the NULLs of a column are in that
+    order, None for a column that is never NULL.
+    """
+    operators = ["<" if desc else ">" for desc in descending]
+    if len(set(operators)) == 1 and all(
+        first is None or (first and value is not None)
+        for first, value in zip(nulls_first, key)
+    ):
+        # No NULL follows, a row comparison can use a single multi-column index
+        placeholders = ", ".join(["%s"] * len(key))
+        return (f"({', '.join(columns)}) {operators[0]} ({placeholders})", *key)
+    disjuncts, args = [], []
+    for i, (column, operator, first, value) in enumerate(
+        zip(columns, operators, nulls_first, key)
+    ):
+        terms, term_args = [], []
+        for equal_column, equal_value in zip(columns[:i], key[:i]):
+            if equal_value is None:
+                terms.append(f"{equal_column} IS NULL")
+            else:
+                terms.append(f"{equal_column} = %s")
+                term_args.append(equal_value)
+        if value is None:
+            if not first:
+                # Nothing follows the NULLs at the end
+                continue
+            terms.append(f"{column} IS NOT NULL")
+        elif first is False:
+            terms.append(f"({column} {operator} %s OR {column} IS NULL)")
+            term_args.append(value)
+        else:
+            terms.append(f"{column} {operator} %s")
+            term_args.append(value)
+        disjuncts.append("(" + " AND ".join(terms) + ")")
+        args.extend(term_args)
+    if not disjuncts:
+        return ("FALSE",)
+    return ("(" + " OR ".join(disjuncts) + ")", *args)
+
+
+@dataclass
+class Query:
+    """ The clauses of a SELECT, filled in step by step """
+
+    where: List[str] = field(default_factory=list)
+    where_args: List[Any] = field(default_factory=list)
+    order_by: List[str] = field(default_factory=list)
+    order_args: List[Any] = field(default_factory=list)
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+
+    def add_where(self, clause, *args):
+        self.where.append(clause)
+        self.where_args.extend(args)
+
+    def add_order_by(self, clause, *args):
+        self.order_by.append(clause)
+        self.order_args.extend(args)
+
+    def clauses(self):
+        sql, args = "", self.where_args + self.order_args
+        if self.where:
+            sql += " WHERE " + " AND ".join(self.where)
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(self.order_by)
+        if self.limit is not None:
+            sql += " LIMIT %s"
+            args.append(self.limit)
+        if self.offset is not None:
+            sql += " OFFSET %s"
+            args.append(self.offset)
+        return sql, args
+
+
+@dataclass
+class Statement:
+    """ SQL text with its arguments, and how its rows become row dicts """
+
+    sql: str
+    args: List[Any]
+    convert: Callable[[Iterable[Any]], Iterator[dict]]
+    # What the statement does, e.g. `get` or `near`, for the timings
+    kind: str = "select"
+
+
+# Maintained by schema_ingest, see `bump_versions`
+VERSIONS_TABLE = "meta.table_versions"
+
+# The row count was added to the versions table later, it is read from the
+# row as JSON so tables of an older schema_ingest can still be read
+VERSION_SQL = (
+    "SELECT version, updated_at, (to_jsonb(v) ->> 'row_count')::bigint AS row_count "
+    f"FROM {VERSIONS_TABLE} v WHERE dataset = %s AND table_name = %s"
+)
+
+# Number of rows in the statistics of the planner, -1 before the first ANALYZE
+ESTIMATE_SQL = (
+    "SELECT reltuples::bigint AS count FROM pg_class WHERE oid = to_regclass(%s)"
+)
+
+# Once found the table stays, until then every lookup checks for it
+_versions_table_exists = False
+
+# Geometry columns that `schema ingest table --srid` precomputed, registered
+# by PostGIS. A column `<geometry>_<srid>` holds the geometry in that SRID.
+GEOMETRY_COLUMNS_SQL = (
+    "SELECT f_geometry_column AS name, srid FROM geometry_columns "
+    "WHERE f_table_schema = %s AND f_table_name = %s"
+)
+
+# Precomputed geometry columns per table and SRID, with their expiry time
+_geometry_columns = {}
+
+
 @dataclass
 class SQLStrategy:
-    coll_ref: CollectionRef
+    collection: Collection
     db_con_factory: Callable[[None], Any]
+    # Version of the table read by the request before its query, not read again
+    table_version: Optional[TableVersion] = None
+
+    @property
+    def coll_ref(self) -> CollectionRef:
+        return self.collection.coll_ref
+
+    @property
+    def table(self):
+        return f"{self.coll_ref.catalog}.{self.coll_ref.collection}"
 
-    def fetch_near_clause_and_args(self, **filter_params):
+    @property
+    def geometry(self):
+        """ Quoted name of the geometry column, if the collection has one """
+        geometry_name = self.collection.geometry_name
+        return quote_ident(geometry_name) if geometry_name else None
+
+    def needs_geometry_columns(self, srid):
+        """ Whether the precomputed columns for `srid` are to be looked up """
+        if srid == const.DB_SRID or self.geometry is None:
+            return False
+        cached = _geometry_columns.get(self.table)
+        return cached is None or cached[0] < time.monotonic()
+
+    def set_geometry_columns(self, rows):
+        geometry_name = self.collection.geometry_name
+        columns = {
+            row["srid"]: row["name"]
+            for row in rows
+            if row["name"] == f"{geometry_name}_{row['srid']}"
+        }
+        # Looked up again after a while, a new import may add or drop columns
+        _geometry_columns[self.table] = (time.monotonic() + const.SCHEMA_TTL, columns)
+
+    def load_geometry_columns(self, srid):
+        if self.needs_geometry_columns(srid):
+            result = self._execute(
+                GEOMETRY_COLUMNS_SQL, [self.coll_ref.catalog, self.coll_ref.collection]
+            )
+            self.set_geometry_columns(self._iter_chunks(result))
+
+    def precomputed_geometry(self, srid):
+        """ Quoted name of the column with the geometry in `srid`, if any """
+        name = _geometry_columns.get(self.table, (0, {}))[1].get(srid)
+        return quote_ident(name) if name else None
+
+    def select_columns(self, fields, geometry_expr, geometry_args=()):
+        """ Explicit column list and its arguments
+
+        The raw geometry column is never selected, `geometry_expr` is.
+        """
+        columns, args = [], []
+        for name in fields or self.collection.properties:
+            if name == self.collection.geometry_name:
+                columns.append(f"{geometry_expr} AS {quote_ident(name)}")
+                args.extend(geometry_args)
+            else:
+                columns.append(quote_ident(name))
+        return columns, args
+
+    def geometry_expr(self, srid, output=None, render="ST_AsGeoJSON"):
+        """ Rendered geometry in the target SRID, and its arguments
+
+        Simplification happens in the stored SRID, so the tolerance is in
+        meters whatever the target SRID. The precision is the number of
+        decimals of the rendered coordinates in the target SRID. Both are
+        arguments, so the SQL text does not change with their values.
+        A geometry precomputed in the target SRID is used unless simplified.
+        """
+        output = output or GeometryOutput()
+        expr, args = self.geometry, []
+        precomputed = self.precomputed_geometry(srid)
+        if precomputed is not None and output.simplify is None:
+            # Transformed when it was imported, not for every request
+            expr = f"ST_Envelope({precomputed})" if output.bbox_only else precomputed
+        elif output.bbox_only:
+            expr = f"ST_Envelope(ST_Transform(ST_Envelope({expr}), {srid}))"
+        else:
+            if output.simplify is not None:
+                expr = f"ST_SimplifyPreserveTopology({expr}, %s)"
+                args.append(output.simplify)
+            expr = f"ST_Transform({expr}, {srid})"
+        if output.precision is not None:
+            args.append(output.precision)
+            if render not in PRECISION_RENDERERS:
+                return f"{render}(ST_SnapToGrid({expr}, 10 ^ -%s::integer))", args
+            return f"{render}({expr}, %s)", args
+        return f"{render}({expr})", args
+
+    def add_near_clause(self, query, **filter_params):
         if "near" not in filter_params.keys():
-            return "", ()
-
-        try:
-            near = [float(a) for a in filter_params.get("near").split(",")]
-            distance = (
-                ureg.parse_expression(filter_params.get("distance"))
-                .to(ureg.meter)
-                .magnitude
+            return
+
+        near, distance, srid_near_coords = parse_near(filter_params)
+        point = NEAR_POINT_SQL
+        args = near + [srid_near_coords, const.DB_SRID]
+        query.add_where(f"ST_DWithin({self.geometry}, {point}, %s)", *args, distance)
+        query.add_order_by(f"{self.geometry} <-> {point}", *args)
+
+    def add_filter_clauses(self, query, **filter_params):
+        for filter_ in parse_filters(self.collection, filter_params):
+            value = filter_.value
+            if filter_.operator == "prefix":
+                value = escape_like(value) + "%"
+            query.add_where(
+                FILTER_SQL[filter_.operator].format(quote_ident(filter_.name)), value
+            )
+
+    def add_geo_clauses(self, query, **filter_params):
+        """ Bounding box and posted geometry, matched in the stored SRID
+
+        The query geometry is transformed in an uncorrelated subquery,
+        so once per query instead of once per row.
+        """
+        geo_query = filter_params.get("_geo")
+        if "bbox" not in filter_params and geo_query is None:
+            return
+        if self.geometry is None:
+            raise InvalidInputException()
+        if "bbox" in filter_params:
+            coords = parse_bbox(filter_params["bbox"])
+            srid = parse_srid(filter_params.get("bbox-crs"))
+            envelope = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s), %s)"
+            query.add_where(
+                f"ST_Intersects({self.geometry}, (SELECT {envelope}))",
+                *coords,
+                srid,
+                const.DB_SRID,
             )
-            srid_near_coords = int(filter_params.get("srid", const.LAT_LON_SRID))
-        except (ValueError, UndefinedUnitError):
+        if geo_query is None:
+            return
+        if not isinstance(geo_query, GeoQuery):
             raise InvalidInputException()
+        geometry = "ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(%s), %s), %s)"
+        args = [geo_query.geojson, geo_query.srid, const.DB_SRID]
+        if (
+            geo_query.n_vertices > SUBDIVIDE_VERTICES
+            and geo_query.operator != "contains"
+        ):
+            # The bounding box of a large geometry covers much more than the
+            # geometry, the boxes of its parts do not. As a semi join the
+            # planner can probe the spatial index once per part, an `&&` on
+            # an array of the parts can not use the index at all. The
+            # relation is checked on the whole geometry.
+            query.add_where(
+                f"EXISTS (SELECT 1 FROM (SELECT ST_Subdivide({geometry}, %s) "
+                f"AS part) s WHERE {self.geometry} && s.part)",
+                *args,
+                SUBDIVIDE_VERTICES,
+            )
+        query.add_where(
+            GEO_SQL[geo_query.operator].format(self.geometry, f"(SELECT {geometry})"),
+            *args,
+        )
+
+    def add_keyset_clause(self, query, sort_keys, after=None, before=None):
+        """ Keyset pagination on the sort keys, no OFFSET needed
+
+        `sort_keys` end with the primary key, `after` and `before` hold the
+        values of the sort keys of the row the page starts from.
+        Rows before a key are fetched in reverse order.
+
+        The columns other than the primary key can hold NULL, which sorts
+        first in both directions. A page after a key that is not NULL then
+        only has rows that compare greater (or less), so a row comparison on
+        one multi-column index finds them. Other keys get explicit NULL tests.
+        """
+        key = before if before is not None else after
+        backwards = before is not None
+        primary_name = self.collection.primary_name
+        columns = [quote_ident(sort_key.name) for sort_key in sort_keys]
+        descending = [sort_key.descending != backwards for sort_key in sort_keys]
+        # None for the primary key, it is never NULL
+        nulls_first = [
+            None if sort_key.name == primary_name else not backwards
+            for sort_key in sort_keys
+        ]
+        if key is not None:
+            if len(key) != len(sort_keys):
+                raise InvalidInputException()
+            query.add_where(*keyset_condition(columns, descending, nulls_first, key))
+        for column, desc, first in zip(columns, descending, nulls_first):
+            order = f"{column} DESC" if desc else column
+            if first is not None:
+                order += " NULLS FIRST" if first else " NULLS LAST"
+            query.add_order_by(order)
+
+    def version(self) -> Optional[TableVersion]:
+        """ Version of the table, None when it was not ingested by schema ingest """
+        global _versions_table_exists
+        con = self.db_con_factory()
+        if not _versions_table_exists:
+            # Checked first, a failing query would abort the request transaction
+            sql = f"SELECT to_regclass('{VERSIONS_TABLE}')"
+            if con.execute(sql).scalar() is None:
+                return None
+            _versions_table_exists = True
+        row = con.execute(
+            VERSION_SQL, [self.coll_ref.catalog, self.coll_ref.collection]
+        ).first()
+        return TableVersion(row.version, row.updated_at, row.row_count) if row else None
+
+    def statement_generation(self):
+        """ The version of the table the prepared statements are named after,
+        read once per strategy, so once per request
+        """
+        if self.table_version is not None:
+            return self.table_version.version
+        if not hasattr(self, "_generation"):
+            version = self.version()
+            self._generation = version.version if version is not None else None
+        return self._generation
+
+    def _execute(self, sql, qargs, stream=False):
+        """ With `stream`, a server-side cursor is used so only `FETCH_SIZE`
+        rows are held in memory at any time.
+        """
+        con = self.db_con_factory()
+        if stream:
+            con = con.execution_options(stream_results=True)
+        return con.execute(sql, qargs)
+
+    def _iter_chunks(self, result):
+        while True:
+            chunk = result.fetchmany(const.FETCH_SIZE)
+            if not chunk:
+                break
+            yield from chunk
+
+    def statement_label(self, statement):
+        return f"{self.table}:{statement.kind}"
+
+    def _run(self, statement, stream=False):
+        """ Executes the statement, the returned generator fetches the rows """
+        label = self.statement_label(statement)
+        if const.PREPARED_STATEMENTS and not stream:
+            con = self.db_con_factory()
+            result = execute_prepared(
+                con, label, statement.sql, statement.args, self.statement_generation()
+            )
+        else:
+            with statement_timings.timed(label, "text"):
+                result = self._execute(statement.sql, statement.args, stream)
+        return statement.convert(self._iter_chunks(result))
+
+    def _row_statement(
+        self, srid, geo_format, query, fields=None, output=None, columnar=False
+    ):
+        """ Rows as dicts, or `columnar` as they are fetched """
+        columns, select_args = self.select_columns(
+            fields, *self.geometry_expr(srid, output, GEOMETRY_RENDERERS[geo_format])
+        )
+        clauses, qargs = query.clauses()
+        sql = f"""SELECT {", ".join(columns)} FROM {self.table}{clauses}"""
+        if columnar:
+            return Statement(sql, select_args + qargs, iter)
+        return Statement(
+            sql,
+            select_args + qargs,
+            functools.partial(self._iter_rows, geo_format=geo_format),
+        )
+
+    def _iter_rows(self, rows, geo_format):
+        geometry_name = self.collection.geometry_name
+        for row in rows:
+            row = dict(row)
+            if geo_format == "geojson" and row.get(geometry_name) is not None:
+                row[geometry_name] = json.loads(row[geometry_name])
+            yield row
+
+    def _json_row_statement(
+        self,
+        srid,
+        json_format,
+        query,
+        fields=None,
+        output=None,
+        geo_format="geojson",
+        key_names=(),
+    ):
+        """ Lets Postgres render every row as a JSON text
+
+        `json_format` is the shape of the rendered row: a plain `row`,
+        a `document` with `_links` or a GeoJSON `feature`. A geometry that
+        is not GeoJSON is a JSON string. The primary key and the other
+        `key_names` are selected next to it, for the cursors of a page.
+        """
+        primary_name = quote_ident(self.collection.primary_name)
+        geometry_expr, geometry_args = self.geometry_expr(
+            srid, output, GEOMETRY_RENDERERS[geo_format]
+        )
+        if geo_format == "geojson":
+            geometry_expr = f"{geometry_expr}::json"
+        columns, select_args = self.select_columns(fields, geometry_expr, geometry_args)
+        rendered_args = []
+        if json_format == "document":
+            columns.append(
+                f"json_build_object('self', json_build_object("
+                f"'href', %s::text || {primary_name})) AS _links"
+            )
+            select_args.append(
+                f"{const.URI_PATH_PREFIX}{self.coll_ref.catalog}/"
+                f"{self.coll_ref.collection}/"
+            )
+        if json_format == "feature":
+            rendered = (
+                f"json_build_object('type', 'Feature', 'id', r.{primary_name}, "
+                f"'properties', to_jsonb(r) - %s::text)"
+            )
+            rendered_args.append(self.collection.primary_name)
+        else:
+            rendered = "row_to_json(r)"
+        key_names = [
+            name for name in key_names if name != self.collection.primary_name
+        ]
+        keys = "".join(
+            f"r.{quote_ident(name)} AS _key{i}, " for i, name in enumerate(key_names)
+        )
+        clauses, qargs = query.clauses()
+        sql = f"""SELECT r.{primary_name} AS _key, {keys}{rendered}::text AS _json
+                FROM (SELECT {", ".join(columns)}
+                FROM {self.table}{clauses}) r"""
+        args = rendered_args + select_args + qargs
+        return Statement(
+            sql, args, functools.partial(self._iter_json_rows, key_names=key_names)
+        )
 
-        where_clause = f"""
-            WHERE ST_DWithin(geometry, ST_Transform(ST_GeomFromText('POINT(%s %s)', %s), %s), %s)
-            ORDER BY geometry <-> ST_Transform(ST_GeomFromText('POINT(%s %s)', %s), %s)
-            """
-        args = near + [srid_near_coords, const.DB_SRID, distance]
-        return where_clause, args + args[:-1]
-
-    def _fetch_rows(self, srid, geo_format, where_clause, qargs):
-        transform_fie = "ST_AsText" if geo_format == "text" else "ST_AsGeoJSON"
-        sql = f"""SELECT *, {transform_fie}(ST_Transform(geometry, {srid})) AS _geometry
-                FROM {self.coll_ref.catalog}.{self.coll_ref.collection} {where_clause}"""
-        rows = [dict(row) for row in self.db_con_factory().execute(sql, qargs)]
-
-        if not rows:
-            return []
-        # Hmm, not easy to do this in an immutable chaining way
+    def _iter_json_rows(self, rows, key_names=()):
+        primary_name = self.collection.primary_name
         for row in rows:
-            tr = json.loads if geo_format == "geojson" else lambda x: x
-            row["geometry"] = tr(row["_geometry"])
-            del row["_geometry"]
+            json_row = {primary_name: row["_key"], "_json": row["_json"]}
+            for i, name in enumerate(key_names):
+                json_row[name] = row[f"_key{i}"]
+            yield json_row
+
+    def _select_statement(
+        self,
+        srid,
+        geo_format,
+        json_format,
+        query,
+        fields=None,
+        output=None,
+        columnar=False,
+        key_names=(),
+    ):
+        if json_format is not None:
+            return self._json_row_statement(
+                srid, json_format, query, fields, output, geo_format, key_names
+            )
+        return self._row_statement(srid, geo_format, query, fields, output, columnar)
+
+    def list_statement(
+        self,
+        srid=const.DB_SRID,
+        geo_format="geojson",
+        limit=None,
+        after=None,
+        before=None,
+        json_format=None,
+        fields=None,
+        sort_keys=None,
+        columnar=False,
+        offset=None,
+        **filter_params,
+    ) -> Statement:
+        query = Query(limit=limit, offset=offset)
+        self.add_filter_clauses(query, **filter_params)
+        self.add_geo_clauses(query, **filter_params)
+        if "near" in filter_params:
+            # Ordered on distance, only the nearest page is returned
+            self.add_near_clause(query, **filter_params)
+        else:
+            sort_keys = sort_keys or [SortKey(self.collection.primary_name)]
+            self.add_keyset_clause(query, sort_keys, after, before)
+        output = GeometryOutput.from_params(filter_params)
+        key_names = [sort_key.name for sort_key in sort_keys or ()]
+        statement = self._select_statement(
+            srid, geo_format, json_format, query, fields, output, columnar, key_names
+        )
+        if "near" in filter_params:
+            statement.kind = "near"
+        elif "bbox" in filter_params or "_geo" in filter_params:
+            statement.kind = "geo"
+        else:
+            statement.kind = "list"
+        return statement
+
+    def list(self, **kwargs):
+        # A page that fits in one fetch is not streamed, so it can be prepared
+        limit = kwargs.get("limit")
+        stream = limit is None or limit > const.FETCH_SIZE
+        self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        return self._run(self.list_statement(**kwargs), stream=stream)
+
+    def next_keys(self, page_size, sort_keys=None, **list_args):
+        """ Sort keys of the last row of a page and of the row after it
+
+        A second row means there is a next page. Only the sort key columns
+        are read, so the links of a streamed page are known up front.
+        """
+        sort_keys = sort_keys or [SortKey(self.collection.primary_name)]
+        list_args.update(
+            limit=2,
+            offset=page_size - 1,
+            fields=[sort_key.name for sort_key in sort_keys],
+            json_format=None,
+            columnar=False,
+        )
+        statement = self.list_statement(sort_keys=sort_keys, **list_args)
+        statement.kind = "next_keys"
+        return list(self._run(statement))
+
+    def count_query(self, **filter_params) -> Query:
+        """ The conditions of a list query, without its order """
+        query = Query(limit=const.COUNT_MAX + 1)
+        self.add_filter_clauses(query, **filter_params)
+        self.add_geo_clauses(query, **filter_params)
+        if "near" in filter_params:
+            self.add_near_clause(query, **filter_params)
+            query.order_by, query.order_args = [], []
+        return query
+
+    def count_statement(self, query) -> Statement:
+        """ Counts the matches, up to one more than COUNT_MAX """
+        clauses, qargs = query.clauses()
+        sql = f"SELECT count(*) AS count FROM (SELECT 1 FROM {self.table}{clauses}) c"
+        return Statement(sql, qargs, iter, "count")
+
+    def estimate_statement(self) -> Statement:
+        return Statement(ESTIMATE_SQL, [self.table], iter, "estimate")
+
+    def counted(self, value) -> Count:
+        capped = value > const.COUNT_MAX
+        return Count(min(value, const.COUNT_MAX), exact=not capped, capped=capped)
+
+    def count(self, **filter_params) -> Count:
+        """ Number of matches of a list query
 
-        return rows
-        # return [Resource(self.collection, row) for row in rows]
+        A collection is counted by schema ingest, otherwise its size is
+        estimated by the planner. Matches of a filtered query are counted.
+        """
+        query = self.count_query(**filter_params)
+        if not query.where:
+            version = self.table_version or self.version()
+            if version is not None and version.row_count is not None:
+                return Count(version.row_count)
+            row = next(self._run(self.estimate_statement()), None)
+            if row is not None and row["count"] >= 0:
+                return Count(row["count"], exact=False)
+        return self.counted(next(self._run(self.count_statement(query)))["count"])
 
-    def list(self, srid=const.DB_SRID, geo_format="geojson", **filter_params):
-        where_clause, qargs = self.fetch_near_clause_and_args(**filter_params)
-        return self._fetch_rows(srid, geo_format, where_clause, qargs)
+    def text_fields(self):
+        return [
+            name
+            for name in self.collection.properties
+            if field_cast(self.collection.specs.get(name, {})) is str
+        ]
 
-    def get(self, document_id, primary_name, srid=const.DB_SRID, geo_format="geojson"):
-        where_clause, qargs = f" WHERE {primary_name} = %s", [document_id]
-        rows = self._fetch_rows(srid, geo_format, where_clause, qargs)
-        if not rows:
+    def search(self, srid=const.DB_SRID, limit=10, q=None, near=None):
+        """ Best matches of a global search, see services.search
+
+        `near` is a point search as returned by `parse_near`. Rows are
+        ordered on their `_distance` in meters with `near`, otherwise on
+        their text `_score`: 1 for an exact match, 0.5 for a prefix match
+        and 0.25 when the text is contained in a field.
+        """
+        query = Query(limit=limit)
+        columns, select_args = self.select_columns(None, *self.geometry_expr(srid))
+        if near is not None:
+            if self.geometry is None:
+                raise InvalidInputException()
+            coords, distance, near_srid = near
+            args = coords + [near_srid, const.DB_SRID]
+            point = f"(SELECT {NEAR_POINT_SQL})"
+            columns.append(f"ST_Distance({self.geometry}, {point}) AS _distance")
+            select_args.extend(args)
+            query.add_where(
+                f"ST_DWithin({self.geometry}, {point}, %s)", *args, distance
+            )
+            query.add_order_by(f"{self.geometry} <-> {point}", *args)
+        if q:
+            text_columns = [quote_ident(name) for name in self.text_fields()]
+            if not text_columns:
+                raise InvalidInputException()
+            pattern = escape_like(q)
+            scores = []
+            for column in text_columns:
+                scores.append(
+                    f"CASE WHEN lower({column}) = lower(%s) THEN 1.0 "
+                    f"WHEN {column} ILIKE %s THEN 0.5 ELSE 0.25 END"
+                )
+                select_args.extend([q, f"{pattern}%"])
+            columns.append(f"GREATEST({', '.join(scores)})::float AS _score")
+            query.add_where(
+                "(" + " OR ".join(f"{c} ILIKE %s" for c in text_columns) + ")",
+                *[f"%{pattern}%"] * len(text_columns),
+            )
+            if near is None:
+                query.add_order_by("_score DESC")
+        query.add_order_by(quote_ident(self.collection.primary_name))
+        clauses, qargs = query.clauses()
+        sql = f"""SELECT {", ".join(columns)} FROM {self.table}{clauses}"""
+        convert = functools.partial(self._iter_rows, geo_format="geojson")
+        statement = Statement(sql, select_args + qargs, convert, "search")
+        return list(self._run(statement))
+
+    def tile(self, envelope, fields=None, **filter_params) -> bytes:
+        """ Mapbox Vector Tile of the features in a web mercator envelope
+
+        `fields` are the attributes of the features, the layer is named
+        after the collection.
+        """
+        if self.geometry is None:
+            raise InvalidInputException()
+        query = Query()
+        self.add_filter_clauses(query, **filter_params)
+        self.add_geo_clauses(query, **filter_params)
+        bounds = f"ST_MakeEnvelope(%s, %s, %s, %s, {WEB_MERCATOR_SRID})"
+        # Features in the margin are clipped at the buffer, not at the tile
+        margin = (envelope[2] - envelope[0]) * MVT_BUFFER / MVT_EXTENT
+        query.add_where(
+            f"{self.geometry} && (SELECT ST_Transform(ST_Expand({bounds}, %s), %s))",
+            *envelope,
+            margin,
+            const.DB_SRID,
+        )
+        columns = [
+            quote_ident(name)
+            for name in fields or []
+            if name != self.collection.geometry_name
+        ]
+        columns.append(
+            f"ST_AsMVTGeom(ST_Transform({self.geometry}, {WEB_MERCATOR_SRID}), "
+            f"{bounds}, {MVT_EXTENT}, {MVT_BUFFER}, true) AS __geometry"
+        )
+        clauses, qargs = query.clauses()
+        sql = f"""SELECT ST_AsMVT(t, %s, {MVT_EXTENT}, '__geometry')
+                FROM (SELECT {", ".join(columns)} FROM {self.table}{clauses}) t"""
+        tile = self._execute(
+            sql, [self.coll_ref.collection, *envelope, *qargs]
+        ).scalar()
+        return bytes(tile) if tile is not None else b""
+
+    def _by_id_statement(
+        self,
+        where,
+        arg,
+        srid=const.DB_SRID,
+        geo_format="geojson",
+        json_format=None,
+        fields=None,
+        **params,
+    ) -> Statement:
+        query = Query()
+        query.add_where(where, arg)
+        output = GeometryOutput.from_params(params)
+        return self._select_statement(
+            srid, geo_format, json_format, query, fields, output
+        )
+
+    def get_statement(self, document_id, primary_name, **params) -> Statement:
+        statement = self._by_id_statement(
+            f"{quote_ident(primary_name)} = %s", document_id, **params
+        )
+        statement.kind = "get"
+        return statement
+
+    def get_many_statement(self, document_ids, primary_name, **params) -> Statement:
+        """ All rows with one of the ids, in no particular order """
+        statement = self._by_id_statement(
+            f"{quote_ident(primary_name)} = ANY(%s)", list(document_ids), **params
+        )
+        statement.kind = "batch"
+        return statement
+
+    def get(self, *args, **kwargs):
+        self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        row = next(self._run(self.get_statement(*args, **kwargs)), None)
+        if row is None:
             raise NotFoundException()
-        return rows[0]
+        return row
+
+    def get_many(self, *args, **kwargs):
+        self.load_geometry_columns(kwargs.get("srid", const.DB_SRID))
+        return list(self._run(self.get_many_statement(*args, **kwargs)))
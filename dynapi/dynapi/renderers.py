@@ -0,0 +1,541 @@
+"""
+Reading requests and rendering resources, shared by the WSGI and the ASGI app
+
+A renderer turns the content into a `Rendered` body: the parts of the body,
+its mimetype and headers. The request is passed in explicitly, so the links
+can be built for a Flask as well as a Quart request.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable
+from urllib.parse import quote, urlencode
+
+from flask import Response
+from flask import request as flask_request
+from flask import stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+from . import columnar, const
+from .exceptions import InvalidInputException, NotAcceptableException
+from .infra.db import Batch
+from .infra.geo import GeoQuery, parse_srid
+
+
+uri_path_prefix = const.URI_PATH_PREFIX
+
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+
+def json_dumps(obj):
+    """ JSON text as rendered by the Flask app, also outside of a Flask app """
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True)
+
+
+def chunked(parts, chunk_size=const.STREAM_CHUNK_SIZE):
+    """ Joins rendered parts into chunks of about `chunk_size` characters,
+    or bytes for a binary format
+    """
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            # An empty str or bytes, like the parts
+            yield buffer[0][:0].join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
+def streamed(parts, **kwargs):
+    """ Chunked response, rendered while the rows come in from the database """
+    return Response(stream_with_context(chunked(parts)), **kwargs)
+
+
+def collection_link(request, coll_ref, **params):
+    """ Link to the collection with the current query args, updated by `params` """
+    args = {**request.args.to_dict(), **params}
+    query = urlencode({k: v for k, v in args.items() if v is not None})
+    link = f"{uri_path_prefix}{coll_ref.catalog}/{coll_ref.collection}"
+    if request.method == "POST":
+        # Pages of a geo query are fetched by posting the same body again
+        link += "/_zoek"
+    return f"{link}?{query}" if query else link
+
+
+def page_links(request, page):
+    coll_ref = page.collection.coll_ref
+    links = {"self": {"href": collection_link(request, coll_ref, cursor=page.cursor)}}
+    if page.next_cursor is not None:
+        links["next"] = {
+            "href": collection_link(request, coll_ref, cursor=page.next_cursor)
+        }
+    if page.prev_cursor is not None:
+        links["previous"] = {
+            "href": collection_link(request, coll_ref, cursor=page.prev_cursor)
+        }
+    return links
+
+
+def batch_link(request, coll_ref):
+    query = urlencode(list(request.args.items(multi=True)))
+    link = f"{uri_path_prefix}{coll_ref.catalog}/{coll_ref.collection}/_batch"
+    return f"{link}?{query}" if query else link
+
+
+def missing_header(batch):
+    """ Ids that were not found, for formats without room for them in the body """
+    return ",".join(quote(str(id_), safe="") for id_ in batch.missing)
+
+
+def render_embedded(resource, render):
+    """ The related resources of `expand`, rendered by `render` """
+    return {
+        name: [render(r) for r in embedded]
+        if isinstance(embedded, list)
+        else (render(embedded) if embedded is not None else None)
+        for name, embedded in resource.embedded.items()
+    }
+
+
+def as_dict(resource):
+    """ Fields of a resource, with its embedded resources """
+    rendered = resource.fields.as_dict()
+    if resource.embedded:
+        rendered["_embedded"] = render_embedded(resource, as_dict)
+    return rendered
+
+
+def page_meta(page):
+    """ `_meta` of a page with a count, None without """
+    if page.count is None:
+        return None
+    count = page.count
+    return {"count": count.value, "exact": count.exact, "capped": count.capped}
+
+
+def count_headers(page):
+    """ The count of a page, for formats without room for it in the body """
+    if page.count is None:
+        return {}
+    return {
+        "Total-Count": str(page.count.value),
+        "Total-Count-Exact": "true" if page.count.exact else "false",
+    }
+
+
+def link_header(request, page):
+    """ RFC 8288 Link header, for formats without room for links in the body """
+    return ", ".join(
+        f'<{link["href"]}>; rel="{rel}"'
+        for rel, link in page_links(request, page).items()
+    )
+
+
+@dataclass
+class Rendered:
+    """ Body of a response, independent of the web framework """
+
+    parts: Iterable[str]
+    mimetype: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Rendered while it is sent, instead of before the response starts
+    stream: bool = False
+    # The parts are bytes instead of text
+    binary: bool = False
+
+
+# XXX instead of explicitly stating multiple
+# we could also check in the renderer if the content is iterable
+@dataclass
+class Renderer:
+    multiple: bool
+    # The Flask request unless given
+    request: Any = None
+    # SRID of the rendered geometries, for the Content-Crs header
+    srid: int = None
+    # Shape of the JSON that Postgres renders per row, see DB_RENDERING
+    db_json_format = None
+    # Rendered from the rows as fetched, in batches, see `ColumnarRenderer`
+    columnar = False
+    # Geometry encodings of the format, `geometry-format`, the first is the
+    # default. JSON formats embed a GeoJSON geometry as an object.
+    geometry_formats = ("geojson", "wkt", "ewkb")
+    geometry_objects = True
+
+    def render(self, resource):
+        pass
+
+    def render_json(self, resource):
+        """ JSON text of a resource, passed through when rendered by Postgres """
+        if resource.raw is not None:
+            return resource.raw
+        return json_dumps(self.render(resource))
+
+    def links(self, page):
+        request = self.request if self.request is not None else flask_request
+        return page_links(request, page)
+
+    def link_header(self, page):
+        request = self.request if self.request is not None else flask_request
+        return link_header(request, page)
+
+    def batch_links(self, batch):
+        request = self.request if self.request is not None else flask_request
+        return {"self": {"href": batch_link(request, batch.collection.coll_ref)}}
+
+    def rendered(self, content) -> Rendered:
+        raise NotImplementedError()
+
+    def rendered_batch(self, batch) -> Rendered:
+        raise NotImplementedError()
+
+    def rendered_content(self, content) -> Rendered:
+        if isinstance(content, Batch):
+            rendered = self.rendered_batch(content)
+        else:
+            rendered = self.rendered(content)
+        if self.srid is not None and content.collection.geometry_name:
+            # NL-API API-41, in every format
+            rendered.headers["Content-Crs"] = f"EPSG:{self.srid}"
+        return rendered
+
+    def __call__(self, content):
+        """ Flask response for the content """
+        rendered = self.rendered_content(content)
+        if rendered.stream:
+            return streamed(
+                rendered.parts, mimetype=rendered.mimetype, headers=rendered.headers
+            )
+        return Response(
+            "".join(rendered.parts),
+            mimetype=rendered.mimetype,
+            headers=rendered.headers,
+        )
+
+
+class JSONRenderer(Renderer):
+    db_json_format = "document"
+
+    def get_self_link(self, resource):
+        document_id = getattr(resource.fields, resource.collection.primary_name)
+        return (
+            f"{uri_path_prefix}{resource.collection.coll_ref.catalog}/"
+            f"{resource.collection.coll_ref.collection}/{document_id}"
+        )
+
+    def render(self, resource):
+
+        rendered = resource.fields.as_dict()
+        rendered["_links"] = {"self": {"href": self.get_self_link(resource)}}
+        if resource.embedded:
+            rendered["_embedded"] = render_embedded(resource, self.render)
+        return rendered
+
+    def iter_parts(self, page):
+        yield f'{{"_embedded":{{{json_dumps(page.collection.coll_ref.collection)}:['
+        for i, resource in enumerate(page):
+            yield ("," if i else "") + self.render_json(resource)
+        # The links are known once all rows of the page have been rendered
+        yield f']}},"_links":{json_dumps(self.links(page))}'
+        meta = page_meta(page)
+        yield f',"_meta":{json_dumps(meta)}}}' if meta is not None else "}"
+
+    def iter_batch_parts(self, batch):
+        yield f'{{"_embedded":{{{json_dumps(batch.collection.coll_ref.collection)}:['
+        for i, resource in enumerate(batch):
+            yield ("," if i else "") + self.render_json(resource)
+        yield (
+            f']}},"_missing":{json_dumps(batch.missing)},'
+            f'"_links":{json_dumps(self.batch_links(batch))}}}'
+        )
+
+    def rendered(self, content):
+        if self.multiple:
+            return Rendered(self.iter_parts(content), "application/json", stream=True)
+        return Rendered([self.render_json(content)], "application/json")
+
+    def rendered_batch(self, batch):
+        return Rendered(self.iter_batch_parts(batch), "application/json", stream=True)
+
+
+class NDJSONRenderer(Renderer):
+    db_json_format = "row"
+
+    def render(self, resource):
+        if resource.raw is not None:
+            return resource.raw
+        return json.dumps(as_dict(resource), separators=(",", ":"))
+
+    def iter_parts(self, content):
+        for i, resource in enumerate(content):
+            yield ("\n" if i else "") + self.render(resource)
+
+    def rendered(self, content):
+        if self.multiple:
+            # The links go in the header, the rows are streamed after it
+            content.resolve_cursors()
+            return Rendered(
+                self.iter_parts(content),
+                "application/x-ndjson",
+                {"Link": self.link_header(content), **count_headers(content)},
+                stream=True,
+            )
+        return Rendered([self.render(content)], "application/x-ndjson")
+
+    def rendered_batch(self, batch):
+        return Rendered(
+            self.iter_parts(batch),
+            "application/x-ndjson",
+            {"Missing-Ids": missing_header(batch)},
+            stream=True,
+        )
+
+
+class _Echo:
+    """ File-like object that hands back what the csv writer writes """
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(Renderer):
+    geometry_formats = ("ewkb", "wkt", "geojson")
+    geometry_objects = False
+
+    def iter_parts(self, content):
+        writer = csv.writer(_Echo())
+        for i, resource in enumerate(content):
+            embedded = render_embedded(resource, as_dict) if resource.embedded else {}
+            if not i:
+                # Embedded resources are a JSON column per relation
+                names = [f"_embedded.{name}" for name in embedded]
+                yield writer.writerow([*resource.fields.keys(), *names])
+            values = [json_dumps(value) for value in embedded.values()]
+            yield writer.writerow([*resource.fields.values, *values])
+
+    def rendered(self, content):
+        headers = {"Content-Disposition": f"attachment;filename=output.csv"}
+        if self.multiple:
+            # The links go in the header, the rows are streamed after it
+            content.resolve_cursors()
+            resources = content
+            headers["Link"] = self.link_header(content)
+            headers.update(count_headers(content))
+        else:
+            resources = [content]
+        return Rendered(self.iter_parts(resources), "text/csv", headers, stream=True)
+
+    def rendered_batch(self, batch):
+        headers = {
+            "Content-Disposition": f"attachment;filename=output.csv",
+            "Missing-Ids": missing_header(batch),
+        }
+        return Rendered(self.iter_parts(batch), "text/csv", headers, stream=True)
+
+
+class GeoJSONRenderer(Renderer):
+    db_json_format = "feature"
+    geometry_formats = ("geojson",)
+
+    def render(self, resource):
+        primary_name = resource.collection.primary_name
+        rendered = {
+            "type": "Feature",
+            "id": resource.fields[primary_name],
+            "properties": {
+                k: v for k, v in resource.fields.items() if k != primary_name
+            },
+        }
+        if resource.embedded:
+            rendered["_embedded"] = render_embedded(resource, self.render)
+        return rendered
+
+    def iter_parts(self, page):
+        yield '{"type":"FeatureCollection","features":['
+        for i, resource in enumerate(page):
+            yield ("," if i else "") + self.render_json(resource)
+        yield f'],"_links":{json_dumps(self.links(page))}'
+        meta = page_meta(page)
+        yield f',"_meta":{json_dumps(meta)}}}' if meta is not None else "}"
+
+    def iter_batch_parts(self, batch):
+        yield '{"type":"FeatureCollection","features":['
+        for i, resource in enumerate(batch):
+            yield ("," if i else "") + self.render_json(resource)
+        yield (
+            f'],"_missing":{json_dumps(batch.missing)},'
+            f'"_links":{json_dumps(self.batch_links(batch))}}}'
+        )
+
+    def rendered(self, content):
+        if not self.multiple:
+            return Rendered([self.render_json(content)], "application/json")
+        return Rendered(self.iter_parts(content), "application/json", stream=True)
+
+    def rendered_batch(self, batch):
+        return Rendered(self.iter_batch_parts(batch), "application/json", stream=True)
+
+
+class ColumnarRenderer(Renderer):
+    """ Columnar bulk format, built in record batches of FETCH_SIZE rows
+
+    Without a page size the page holds the whole result of the query. With a
+    page size the links go in the header. Both stream from the database.
+    """
+
+    columnar = True
+    geometry_formats = ("wkb",)
+    geometry_objects = False
+    mimetype = None
+    extension = None
+
+    def iter_parts(self, collection, batches):
+        raise NotImplementedError()
+
+    def rendered_rows(self, collection, batches, headers):
+        headers["Content-Disposition"] = f"attachment;filename=output.{self.extension}"
+        return Rendered(
+            self.iter_parts(collection, batches),
+            self.mimetype,
+            headers,
+            stream=True,
+            binary=True,
+        )
+
+    def rendered(self, content):
+        headers = {}
+        if not self.multiple:
+            batches = [[content.fields.values]]
+        else:
+            if content.page_size is not None:
+                content.resolve_cursors()
+                headers["Link"] = self.link_header(content)
+                headers.update(count_headers(content))
+            batches = content.batches(const.FETCH_SIZE)
+        return self.rendered_rows(content.collection, batches, headers)
+
+    def rendered_batch(self, batch):
+        rows = [resource.fields.values for resource in batch]
+        return self.rendered_rows(
+            batch.collection, [rows], {"Missing-Ids": missing_header(batch)}
+        )
+
+
+class ArrowRenderer(ColumnarRenderer):
+    mimetype = ARROW_MIMETYPE
+    extension = "arrows"
+
+    def iter_parts(self, collection, batches):
+        return columnar.iter_arrow_stream(collection, batches)
+
+
+class GeoParquetRenderer(ColumnarRenderer):
+    mimetype = PARQUET_MIMETYPE
+    extension = "parquet"
+
+    def iter_parts(self, collection, batches):
+        return columnar.iter_geoparquet(collection, batches, self.srid)
+
+
+def get_renderer(content_type, multiple, request=None, srid=None):
+    # XXX 7.2.10 API-25: Check the Content-Type header settings
+    # Check the Content-Type header is application/json or another supported
+    # content types, otherwise send the HTTP status code 415 Unsupported Media Type.
+    return {
+        "application/json": JSONRenderer(multiple, request, srid),
+        "application/ndjson": NDJSONRenderer(multiple, request, srid),
+        "text/csv": CSVRenderer(multiple, request, srid),
+        "application/geojson": GeoJSONRenderer(multiple, request, srid),
+        ARROW_MIMETYPE: ArrowRenderer(multiple, request, srid),
+        PARQUET_MIMETYPE: GeoParquetRenderer(multiple, request, srid),
+    }.get(content_type, JSONRenderer(multiple, request, srid))
+
+
+@dataclass
+class Negotiated:
+    """ Representation asked for by a request """
+
+    content_type: str
+    renderer: Renderer
+    srid: int
+    geo_format: str
+    # Shape of the JSON rendered by Postgres, None when rendered in Python
+    json_format: Any
+    # Rows passed on as fetched, see `ColumnarRenderer`
+    columnar: bool = False
+
+
+def accepted_srid(accept_crs, default):
+    """ Best supported SRID of an Accept-Crs header (NL-API API-40)
+
+        Accept-Crs: EPSG:4326
+        Accept-Crs: EPSG:4258, EPSG:4326;q=0.5
+    """
+    if not accept_crs:
+        return default
+    for crs, _ in parse_accept_header(accept_crs):
+        try:
+            return parse_srid(crs)
+        except InvalidInputException:
+            continue
+    raise NotAcceptableException()
+
+
+def geometry_format(renderer, requested=None):
+    """ The `geo_format` of the strategy for the requested geometry encoding
+
+    A GeoJSON geometry is only parsed for the formats that embed it as an
+    object, the others get its text as it comes from the database.
+    """
+    geo_format = requested or renderer.geometry_formats[0]
+    if geo_format not in renderer.geometry_formats:
+        raise NotAcceptableException()
+    if geo_format == "geojson" and not renderer.geometry_objects:
+        return "geojson-text"
+    return geo_format
+
+
+def negotiate(request, multiple) -> Negotiated:
+    content_type = request.headers.get("Accept", "application/json")
+    content_type = request.args.get("content-type", content_type)
+    srid = const.DB_SRID
+    if content_type == "application/geojson":
+        srid = const.LAT_LON_SRID
+    srid = accepted_srid(request.headers.get("Accept-Crs"), srid)
+    renderer = get_renderer(content_type, multiple, request, srid)
+    if renderer.columnar and not columnar.available():
+        raise NotAcceptableException()
+    geo_format = geometry_format(renderer, request.args.get("geometry-format"))
+    json_format = renderer.db_json_format if const.DB_RENDERING else None
+    return Negotiated(
+        content_type, renderer, srid, geo_format, json_format, renderer.columnar
+    )
+
+
+def query_params(request, path_params):
+    """ Path and query parameters for the catalog service
+
+    The `srid` of a query is the CRS of the `near` coordinates, it is passed
+    on as `near-crs`: the `srid` of the service is the CRS of the response.
+    """
+    params = {**path_params, **request.args}
+    if "srid" in params:
+        params.setdefault("near-crs", params.pop("srid"))
+    return params
+
+
+def geo_body_params(body, headers):
+    """ Parameters of a posted geo query, see `GeoQuery` """
+    return {"_geo": GeoQuery.from_body(body, headers.get("Content-Crs"))}
+
+
+def batch_body_params(body, headers):
+    """ Parameters of a posted batch lookup: {"ids": ["a", "b"]} """
+    if not isinstance(body, dict) or not isinstance(body.get("ids"), list):
+        raise InvalidInputException()
+    return {"ids": body["ids"]}
@@ -1,3 +1,4 @@
 from .openapi import OpenAPIContext, OpenAPIService  # NoQA
-from .catalog import CatalogContext, CatalogService  # NoQA
+from .catalog import AsyncCatalogContext, CatalogContext, CatalogService  # NoQA
 
+from .search import SearchService  # NoQA
@@ -1,7 +1,10 @@
+import asyncio
+import functools
 from dataclasses import dataclass
 from typing import Callable, Any
-from ..domain.types import Collection, CollectionRef
-from ..infra.db import EntityRepository
+from ..domain.types import Collection, CollectionRef, TableVersion
+from ..infra.asyncsql import AsyncSQLStrategy
+from ..infra.db import AsyncEntityRepository, EntityRepository
 from ..infra.sql import SQLStrategy
 from .. import const
 
@@ -11,17 +14,70 @@ class CatalogContext:
     schema_url: str
     db_con_factory: Callable[[None], Any]
 
-    def entity_repo(self, catalog_str, collection_str):
+    strategy_class = SQLStrategy
+    repository_class = EntityRepository
+
+    def entity_repo(self, catalog_str, collection_str, table_version=None):
         coll_ref = CollectionRef(catalog_str, collection_str)
         collection = Collection(coll_ref, self.schema_url)
-        data_strategy = SQLStrategy(coll_ref, self.db_con_factory)
-        return EntityRepository(collection, data_strategy)
+        data_strategy = self.strategy_class(
+            collection, self.db_con_factory, table_version
+        )
+        return self.repository_class(collection, data_strategy, self.entity_repo)
+
+
+@dataclass
+class AsyncCatalogContext(CatalogContext):
+    """ The service methods return coroutines, `db_con_factory` the asyncpg pool """
+
+    strategy_class = AsyncSQLStrategy
+    repository_class = AsyncEntityRepository
+
+    def entity_repo(self, catalog_str, collection_str, table_version=None):
+        # The collection is looked up when the first query is awaited
+        loader = functools.partial(
+            self.load, catalog_str, collection_str, table_version
+        )
+        return self.repository_class(None, None, self.entity_repo, loader)
+
+    async def load(self, catalog_str, collection_str, table_version=None):
+        """ The collection and its strategy
+
+        The schema registry can fetch the schema over HTTP, so the collection
+        is looked up in a worker thread instead of on the event loop.
+        """
+        coll_ref = CollectionRef(catalog_str, collection_str)
+        collection = await asyncio.get_running_loop().run_in_executor(
+            None, Collection, coll_ref, self.schema_url
+        )
+        data_strategy = self.strategy_class(
+            collection, self.db_con_factory, table_version
+        )
+        return collection, data_strategy
 
 
 @dataclass
 class CatalogService:
     context: CatalogContext
 
+    def table_version(self, catalog: str, collection: str):
+        return self.context.entity_repo(catalog, collection).version()
+
+    def get_tile(
+        self,
+        catalog: str,
+        collection: str,
+        z: int,
+        x: int,
+        y: int,
+        fields: str = None,
+        table_version: TableVersion = None,
+        **filter_params
+    ):
+        return self.context.entity_repo(catalog, collection, table_version).tile(
+            z, x, y, fields=fields, **filter_params
+        )
+
     def get_document(
         self,
         catalog: str,
@@ -29,9 +85,39 @@ class CatalogService:
         document_id: str,
         srid: int = const.DB_SRID,
         geo_format: str = "geojson",
+        json_format: str = None,
+        fields: str = None,
+        table_version: TableVersion = None,
+        **params
+    ):
+        return self.context.entity_repo(catalog, collection, table_version).get(
+            document_id,
+            srid=srid,
+            geo_format=geo_format,
+            json_format=json_format,
+            fields=fields,
+            **params,
+        )
+
+    def get_documents(
+        self,
+        catalog: str,
+        collection: str,
+        ids: Any = None,
+        srid: int = const.DB_SRID,
+        geo_format: str = "geojson",
+        json_format: str = None,
+        fields: str = None,
+        table_version: TableVersion = None,
+        **params
     ):
-        return self.context.entity_repo(catalog, collection).get(
-            document_id, srid=srid, geo_format=geo_format
+        return self.context.entity_repo(catalog, collection, table_version).get_many(
+            ids,
+            srid=srid,
+            geo_format=geo_format,
+            json_format=json_format,
+            fields=fields,
+            **params,
         )
 
     def list_resources(
@@ -40,8 +126,9 @@ class CatalogService:
         collection: str,
         srid: int = const.DB_SRID,
         geo_format: str = "geojson",
+        table_version: TableVersion = None,
         **filter_params
     ):
-        return self.context.entity_repo(catalog, collection).list(
+        return self.context.entity_repo(catalog, collection, table_version).list(
             srid=srid, geo_format=geo_format, **filter_params
         )
@@ -2,10 +2,14 @@
 Service for generating an OpenAPI spec
 """
 from dataclasses import dataclass, field, asdict
+import hashlib
+import json
+import threading
 import typing
 
-from schema_ingest import schema_defs_from_url, fetch_schema
+from dataservices.amsterdam_schema.registry import get_registry
 from dynapi.domain.types import Type
+from .. import const
 
 
 @dataclass
@@ -134,24 +138,93 @@ class OpenAPIContext:
         )
 
 
+@dataclass
+class CatalogSpec:
+    """ Path items and component schemas of one catalog """
+
+    catalog: Type
+    paths: dict
+    schemas: dict
+
+
+@dataclass
+class EncodedSpec:
+    """ The spec as JSON bytes, for the registry state in `key` """
+
+    key: tuple
+    body: bytes
+    etag: str
+
+
 @dataclass
 class OpenAPIService:
     context: OpenAPIContext
+    # Built once per catalog, until the registry holds a new schema for it
+    _catalog_specs: typing.Dict[str, CatalogSpec] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _encoded: typing.Optional[EncodedSpec] = field(
+        default=None, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def _get_registry(self):
+        return get_registry(
+            self.context.schema_url, const.SCHEMA_TTL, const.SCHEMA_MAX_STALE
+        )
 
     def _get_types(self) -> typing.Iterator[Type]:
-        return map(
-            Type,
-            (
-                fetch_schema(s)
-                for s in schema_defs_from_url(self.context.schema_url).values()
-            ),
+        return (
+            Type.from_registry(self.context.schema_url, catalog)
+            for catalog in self._get_registry().all()
         )
 
-    def create_openapi_spec(self):
-        openapi = OpenAPI(info=Info(title="OpenAPI Amsterdam Schema", version="0.0.1"))
-        mutator = DataClassToOpenAPI(openapi, self.context.compose_uri)
-        for catalog in self._get_types():
+    def _catalog_spec(self, catalog: Type) -> CatalogSpec:
+        catalog_spec = self._catalog_specs.get(catalog.id)
+        # The same Type is returned as long as the schema did not change
+        if catalog_spec is None or catalog_spec.catalog is not catalog:
+            openapi = OpenAPI(info=Info())
+            mutator = DataClassToOpenAPI(openapi, self.context.compose_uri)
             for cls in catalog.tables:
                 mutator(catalog, cls)
-
-        return openapi.dict()
+            spec = openapi.dict()
+            catalog_spec = CatalogSpec(
+                catalog,
+                spec.get("paths", {}),
+                spec.get("components", {}).get("schemas", {}),
+            )
+            self._catalog_specs[catalog.id] = catalog_spec
+        return catalog_spec
+
+    def create_openapi_spec(self, catalogs=None):
+        spec = OpenAPI(
+            info=Info(title="OpenAPI Amsterdam Schema", version="0.0.1")
+        ).dict()
+        paths, schemas = {}, {}
+        for catalog in catalogs if catalogs is not None else self._get_types():
+            catalog_spec = self._catalog_spec(catalog)
+            paths.update(catalog_spec.paths)
+            schemas.update(catalog_spec.schemas)
+        if schemas:
+            spec["components"] = {"schemas": schemas}
+        if paths:
+            spec["paths"] = paths
+        return spec
+
+    def encoded_openapi_spec(self) -> EncodedSpec:
+        """ The spec as JSON, only rebuilt when the registry has changed """
+        catalogs = list(self._get_types())
+        key = (self._get_registry().generation, tuple(c.id for c in catalogs))
+        encoded = self._encoded
+        if encoded is not None and encoded.key == key:
+            return encoded
+        with self._lock:
+            if self._encoded is None or self._encoded.key != key:
+                body = json.dumps(
+                    self.create_openapi_spec(catalogs), sort_keys=True
+                ).encode()
+                etag = hashlib.sha1(body).hexdigest()
+                self._encoded = EncodedSpec(key, body, etag)
+            return self._encoded
@@ -0,0 +1,193 @@
+"""
+Search over all collections at once (NL-API API-38)
+
+    GET /api/_zoek?near=4.89,52.37&distance=500
+    GET /api/_zoek?q=Amster&collections=example:steden,gebieden
+
+Every collection is queried on its own pooled connection, concurrently. The
+time budget of a collection starts when its query starts, a query that waits
+in the queue of the executor is not charged for it. The results are merged
+on distance, or on text score, while the response streams, and carry the
+name of their collection as `type`. Collections that do not answer within
+their budget are reported as timed out, collections whose query did not even
+start within the budget as queued.
+"""
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional
+
+from dataservices.amsterdam_schema.registry import get_registry
+from ..domain.types import Collection, CollectionRef, Resource, Type
+from ..exceptions import InvalidInputException
+from ..infra.sql import SQLStrategy, parse_near
+from .. import const
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by all requests, it bounds the connections used for searching
+_executor = ThreadPoolExecutor(max_workers=const.SEARCH_CONCURRENCY)
+
+
+@dataclass
+class SearchResult:
+    collection: Collection
+    resource: Resource
+    # Distance in meters for a near search, otherwise the text score
+    distance: Optional[float] = None
+    score: Optional[float] = None
+
+    @property
+    def sort_key(self):
+        return self.distance if self.distance is not None else -self.score
+
+
+@dataclass
+class SearchOutcome:
+    """ The collections that gave no results are listed once the results are
+    iterated, they are waited for while merging
+    """
+
+    results: Iterator[SearchResult]
+    timed_out: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    queued: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CollectionSearch:
+    """ The query of one collection on the executor, and when it started """
+
+    collection: Collection
+    future: Optional[Future] = None
+    started: threading.Event = field(default_factory=threading.Event)
+    started_at: Optional[float] = None
+
+
+def parse_limit(limit):
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidInputException()
+    if not 0 < limit <= const.SEARCH_MAX_LIMIT:
+        raise InvalidInputException()
+    return limit
+
+
+@dataclass
+class SearchService:
+    schema_url: str
+    # Returns the SQLAlchemy engine, called in the request context
+    engine_factory: Callable[[], Any]
+
+    def collections(self, names=None) -> List[Collection]:
+        """ All collections, or those of `catalog` or `catalog:collection` names """
+        registry = get_registry(
+            self.schema_url, const.SCHEMA_TTL, const.SCHEMA_MAX_STALE
+        )
+        if names:
+            wanted = {tuple(name.split(":", 1)) for name in names.split(",")}
+            catalogs = list(dict.fromkeys(name[0] for name in wanted))
+        else:
+            wanted, catalogs = None, registry.all()
+        collections = []
+        for catalog in catalogs:
+            for table in Type.from_registry(self.schema_url, catalog).tables:
+                if wanted is None or {(catalog,), (catalog, table["id"])} & wanted:
+                    coll_ref = CollectionRef(catalog, table["id"])
+                    collections.append(Collection(coll_ref, self.schema_url))
+        return collections
+
+    def _search_collection(self, engine, search, **search_params):
+        search.started_at = time.monotonic()
+        search.started.set()
+        timeout_ms = int(const.SEARCH_TIMEOUT * 1000)
+        with engine.connect() as connection:
+            with connection.begin():
+                # Abandoned queries are cancelled by the database
+                connection.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+                strategy = SQLStrategy(search.collection, lambda: connection)
+                return strategy.search(**search_params)
+
+    def _results(self, search, deadline, outcome):
+        """ The results of a collection, waited for within its budget
+
+        A query that did not start before the `deadline` of the request is
+        cancelled, it would not start its budget until the others are done.
+        """
+        collection = search.collection
+        name = self._name(collection)
+        if not search.started.wait(max(0.0, deadline - time.monotonic())):
+            if search.future.cancel():
+                outcome.queued.append(name)
+                return
+            search.started.wait()
+        budget = search.started_at + const.SEARCH_TIMEOUT - time.monotonic()
+        try:
+            rows = search.future.result(timeout=max(0.0, budget))
+        except TimeoutError:
+            outcome.timed_out.append(name)
+            return
+        except Exception:
+            logger.exception("Search in %s failed", name)
+            outcome.failed.append(name)
+            return
+        for row in rows:
+            yield SearchResult(
+                collection,
+                Resource(collection, row),
+                row.get("_distance"),
+                row.get("_score"),
+            )
+
+    def _merged(self, searches, deadline, outcome):
+        # Every list is ordered already, merging them keeps that order
+        yield from heapq.merge(
+            *[self._results(search, deadline, outcome) for search in searches],
+            key=lambda result: result.sort_key,
+        )
+        outcome.timed_out.sort()
+        outcome.failed.sort()
+        outcome.queued.sort()
+
+    def search(
+        self, q=None, limit=const.SEARCH_LIMIT, collections=None, **params
+    ) -> SearchOutcome:
+        """ The outcome is returned before the collections have answered, its
+        results are merged as the response streams
+        """
+        near = parse_near(params) if "near" in params else None
+        if near is None and not q:
+            raise InvalidInputException()
+        limit = parse_limit(limit)
+        engine = self.engine_factory()
+        deadline = time.monotonic() + const.SEARCH_TIMEOUT
+        searches = []
+        for collection in self.collections(collections):
+            strategy = SQLStrategy(collection, None)
+            if (near and strategy.geometry is None) or (
+                q and not strategy.text_fields()
+            ):
+                continue
+            search = CollectionSearch(collection)
+            search.future = _executor.submit(
+                self._search_collection,
+                engine,
+                search,
+                srid=const.DB_SRID,
+                limit=limit,
+                q=q,
+                near=near,
+            )
+            searches.append(search)
+        outcome = SearchOutcome(iter(()))
+        outcome.results = self._merged(searches, deadline, outcome)
+        return outcome
+
+    @staticmethod
+    def _name(collection):
+        return f"{collection.coll_ref.catalog}:{collection.coll_ref.collection}"
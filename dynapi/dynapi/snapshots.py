@@ -0,0 +1,68 @@
+"""
+Download snapshots of whole collections, shared by the WSGI and the ASGI app
+
+schema ingest writes a snapshot of a table in every format after an ingest, as
+`<SNAPSHOT_PATH>/<dataset>/<table>/<version>.<format>`, see `schema_ingest.snapshots`.
+The snapshot of the current version of a table is served as a file, with
+Range requests for resuming a download. Only the version of the table is read
+from the database. While the snapshot of a new version is written, the newest
+older one is served, flagged as stale.
+"""
+import hashlib
+import json
+import os
+
+from .domain.types import TableVersion
+from .renderers import PARQUET_MIMETYPE
+
+SNAPSHOT_MIMETYPES = {
+    "ndjson.gz": "application/gzip",
+    "csv.gz": "application/gzip",
+    "parquet": PARQUET_MIMETYPE,
+}
+
+
+def snapshot_file(catalog, collection, version, format_):
+    """ Path of the snapshot, relative to SNAPSHOT_PATH """
+    return f"{catalog}/{collection}/{version.version}.{format_}"
+
+
+def download_name(collection, version, format_):
+    return f"{collection}-{version.version}.{format_}"
+
+
+def snapshot_etag(catalog, collection, version, format_):
+    """ Strong ETag, the snapshot of a version is never written again """
+    key = ["snapshot", version.version, catalog, collection, format_]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def latest_snapshot(root, catalog, collection, version, format_):
+    """ Version of the newest snapshot up to the version of the table, None
+    when there is none. An older snapshot has no `updated_at`, the modification
+    time of its file is sent instead.
+    """
+    if os.path.exists(
+        os.path.join(root, snapshot_file(catalog, collection, version, format_))
+    ):
+        return version
+    try:
+        names = os.listdir(os.path.join(root, catalog, collection))
+    except FileNotFoundError:
+        return None
+    suffix = f".{format_}"
+    versions = [
+        int(name[: -len(suffix)])
+        for name in names
+        if name.endswith(suffix) and name[: -len(suffix)].isdigit()
+    ]
+    versions = [v for v in versions if v < version.version]
+    return TableVersion(max(versions), None) if versions else None
+
+
+def snapshot_headers(snapshot, version):
+    """ The version of the snapshot, and whether the table has a newer one """
+    headers = {"Snapshot-Version": str(snapshot.version)}
+    if snapshot.version != version.version:
+        headers["Snapshot-Stale"] = "true"
+    return headers
@@ -1,6 +1,10 @@
 from flask import Blueprint
 from flask import jsonify
 
+from .infra.cache import get_response_cache, get_tile_cache
+from .infra.db import observed_sorts
+from .infra.prepared import statement_timings
+
 
 status = Blueprint("status", __name__)
 
@@ -8,3 +12,38 @@ status = Blueprint("status", __name__)
 @status.route("/health")
 def health():
     return jsonify({"status": "OK"})
+
+
+@status.route("/sorts")
+def sorts():
+    """ Requested sort orders, input for `schema ingest indexes` """
+    return jsonify(
+        [
+            {"catalog": catalog, "collection": collection, "sorteer": sort, "count": n}
+            for (catalog, collection, sort), n in observed_sorts.most_common()
+        ]
+    )
+
+
+def cache_stats(cache):
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+
+@status.route("/cache")
+def cache():
+    """ Hits, misses and evictions of the response cache """
+    return cache_stats(get_response_cache())
+
+
+@status.route("/tiles")
+def tiles():
+    """ Hits, misses and evictions of the vector tile cache """
+    return cache_stats(get_tile_cache())
+
+
+@status.route("/statements")
+def statements():
+    """ Prepare and execution times per statement, of this process """
+    return jsonify(statement_timings.stats())
@@ -0,0 +1,56 @@
+"""
+HTTP validators (RFC 7232), shared by the WSGI and the ASGI app
+
+The validators of a representation are derived from the version of its table,
+see `SQLStrategy.version`, so a conditional request only reads that version.
+"""
+import hashlib
+import json
+
+
+def make_etag(
+    request, version, content_type, srid, json_format, encoding=None, **kwargs
+):
+    """ Strong ETag of a representation, it changes with every import and with
+    every change of the dataset schema. Every content encoding is a
+    representation of its own.
+    """
+    key = [
+        version.version,
+        version.schema_version,
+        content_type,
+        srid,
+        json_format,
+        encoding,
+        sorted(kwargs.items()),
+        sorted(request.args.items(multi=True)),
+    ]
+    return hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+
+
+def is_not_modified(request, etag, version):
+    """ If-None-Match takes precedence over If-Modified-Since (RFC 7232) """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if_modified_since = request.if_modified_since
+    return if_modified_since is not None and version.updated_at <= if_modified_since
+
+
+# Request headers a document or collection is negotiated on, besides the query
+NEGOTIATED_HEADERS = ("Accept", "Accept-Crs", "Accept-Encoding")
+
+
+def set_vary(response):
+    """ Tells shared caches which request headers select the representation """
+    response.vary.update(NEGOTIATED_HEADERS)
+    return response
+
+
+def set_validators(response, etag, version):
+    response.set_etag(etag)
+    response.last_modified = version.updated_at
+    # Caches may store the response, but have to revalidate it
+    response.cache_control.no_cache = True
+    # The validators differ per content encoding
+    response.vary.add("Accept-Encoding")
+    return response
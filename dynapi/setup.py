@@ -19,5 +19,11 @@ setup(
         "sentry-sdk[flask]",
         "pint",
     ],
-    extras_require={"tests": ["pytest"]},
+    extras_require={
+        "tests": ["pytest"],
+        # asgi.download_handler uses the send_from_directory of Quart 0.18
+        "asgi": ["quart>=0.18.4,<0.19", "asyncpg", "uvicorn"],
+        "compression": ["brotli", "zstandard"],
+        "columnar": ["pyarrow"],
+    },
 )
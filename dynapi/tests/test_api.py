@@ -1,6 +1,6 @@
 from dynapi import app
 
-class MockDynAPI(app.DynAPI)
+class MockDynAPI(app.DynAPI):
     pass
 
 
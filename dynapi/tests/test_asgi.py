@@ -0,0 +1,155 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from dynapi import asgi, const
+from dynapi.domain.types import RowType, Type
+
+
+NAMES = ["id", "naam"]
+
+ROWS = [{"id": f"{i:02}", "naam": f"stad {i}"} for i in range(5)]
+
+UPDATED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def class_info(cls, schema_url, catalog, collection):
+    specs = {"id": {"type": "string"}, "naam": {"type": "string"}}
+    return "id", NAMES, RowType(NAMES), None, specs, {}
+
+
+class FakeConnection:
+    """ Answers the statements of `AsyncSQLStrategy` """
+
+    async def fetch(self, sql, *args):
+        if "to_regclass" in sql:
+            return [{"found": True}]
+        if "table_versions" in sql:
+            return [{"version": 3, "updated_at": UPDATED_AT, "row_count": None}]
+        rows = ROWS
+        if '"id" = $1' in sql:
+            rows = [row for row in rows if row["id"] == args[0]]
+        elif '("id") > ($1)' in sql:
+            rows = [row for row in rows if row["id"] > args[0]]
+        if "LIMIT" in sql:
+            rows = rows[: args[-1]]
+        return rows
+
+
+class FakePool:
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return FakeConnection()
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Type, "fetch_class_info", classmethod(class_info))
+    monkeypatch.setattr(asgi.app, "pool", FakePool())
+    return asgi.app.test_client()
+
+
+def get(client, path, headers=None):
+    async def run():
+        response = await client.get(path, headers=headers)
+        return response, await response.get_data()
+
+    return asyncio.run(run())
+
+
+def test_collection_page(client):
+    response, body = get(client, "/api/example/steden?page_size=2")
+    assert response.status_code == 200
+    body = json.loads(body)
+    assert [row["id"] for row in body["_embedded"]["steden"]] == ["00", "01"]
+    assert "next" in body["_links"]
+    assert response.headers["ETag"]
+    next_href = body["_links"]["next"]["href"]
+    _, body = get(client, "/api/example/steden" + next_href.partition("steden")[2])
+    assert [row["id"] for row in json.loads(body)["_embedded"]["steden"]] == [
+        "02",
+        "03",
+    ]
+
+
+def test_document(client):
+    response, body = get(client, "/api/example/steden/03")
+    assert response.status_code == 200
+    assert json.loads(body)["naam"] == "stad 3"
+    response, _ = get(client, "/api/example/steden/99")
+    assert response.status_code == 404
+
+
+def test_not_modified(client):
+    response, _ = get(client, "/api/example/steden?page_size=2")
+    etag = response.headers["ETag"]
+    response, body = get(
+        client, "/api/example/steden?page_size=2", {"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert body == b""
+
+
+def test_class_info_is_fetched_off_the_event_loop(client, monkeypatch):
+    threads = []
+
+    def recorded_class_info(cls, *args):
+        threads.append(threading.get_ident())
+        return class_info(cls, *args)
+
+    monkeypatch.setattr(Type, "fetch_class_info", classmethod(recorded_class_info))
+    response, _ = get(client, "/api/example/steden/03")
+    assert response.status_code == 200
+    assert threads and threading.get_ident() not in threads
+
+
+def test_invalid_input(client):
+    response, _ = get(client, "/api/example/steden?page_size=x")
+    assert response.status_code == 400
+
+
+def test_download_is_resumed(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "SNAPSHOT_PATH", str(tmp_path))
+    path = tmp_path / "example" / "steden" / "3.csv.gz"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"0123456789")
+    response, body = get(client, "/api/example/steden/_download.csv.gz")
+    assert response.status_code == 200
+    assert body == b"0123456789"
+    assert response.headers["Content-Disposition"] == (
+        "attachment; filename=steden-3.csv.gz"
+    )
+    assert response.headers["Snapshot-Version"] == "3"
+    etag = response.headers["ETag"]
+    response, body = get(
+        client, "/api/example/steden/_download.csv.gz", {"Range": "bytes=4-"}
+    )
+    assert response.status_code == 206
+    assert body == b"456789"
+    assert response.headers["Content-Range"] == "bytes 4-9/10"
+    response, _ = get(
+        client, "/api/example/steden/_download.csv.gz", {"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    response, _ = get(client, "/api/example/steden/_download.parquet")
+    assert response.status_code == 404
+
+
+def test_older_snapshot_is_downloaded(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "SNAPSHOT_PATH", str(tmp_path))
+    path = tmp_path / "example" / "steden" / "2.csv.gz"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"0123456789")
+    response, body = get(client, "/api/example/steden/_download.csv.gz")
+    assert response.status_code == 200
+    assert body == b"0123456789"
+    assert response.headers["Snapshot-Version"] == "2"
+    assert response.headers["Snapshot-Stale"] == "true"
@@ -0,0 +1,82 @@
+import json
+
+import flask
+import pytest
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.db import Batch, EntityRepository, parse_ids
+from dynapi.renderers import (
+    JSONRenderer,
+    NDJSONRenderer,
+    batch_body_params,
+    missing_header,
+)
+
+
+NAMES = ["id", "naam"]
+
+
+def make_collection(id_type="string"):
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=None,
+        specs={"id": {"type": id_type}, "naam": {"type": "string"}},
+    )
+
+
+class FakeStrategy:
+    """ Returns the rows with the ids, in another order than asked for """
+
+    def get_many(self, ids, **get_args):
+        return [{"id": id_, "naam": f"stad {id_}"} for id_ in sorted(ids) if id_ < 5]
+
+
+def test_ids_are_cast_and_deduplicated():
+    assert parse_ids("3,1,3", int) == [3, 1]
+    assert parse_ids(["a", 1], str) == ["a", "1"]
+
+
+@pytest.mark.parametrize("ids", ["", [], "1,x", [True], [[1]], {"id": 1}, None])
+def test_invalid_ids(ids):
+    with pytest.raises(InvalidInputException):
+        parse_ids(ids, int)
+
+
+def test_too_many_ids(monkeypatch):
+    monkeypatch.setattr(const, "BATCH_MAX_IDS", 2)
+    with pytest.raises(InvalidInputException):
+        parse_ids("1,2,3", int)
+
+
+def test_batch_is_in_the_order_of_the_ids():
+    repo = EntityRepository(make_collection("integer"), FakeStrategy())
+    batch = repo.get_many("4,9,1,4")
+    assert [resource.fields.id for resource in batch] == [4, 1]
+    assert batch.missing == [9]
+
+
+def test_missing_ids_are_listed():
+    batch = Batch(make_collection(), ["b", "a/1", "c"], [{"id": "c", "naam": "C"}])
+    app = flask.Flask(__name__)
+    with app.test_request_context("/api/example/steden/_batch?ids=b,a/1,c"):
+        body = json.loads("".join(JSONRenderer(True).rendered_batch(batch).parts))
+        rendered = NDJSONRenderer(True).rendered_batch(batch)
+    assert [resource["id"] for resource in body["_embedded"]["steden"]] == ["c"]
+    assert body["_missing"] == ["b", "a/1"]
+    assert rendered.headers["Missing-Ids"] == missing_header(batch) == "b,a%2F1"
+
+
+@pytest.mark.parametrize("body", [None, [], {"ids": "a,b"}, {"id": ["a"]}])
+def test_invalid_body(body):
+    with pytest.raises(InvalidInputException):
+        batch_body_params(body, {})
+
+
+def test_posted_ids():
+    assert batch_body_params({"ids": ["a", 1]}, {}) == {"ids": ["a", 1]}
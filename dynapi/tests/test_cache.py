@@ -0,0 +1,63 @@
+import pytest
+
+from dynapi.infra.cache import ResponseCache
+
+
+HEADERS = [("Content-Type", "application/json")]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache.db"), 100, 50, flush_interval=60)
+
+
+def test_stored_response_is_hit(cache):
+    assert cache.get("a") is None
+    cache.put("a", "example", "steden", 1, HEADERS, b"body")
+    cached = cache.get("a")
+    assert cached.headers == HEADERS
+    assert cached.body == b"body"
+
+
+def test_large_body_is_not_stored(cache):
+    cache.put("a", "example", "steden", 1, HEADERS, b"x" * 51)
+    assert cache.get("a") is None
+
+
+def test_new_version_removes_the_older_versions_of_the_table(cache):
+    cache.put("a", "example", "steden", 1, HEADERS, b"a")
+    cache.put("b", "example", "buurten", 1, HEADERS, b"b")
+    cache.put("c", "example", "steden", 2, HEADERS, b"c")
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.get("c") is not None
+
+
+def test_least_recently_used_is_evicted(cache):
+    cache.put("a", "example", "steden", 1, HEADERS, b"x" * 40)
+    cache.put("b", "example", "steden", 1, HEADERS, b"x" * 40)
+    cache.get("a")
+    cache.flush()
+    cache.put("c", "example", "steden", 1, HEADERS, b"x" * 40)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hits_are_counted_when_flushed(cache):
+    cache.put("a", "example", "steden", 1, HEADERS, b"body")
+    cache.get("a")
+    cache.get("b")
+    counts = dict(cache._connection().execute("SELECT name, value FROM metrics"))
+    assert counts == {"stores": 1}
+    cache.flush()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+    assert (stats["entries"], stats["bytes"]) == (1, 4)
+
+
+def test_workers_share_the_cache(cache):
+    other = ResponseCache(cache.path, 100, 50)
+    cache.put("a", "example", "steden", 1, HEADERS, b"body")
+    assert other.get("a").body == b"body"
@@ -0,0 +1,91 @@
+import io
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from dynapi import columnar, const  # NoQA
+from dynapi.domain.types import Collection, CollectionRef, Resource, RowType  # NoQA
+from dynapi.infra.db import Page  # NoQA
+from dynapi.renderers import ArrowRenderer, GeoParquetRenderer  # NoQA
+
+
+NAMES = ["id", "inwoners", "oppervlakte", "gesticht", "tags", "geometry"]
+
+# WKB of POINT (1 2)
+POINT = bytes.fromhex("0101000000000000000000f03f0000000000000040")
+
+ROWS = [
+    ("a", 10, Decimal("1.5"), date(1275, 10, 27), ["x"], POINT),
+    ("b", None, None, None, None, None),
+]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        specs={
+            "id": {"type": "string"},
+            "inwoners": {"type": "integer"},
+            "oppervlakte": {"type": "number"},
+            "gesticht": {"type": "string", "format": "date"},
+            "tags": {"type": "array"},
+            "geometry": {"$ref": "https://geojson.org/schema/Point.json"},
+        },
+    )
+
+
+def test_arrow_stream_roundtrip():
+    parts = columnar.iter_arrow_stream(make_collection(), [ROWS[:1], ROWS[1:]])
+    body = b"".join(parts)
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.schema.names == NAMES
+    assert table.column("inwoners").type == pa.int64()
+    assert table.column("gesticht").type == pa.date32()
+    assert table.to_pylist()[0] == {
+        "id": "a",
+        "inwoners": 10,
+        "oppervlakte": 1.5,
+        "gesticht": date(1275, 10, 27),
+        "tags": '["x"]',
+        "geometry": POINT,
+    }
+    assert table.to_pylist()[1]["inwoners"] is None
+
+
+def test_geoparquet_has_a_row_group_per_batch():
+    parts = columnar.iter_geoparquet(make_collection(), [ROWS[:1], ROWS[1:]], 4326)
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(parts)))
+    assert parquet.metadata.num_row_groups == 2
+    geo = json.loads(parquet.schema_arrow.metadata[b"geo"])
+    assert geo["primary_column"] == "geometry"
+    assert geo["columns"]["geometry"]["geometry_types"] == ["Point"]
+    assert geo["columns"]["geometry"]["crs"]["id"]["code"] == 4326
+
+
+def test_unpaged_list_is_streamed_in_batches(monkeypatch):
+    monkeypatch.setattr(const, "FETCH_SIZE", 1)
+    page = Page(make_collection(), iter(ROWS), None)
+    rendered = ArrowRenderer(True, srid=28992).rendered(page)
+    assert "Link" not in rendered.headers
+    assert rendered.binary and rendered.stream
+    table = pa.ipc.open_stream(b"".join(rendered.parts)).read_all()
+    assert table.num_rows == 2
+
+
+def test_single_resource():
+    row = dict(zip(NAMES, ROWS[0]))
+    rendered = GeoParquetRenderer(False, srid=28992).rendered(
+        Resource(make_collection(), row)
+    )
+    table = pq.read_table(io.BytesIO(b"".join(rendered.parts)))
+    assert table.column("id").to_pylist() == ["a"]
+    assert rendered.headers["Content-Disposition"].endswith("output.parquet")
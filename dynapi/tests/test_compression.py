@@ -0,0 +1,97 @@
+import gzip
+import zlib
+
+import pytest
+
+from dynapi import compression, const
+from dynapi.compression import compressed, compressible, split_head
+
+
+def test_split_head():
+    head, rest = split_head([b"ab", b"cd", b"ef", b"gh"], 3)
+    assert head == [b"ab", b"cd"]
+    assert list(rest) == [b"ef", b"gh"]
+
+
+def test_split_head_of_a_short_body():
+    assert split_head([b"ab", b"cd"], 5) == ([b"ab", b"cd"], None)
+    assert split_head([], 5) == ([], None)
+
+
+def test_short_body_is_sent_as_it_is(monkeypatch):
+    monkeypatch.setattr(const, "COMPRESSION_MIN_SIZE", 100)
+    chunks, encoding = compressed(iter([b"a" * 10, b"b" * 10]), "gzip")
+    assert encoding is None
+    assert b"".join(chunks) == b"a" * 10 + b"b" * 10
+
+
+def test_body_is_compressed_chunk_by_chunk(monkeypatch):
+    monkeypatch.setattr(const, "COMPRESSION_MIN_SIZE", 10)
+    body = [b'{"id": "%02d"}\n' % i for i in range(50)]
+    chunks, encoding = compressed(iter(body), "gzip")
+    assert encoding == "gzip"
+    chunks = list(chunks)
+    # Every chunk is flushed, a client decodes it as it arrives
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decoder.decompress(chunks[0]) == body[0]
+    assert gzip.decompress(b"".join(chunks)) == b"".join(body)
+
+
+def test_minimum_size_per_content_type(monkeypatch):
+    monkeypatch.setattr(const, "COMPRESSION_MIN_SIZE", 100)
+    monkeypatch.setattr(
+        const, "COMPRESSION_MIN_SIZES", {"text/csv": 10, "image/png": -1}
+    )
+    body = [b"a" * 10, b"b" * 10]
+    _, encoding = compressed(iter(body), "gzip", "text/csv")
+    assert encoding == "gzip"
+    _, encoding = compressed(iter(body), "gzip", "application/json")
+    assert encoding is None
+    assert compressible("text/csv")
+    assert not compressible("image/png")
+
+
+def test_level_per_content_type(monkeypatch):
+    monkeypatch.setattr(const, "COMPRESSION_MIN_SIZE", 10)
+    monkeypatch.setattr(const, "GZIP_LEVEL", 6)
+    monkeypatch.setattr(const, "COMPRESSION_LEVELS", {"text/csv:gzip": 1})
+    levels = []
+    monkeypatch.setattr(
+        compression,
+        "ENCODERS",
+        {"gzip": lambda level: levels.append(level) or compression.GzipEncoder(level)},
+    )
+    body = [b"row %d\n" % i for i in range(50)]
+    for mimetype in ["text/csv", "application/json"]:
+        chunks, _ = compressed(iter(body), "gzip", mimetype)
+        assert gzip.decompress(b"".join(chunks)) == b"".join(body)
+    assert levels == [1, 6]
+
+
+@pytest.mark.parametrize("encoding", ["br", "zstd"])
+def test_other_encodings_roundtrip(monkeypatch, encoding):
+    if compression.ENCODERS[encoding] is None:
+        pytest.skip(f"{encoding} is not installed")
+    monkeypatch.setattr(const, "COMPRESSION_MIN_SIZE", 10)
+    body = [b"row %d\n" % i for i in range(100)]
+    chunks, _ = compressed(iter(body), encoding)
+    data = b"".join(chunks)
+    if encoding == "br":
+        import brotli
+
+        assert brotli.decompress(data) == b"".join(body)
+    else:
+        import zstandard
+
+        decoder = zstandard.ZstdDecompressor().decompressobj()
+        assert decoder.decompress(data) == b"".join(body)
+
+
+def test_overrides_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("COMPRESSION_LEVELS", "text/csv:zstd=9, application/json:br=4")
+    assert const._int_overrides("COMPRESSION_LEVELS") == {
+        "text/csv:zstd": 9,
+        "application/json:br": 4,
+    }
+    monkeypatch.delenv("COMPRESSION_LEVELS")
+    assert const._int_overrides("COMPRESSION_LEVELS") == {}
@@ -0,0 +1,119 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, Count, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra import sql
+from dynapi.infra.db import Page, parse_count
+from dynapi.infra.sql import SQLStrategy
+from dynapi.renderers import count_headers, page_meta
+
+
+NAMES = ["id", "naam"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=None,
+        specs={"naam": {"type": "string"}},
+    )
+
+
+class FakeResult:
+    def __init__(self, rows=(), scalar=None):
+        self.rows = list(rows)
+        self._scalar = scalar
+
+    def scalar(self):
+        return self._scalar
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """ A versions table with the `row_count`, the planner estimate and
+    the number of matches of a query
+    """
+
+    def __init__(self, row_count=None, estimate=-1, matches=0):
+        self.row_count = row_count
+        self.estimate = estimate
+        self.matches = matches
+        self.statements = []
+
+    def execute(self, sql_text, args=None):
+        self.statements.append(sql_text)
+        if "to_regclass('" in sql_text:
+            return FakeResult(scalar="meta.table_versions")
+        if "table_versions" in sql_text:
+            version = SimpleNamespace(
+                version=1, updated_at=datetime.now(), row_count=self.row_count
+            )
+            return FakeResult([version])
+        if "reltuples" in sql_text:
+            return FakeResult([{"count": self.estimate}])
+        return FakeResult([{"count": self.matches}])
+
+
+@pytest.fixture(autouse=True)
+def text_statements(monkeypatch):
+    monkeypatch.setattr(const, "PREPARED_STATEMENTS", False)
+    monkeypatch.setattr(sql, "_versions_table_exists", False)
+
+
+def count(con, **filter_params):
+    return SQLStrategy(make_collection(), lambda: con).count(**filter_params)
+
+
+def test_parse_count():
+    assert parse_count(None) is False
+    assert parse_count("True") is True
+    assert parse_count("false") is False
+    with pytest.raises(InvalidInputException):
+        parse_count("ja")
+
+
+def test_collection_is_counted_by_schema_ingest():
+    con = FakeConnection(row_count=1234)
+    assert count(con) == Count(1234)
+    assert not any("count(*)" in statement for statement in con.statements)
+
+
+def test_collection_size_is_estimated_without_a_row_count():
+    assert count(FakeConnection(estimate=5000)) == Count(5000, exact=False)
+
+
+def test_collection_is_counted_without_statistics():
+    assert count(FakeConnection(matches=3)) == Count(3)
+
+
+def test_matches_are_counted(monkeypatch):
+    monkeypatch.setattr(const, "COUNT_MAX", 10)
+    con = FakeConnection(row_count=1234, matches=4)
+    assert count(con, naam="Amsterdam") == Count(4)
+    assert "LIMIT" in con.statements[-1]
+    assert count(FakeConnection(matches=11), naam="a") == Count(10, False, True)
+
+
+def test_count_is_rendered():
+    page = Page(make_collection(), [], 10)
+    assert page_meta(page) is None and count_headers(page) == {}
+    page.count = Count(10, exact=False)
+    assert page_meta(page) == {"count": 10, "exact": False, "capped": False}
+    assert count_headers(page) == {
+        "Total-Count": "10",
+        "Total-Count-Exact": "false",
+    }
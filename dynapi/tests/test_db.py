@@ -0,0 +1,97 @@
+import pytest
+
+from dataservices.amsterdam_schema.sorting import SortKey
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.db import (
+    EntityRepository,
+    decode_cursor,
+    encode_cursor,
+    parse_key,
+)
+
+
+NAMES = ["id", "naam", "gesticht", "geometry"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        specs={
+            "id": {"type": "string"},
+            "naam": {"type": "string"},
+            "gesticht": {"type": "string", "format": "date"},
+        },
+    )
+
+
+class FakeStrategy:
+    def __init__(self, rows):
+        self.rows = rows
+        self.list_args = None
+
+    def list(self, limit=None, **list_args):
+        self.list_args = list_args
+        return iter(self.rows[:limit])
+
+
+def make_repo(n_rows=5):
+    rows = [
+        {"id": f"{i:02}", "naam": f"stad {i}", "gesticht": None, "geometry": None}
+        for i in range(n_rows)
+    ]
+    return EntityRepository(make_collection(), FakeStrategy(rows))
+
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor("next", ["Amsterdam", None, "03"])
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("next", ["Amsterdam", None, "03"])
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["", "not base64!", encode_cursor("sideways", ["03"]), encode_cursor("next", "03")],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidInputException):
+        decode_cursor(cursor)
+
+
+def test_parse_key_types_dates():
+    sort_keys = [SortKey("gesticht"), SortKey("id")]
+    key = parse_key(make_collection(), sort_keys, ["1275-10-27", "03"])
+    assert str(key[0]) == "1275-10-27" and key[1] == "03"
+    assert parse_key(make_collection(), sort_keys, [None, "03"]) == [None, "03"]
+    with pytest.raises(InvalidInputException):
+        parse_key(make_collection(), sort_keys, ["27 oktober", "03"])
+    with pytest.raises(InvalidInputException):
+        parse_key(make_collection(), sort_keys, ["03"])
+
+
+def test_pages_link_to_each_other():
+    repo = make_repo()
+    page = repo.list(page_size=2)
+    assert [row["id"] for row in page.iter_rows()] == ["00", "01"]
+    assert page.prev_cursor is None
+    assert decode_cursor(page.next_cursor) == ("next", ["01"])
+
+    page = repo.list(page_size=2, cursor=page.next_cursor)
+    list(page.iter_rows())
+    assert repo.data_strategy.list_args["after"] == ["01"]
+    assert decode_cursor(page.prev_cursor) == ("prev", ["00"])
+
+
+def test_near_search_has_no_cursors():
+    repo = make_repo()
+    page = repo.list(page_size=2, near="4.89,52.37", distance="500")
+    assert len(list(page.iter_rows())) == 2
+    assert page.next_cursor is None and page.prev_cursor is None
+    # The cursors of a near search would be rejected
+    cursor = encode_cursor("next", ["01"])
+    with pytest.raises(InvalidInputException):
+        repo.list(page_size=2, near="4.89,52.37", distance="500", cursor=cursor)
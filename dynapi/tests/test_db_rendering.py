@@ -0,0 +1,79 @@
+import flask
+from dataservices.amsterdam_schema.sorting import SortKey
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, Resource, RowType
+from dynapi.infra.db import Page, decode_cursor
+from dynapi.infra.sql import Query, SQLStrategy
+from dynapi.renderers import JSONRenderer, NDJSONRenderer, negotiate
+
+
+NAMES = ["id", "naam"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=None,
+    )
+
+
+def json_statement(json_format):
+    strategy = SQLStrategy(make_collection(), None)
+    return strategy._json_row_statement(const.DB_SRID, json_format, Query())
+
+
+def test_rows_are_rendered_by_postgres():
+    statement = json_statement("row")
+    assert "row_to_json(r)::text AS _json" in statement.sql
+    assert 'r."id" AS _key' in statement.sql
+    rows = [{"_key": "1", "_json": '{"id":"1","naam":"Amsterdam"}'}]
+    assert list(statement.convert(rows)) == [
+        {"id": "1", "_json": '{"id":"1","naam":"Amsterdam"}'}
+    ]
+
+
+def test_documents_get_their_self_link():
+    statement = json_statement("document")
+    assert "json_build_object('self'" in statement.sql
+    assert statement.args[0] == f"{const.URI_PATH_PREFIX}example/steden/"
+
+
+def test_features_leave_out_the_id_of_the_properties():
+    statement = json_statement("feature")
+    assert "'type', 'Feature'" in statement.sql
+    assert statement.args[0] == "id"
+
+
+def test_rendered_json_is_passed_through():
+    raw = '{"id":"1","naam":"Amsterdam","_links":{}}'
+    resource = Resource(make_collection(), {"id": "1", "_json": raw})
+    assert JSONRenderer(False).render_json(resource) == raw
+    assert NDJSONRenderer(False).render(resource) == raw
+
+
+def test_json_format_is_negotiated_with_db_rendering(monkeypatch):
+    app = flask.Flask(__name__)
+    headers = {"Accept": "application/ndjson"}
+    with app.test_request_context("/", headers=headers):
+        assert negotiate(flask.request, True).json_format is None
+        monkeypatch.setattr(const, "DB_RENDERING", True)
+        assert negotiate(flask.request, True).json_format == "row"
+
+
+def test_sort_keys_are_selected_for_the_cursors():
+    statement = SQLStrategy(make_collection(), None).list_statement(
+        json_format="document", sort_keys=[SortKey("naam"), SortKey("id")], limit=2
+    )
+    assert 'r."id" AS _key, r."naam" AS _key0, ' in statement.sql
+    rows = [
+        {"_key": "2", "_key0": "Amsterdam", "_json": "{}"},
+        {"_key": "1", "_key0": "Haarlem", "_json": "{}"},
+    ]
+    page = Page(make_collection(), statement.convert(rows), 1, key_names=["naam", "id"])
+    assert len(list(page)) == 1
+    assert decode_cursor(page.next_cursor) == ("next", ["Amsterdam", "2"])
@@ -0,0 +1,77 @@
+import pytest
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, Relation, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.db import Batch, EntityRepository
+from dynapi.infra.expand import key_chunks, parse_expand
+
+
+def make_collection(name, properties, relations=None):
+    return Collection(
+        CollectionRef("example", name),
+        None,
+        primary_name="id",
+        properties=properties,
+        row_type=RowType(properties),
+        geometry_name=None,
+        relations=relations or {},
+    )
+
+
+PROVINCIES = make_collection("provincies", ["id", "naam"])
+STEDEN = make_collection(
+    "steden",
+    ["id", "ligtInProvincie"],
+    {"ligtInProvincie": Relation(CollectionRef("example", "provincies"))},
+)
+
+
+class FakeProvincies(EntityRepository):
+    """ Every key is a province, the lookups are recorded """
+
+    def __init__(self):
+        super().__init__(PROVINCIES, None)
+        self.lookups = []
+
+    def get_many(self, ids=None, **params):
+        self.lookups.append(ids)
+        assert len(ids) <= const.BATCH_MAX_IDS
+        rows = [{"id": id_, "naam": f"provincie {id_}"} for id_ in ids]
+        return Batch(PROVINCIES, ids, rows)
+
+
+def test_key_chunks():
+    assert key_chunks(["a", "b", "c"], 2) == [["a", "b"], ["c"]]
+    assert key_chunks([], 2) == []
+
+
+def test_expand_looks_up_at_most_batch_max_ids_keys(monkeypatch):
+    monkeypatch.setattr(const, "BATCH_MAX_IDS", 2)
+    provincies = FakeProvincies()
+    steden = EntityRepository(STEDEN, None, lambda catalog, name: provincies)
+    rows = [{"id": f"{i:02}", "ligtInProvincie": f"P{i % 5}"} for i in range(10)]
+    steden.expand(rows, {"ligtInProvincie": {}})
+    assert provincies.lookups == [["P0", "P1"], ["P2", "P3"], ["P4"]]
+    for row in rows:
+        embedded = row["_embedded"]["ligtInProvincie"]
+        assert embedded.fields.values[0] == row["ligtInProvincie"]
+
+
+def test_parse_expand_builds_a_tree():
+    assert parse_expand(None) == {}
+    assert parse_expand("ligtInProvincie, heeftBezienswaardigheden") == {
+        "ligtInProvincie": {},
+        "heeftBezienswaardigheden": {},
+    }
+    assert parse_expand("ligtInProvincie.hoofdstad,ligtInProvincie") == {
+        "ligtInProvincie": {"hoofdstad": {}}
+    }
+
+
+@pytest.mark.parametrize("expand", ["a..b", "a,", "a.b.c", "a,b,c,d,e,f"])
+def test_parse_expand_limits(monkeypatch, expand):
+    monkeypatch.setattr(const, "EXPAND_MAX_DEPTH", 2)
+    monkeypatch.setattr(const, "EXPAND_MAX_RELATIONS", 5)
+    with pytest.raises(InvalidInputException):
+        parse_expand(expand)
@@ -0,0 +1,57 @@
+import pytest
+
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.sql import SQLStrategy
+
+
+NAMES = ["id", "naam", "inwoners", "geometry"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+    )
+
+
+def test_projection_keeps_the_primary_key_first():
+    projected = make_collection().project("inwoners, naam,naam")
+    assert projected.properties == ["id", "inwoners", "naam"]
+    assert projected.row_type.names == ("id", "inwoners", "naam")
+
+
+def test_projection_adds_the_required_fields():
+    projected = make_collection().project("naam", required=["inwoners"])
+    assert projected.properties == ["id", "inwoners", "naam"]
+
+
+def test_no_fields_is_the_whole_collection():
+    collection = make_collection()
+    assert collection.project(None) is collection
+    assert collection.project("") is collection
+
+
+def test_unknown_field_is_invalid():
+    with pytest.raises(InvalidInputException):
+        make_collection().project("naam,onbekend")
+
+
+def test_only_the_projected_columns_are_selected():
+    collection = make_collection().project("naam")
+    statement = SQLStrategy(collection, None).list_statement(
+        fields=collection.properties
+    )
+    assert statement.sql.startswith('SELECT "id", "naam" FROM example.steden')
+
+
+def test_geometry_is_selected_as_rendered():
+    statement = SQLStrategy(make_collection(), None).list_statement(
+        fields=["id", "geometry"]
+    )
+    assert statement.sql.startswith(
+        'SELECT "id", ST_AsGeoJSON(ST_Transform("geometry", 28992)) AS "geometry"'
+    )
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.filters import Filter, parse_filters
+from dynapi.infra.sql import Query, SQLStrategy
+
+
+NAMES = ["id", "naam", "inwoners", "oppervlakte", "hoofdstad", "geometry"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        specs={
+            "id": {"$ref": "https://schemas.data.amsterdam.nl/schema@v1.1.0#/id"},
+            "naam": {"type": "string"},
+            "inwoners": {"type": "integer"},
+            "oppervlakte": {"type": "number"},
+            "hoofdstad": {"type": "boolean"},
+            "geometry": {"$ref": "https://geojson.org/schema/Point.json"},
+        },
+    )
+
+
+def test_values_are_cast_to_the_field_type():
+    params = {
+        "naam": "Amsterdam",
+        "inwoners[gte]": "100000",
+        "oppervlakte[lt]": "219.5",
+        "hoofdstad": "True",
+        "id[in]": "1,2",
+    }
+    assert parse_filters(make_collection(), params) == [
+        Filter("naam", "eq", "Amsterdam"),
+        Filter("inwoners", "gte", 100000),
+        Filter("oppervlakte", "lt", 219.5),
+        Filter("hoofdstad", "eq", True),
+        Filter("id", "in", ["1", "2"]),
+    ]
+
+
+def test_other_params_are_no_filters():
+    params = {"near": "4.9,52.3", "distance": "50", "bbox": "1,2,3,4", "precision": "2"}
+    assert parse_filters(make_collection(), params) == []
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"onbekend": "x"},
+        {"naam[like]": "A%"},
+        {"naam[eq": "Amsterdam"},
+        {"inwoners": "veel"},
+        {"inwoners[in]": "1,twee"},
+        {"hoofdstad": "ja"},
+        {"inwoners[prefix]": "1"},
+        {"geometry": "POINT(1 2)"},
+    ],
+)
+def test_invalid_filters(params):
+    with pytest.raises(InvalidInputException):
+        parse_filters(make_collection(), params)
+
+
+def compiled(**params):
+    query = Query()
+    SQLStrategy(make_collection(), None).add_filter_clauses(query, **params)
+    return query.where, query.where_args
+
+
+def test_filter_sql():
+    assert compiled(**{"naam": "Amsterdam", "inwoners[in]": "1,2"}) == (
+        ['"naam" = %s', '"inwoners" = ANY(%s)'],
+        ["Amsterdam", [1, 2]],
+    )
+
+
+def test_prefix_is_escaped():
+    assert compiled(**{"naam[prefix]": "100%_a\\"}) == (
+        ['"naam" LIKE %s'],
+        ["100\\%\\_a\\\\%"],
+    )
+
+
+@pytest.mark.parametrize(
+    "param, value, expected",
+    [
+        ("inwoners", "20", ["b"]),
+        ("inwoners[gt]", "20", ["c"]),
+        ("inwoners[gte]", "20", ["b", "c"]),
+        ("inwoners[lt]", "20", ["a"]),
+        ("inwoners[lte]", "20", ["a", "b"]),
+    ],
+)
+def test_comparisons_select_the_matching_rows(param, value, expected):
+    con = sqlite3.connect(":memory:")
+    con.execute('CREATE TABLE steden ("naam" text, "inwoners" integer)')
+    rows = [("a", 10), ("b", 20), ("c", 30)]
+    con.executemany("INSERT INTO steden VALUES (?, ?)", rows)
+    where, args = compiled(**{param: value})
+    sql = f"SELECT naam FROM steden WHERE {' AND '.join(where)} ORDER BY naam"
+    assert [row[0] for row in con.execute(sql.replace("%s", "?"), args)] == expected
@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.geo import (
+    SUBDIVIDE_VERTICES,
+    GeoQuery,
+    parse_bbox,
+    parse_srid,
+)
+from dynapi.infra.sql import Query, SQLStrategy
+from dynapi.renderers import geo_body_params
+
+
+NAMES = ["id", "naam", "geometry"]
+
+POINT = {"type": "Point", "coordinates": [4.9, 52.37]}
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+
+
+def make_strategy(geometry_name="geometry"):
+    collection = Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=geometry_name,
+    )
+    return SQLStrategy(collection, None)
+
+
+def test_parse_bbox():
+    assert parse_bbox("4.85,52.33,4.95,52.4") == [4.85, 52.33, 4.95, 52.4]
+
+
+@pytest.mark.parametrize("bbox", ["1,2,3", "1,2,3,x", "3,2,1,4", "1,4,3,2"])
+def test_invalid_bbox(bbox):
+    with pytest.raises(InvalidInputException):
+        parse_bbox(bbox)
+
+
+@pytest.mark.parametrize(
+    "crs, srid",
+    [
+        (None, 4326),
+        ("EPSG:28992", 28992),
+        ("28992", 28992),
+        ("http://www.opengis.net/def/crs/EPSG/0/4258", 4258),
+    ],
+)
+def test_parse_srid(crs, srid):
+    assert parse_srid(crs) == srid
+
+
+@pytest.mark.parametrize("crs", ["EPSG:", "EPSG:x", "EPSG:1"])
+def test_invalid_srid(crs):
+    with pytest.raises(InvalidInputException):
+        parse_srid(crs)
+
+
+def test_posted_geometry():
+    geo_query = GeoQuery.from_body({"_geo": {"within": SQUARE}}, "EPSG:28992")
+    assert geo_query.operator == "within"
+    assert json.loads(geo_query.geojson) == SQUARE
+    assert (geo_query.srid, geo_query.n_vertices) == (28992, 5)
+
+
+def test_body_params_take_the_crs_from_the_header():
+    params = geo_body_params({"_geo": {"intersects": POINT}}, {})
+    assert params["_geo"].srid == 4326
+    assert params["_geo"].n_vertices == 1
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        None,
+        [],
+        {"_geo": POINT},
+        {"_geo": {"touches": POINT}},
+        {"_geo": {"intersects": POINT, "within": POINT}},
+        {"_geo": {"intersects": {"type": "Circle", "coordinates": [1, 2]}}},
+        {"_geo": {"intersects": {"type": "Point", "coordinates": [[1, 2]]}}},
+        {"_geo": {"intersects": {"type": "Point", "coordinates": [1, True]}}},
+        {"_geo": {"intersects": {"type": "Polygon", "coordinates": []}}},
+    ],
+)
+def test_invalid_body(body):
+    with pytest.raises(InvalidInputException):
+        GeoQuery.from_body(body)
+
+
+def geo_clauses(**params):
+    query = Query()
+    make_strategy().add_geo_clauses(query, **params)
+    return query.where, query.where_args
+
+
+def test_bbox_clause():
+    where, args = geo_clauses(**{"bbox": "1,2,3,4", "bbox-crs": "EPSG:4258"})
+    assert where == [
+        'ST_Intersects("geometry", (SELECT ST_Transform('
+        "ST_MakeEnvelope(%s, %s, %s, %s, %s), %s)))"
+    ]
+    assert args == [1.0, 2.0, 3.0, 4.0, 4258, 28992]
+
+
+def test_posted_geometry_clause():
+    where, args = geo_clauses(_geo=GeoQuery.from_body({"_geo": {"within": SQUARE}}))
+    assert len(where) == 1
+    assert where[0].startswith('ST_Within("geometry", (SELECT ST_Transform(')
+    assert args[1:] == [4326, 28992]
+
+
+def test_large_geometry_is_matched_on_its_parts():
+    ring = [[i, i % 2] for i in range(SUBDIVIDE_VERTICES)] + [[0, 0]]
+    polygon = {"type": "Polygon", "coordinates": [ring]}
+    geo_query = GeoQuery.from_body({"_geo": {"intersects": polygon}})
+    where, args = geo_clauses(_geo=geo_query)
+    assert len(where) == 2
+    assert "ST_Subdivide(" in where[0]
+    assert args[3] == SUBDIVIDE_VERTICES
+
+
+def test_geo_query_needs_a_geometry():
+    with pytest.raises(InvalidInputException):
+        make_strategy(None).add_geo_clauses(Query(), bbox="1,2,3,4")
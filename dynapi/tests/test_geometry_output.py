@@ -0,0 +1,83 @@
+import pytest
+
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra import sql
+from dynapi.infra.geo import GeometryOutput
+from dynapi.infra.sql import SQLStrategy
+
+
+NAMES = ["id", "geometry"]
+
+
+def make_strategy():
+    collection = Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+    )
+    return SQLStrategy(collection, None)
+
+
+def test_output_params():
+    params = {"simplify": "2.5", "precision": "6", "bbox-only": "True"}
+    assert GeometryOutput.from_params(params) == GeometryOutput(2.5, 6, True)
+    assert GeometryOutput.from_params({}) == GeometryOutput()
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"simplify": "0"},
+        {"simplify": "x"},
+        {"simplify": "10001"},
+        {"precision": "-1"},
+        {"precision": "16"},
+        {"precision": "1.5"},
+        {"bbox-only": "ja"},
+    ],
+)
+def test_invalid_output_params(params):
+    with pytest.raises(InvalidInputException):
+        GeometryOutput.from_params(params)
+
+
+def test_simplified_in_the_stored_srid():
+    expr, args = make_strategy().geometry_expr(4326, GeometryOutput(simplify=5.0))
+    assert expr == (
+        'ST_AsGeoJSON(ST_Transform(ST_SimplifyPreserveTopology("geometry", %s), 4326))'
+    )
+    assert args == [5.0]
+
+
+def test_precision_is_an_argument():
+    expr, args = make_strategy().geometry_expr(4326, GeometryOutput(precision=6))
+    assert expr == 'ST_AsGeoJSON(ST_Transform("geometry", 4326), %s)'
+    assert args == [6]
+
+
+def test_precision_of_a_binary_geometry_snaps_to_a_grid():
+    output = GeometryOutput(precision=2)
+    expr, args = make_strategy().geometry_expr(28992, output, "ST_AsBinary")
+    assert expr == (
+        'ST_AsBinary(ST_SnapToGrid(ST_Transform("geometry", 28992), 10 ^ -%s::integer))'
+    )
+    assert args == [2]
+
+
+def test_bbox_only():
+    expr, args = make_strategy().geometry_expr(4326, GeometryOutput(bbox_only=True))
+    assert expr == (
+        'ST_AsGeoJSON(ST_Envelope(ST_Transform(ST_Envelope("geometry"), 4326)))'
+    )
+    assert args == []
+
+
+def test_precomputed_geometry_is_used_unless_simplified(monkeypatch):
+    strategy = make_strategy()
+    monkeypatch.setitem(sql._geometry_columns, strategy.table, (0, {4326: "g_4326"}))
+    assert strategy.geometry_expr(4326)[0] == 'ST_AsGeoJSON("g_4326")'
+    simplified = strategy.geometry_expr(4326, GeometryOutput(simplify=1.0))[0]
+    assert '"g_4326"' not in simplified
@@ -0,0 +1,79 @@
+import hashlib
+import json
+
+from dynapi.domain.types import Type
+from dynapi.services import openapi
+from dynapi.services.openapi import OpenAPIContext, OpenAPIService
+
+
+ID_REF = "https://schemas.data.amsterdam.nl/schema@v1.0#/definitions/id"
+
+
+def make_schema(table):
+    return {
+        "id": "example",
+        "type": "dataset",
+        "tables": [
+            {
+                "id": table,
+                "type": "table",
+                "schema": {
+                    "properties": {
+                        "id": {"$ref": ID_REF, "description": "Id"},
+                        "naam": {"type": "string"},
+                    }
+                },
+            }
+        ],
+    }
+
+
+class FakeRegistry:
+    """ One catalog, `generation` is bumped when its schema is replaced """
+
+    def __init__(self):
+        self.generation = 0
+        self.type = Type(make_schema("steden"))
+
+    def all(self):
+        return {"example": None}
+
+    def replace(self, table):
+        self.generation += 1
+        self.type = Type(make_schema(table))
+
+
+def make_service(monkeypatch):
+    registry = FakeRegistry()
+    monkeypatch.setattr(openapi, "get_registry", lambda *args: registry)
+    monkeypatch.setattr(
+        Type, "from_registry", classmethod(lambda cls, url, name: registry.type)
+    )
+    return OpenAPIService(OpenAPIContext("/api/", None)), registry
+
+
+def test_spec_has_a_path_per_table(monkeypatch):
+    service, _ = make_service(monkeypatch)
+    spec = json.loads(service.encoded_openapi_spec().body)
+    assert list(spec["paths"]) == ["/api/example/steden/{id}"]
+    assert list(spec["components"]["schemas"]) == ["steden"]
+
+
+def test_encoded_spec_is_reused_until_the_registry_changes(monkeypatch):
+    service, registry = make_service(monkeypatch)
+    encoded = service.encoded_openapi_spec()
+    assert service.encoded_openapi_spec() is encoded
+    assert encoded.etag == hashlib.sha1(encoded.body).hexdigest()
+    registry.replace("buurten")
+    changed = service.encoded_openapi_spec()
+    assert changed.etag != encoded.etag
+    assert b"/api/example/buurten/{id}" in changed.body
+
+
+def test_etag_only_changes_with_the_spec(monkeypatch):
+    service, registry = make_service(monkeypatch)
+    encoded = service.encoded_openapi_spec()
+    registry.replace("steden")
+    rebuilt = service.encoded_openapi_spec()
+    assert rebuilt is not encoded
+    assert rebuilt.etag == encoded.etag
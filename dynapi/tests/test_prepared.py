@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from dynapi.domain.types import Collection, CollectionRef, Count, RowType, TableVersion
+from dynapi.infra.prepared import (
+    PREPARED_KEY,
+    execute_prepared,
+    numbered_placeholders,
+    statement_name,
+)
+from dynapi.infra.sql import SQLStrategy
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, sql):
+        self.log.append(sql)
+
+    def close(self):
+        pass
+
+
+class FakeDBAPIConnection:
+    def __init__(self):
+        self.info = {}
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self.log)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connection = FakeDBAPIConnection()
+
+    def execute(self, sql, args=None):
+        self.connection.log.append(sql)
+
+
+SQL = "SELECT id FROM example.steden WHERE naam = %s"
+
+
+def test_numbered_placeholders():
+    assert numbered_placeholders("a = %s AND b LIKE '%%' || %s") == (
+        "a = $1 AND b LIKE '%' || $2"
+    )
+
+
+def test_statement_name_changes_with_the_generation():
+    assert statement_name(SQL) == statement_name(SQL)
+    assert statement_name(SQL, 3) != statement_name(SQL, 4)
+    assert statement_name(SQL, 3) != statement_name(SQL)
+
+
+def test_reimport_prepares_a_new_statement():
+    con = FakeConnection()
+    execute_prepared(con, "steden:list", SQL, ["a"], generation=3)
+    execute_prepared(con, "steden:list", SQL, ["a"], generation=3)
+    execute_prepared(con, "steden:list", SQL, ["a"], generation=4)
+    log = con.connection.log
+    prepares = [sql for sql in log if sql.startswith("PREPARE")]
+    assert len(prepares) == 2
+    assert prepares[0].split()[1] == statement_name(SQL, 3)
+    assert prepares[1].split()[1] == statement_name(SQL, 4)
+    prepared = con.connection.info[PREPARED_KEY]
+    assert isinstance(prepared, OrderedDict)
+    assert list(prepared) == [statement_name(SQL, 3), statement_name(SQL, 4)]
+
+
+def no_connection():
+    raise AssertionError("the version is read again")
+
+
+def test_version_read_by_the_request_is_not_read_again():
+    collection = Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=["id"],
+        row_type=RowType(["id"]),
+        geometry_name=None,
+    )
+    version = TableVersion(5, datetime(2020, 1, 1, tzinfo=timezone.utc), 12)
+    strategy = SQLStrategy(collection, no_connection, version)
+    assert strategy.statement_generation() == 5
+    assert strategy.count() == Count(12)
@@ -0,0 +1,76 @@
+import flask
+import pytest
+
+from dynapi import const
+from dynapi.exceptions import NotAcceptableException
+from dynapi.renderers import (
+    ArrowRenderer,
+    CSVRenderer,
+    GeoJSONRenderer,
+    JSONRenderer,
+    accepted_srid,
+    geometry_format,
+    negotiate,
+)
+
+
+def test_default_without_accept_crs():
+    assert accepted_srid(None, const.DB_SRID) == const.DB_SRID
+    assert accepted_srid("", const.DB_SRID) == const.DB_SRID
+
+
+@pytest.mark.parametrize(
+    "accept_crs, srid",
+    [
+        ("EPSG:4326", 4326),
+        ("epsg:4258", 4258),
+        ("http://www.opengis.net/def/crs/EPSG/0/28992", 28992),
+        ("EPSG:4258;q=0.5, EPSG:4326", 4326),
+        ("EPSG:1, EPSG:4326;q=0.5", 4326),
+        ("OGC:CRS84, EPSG:3857;q=0.1", 3857),
+    ],
+)
+def test_best_supported_crs(accept_crs, srid):
+    assert accepted_srid(accept_crs, const.DB_SRID) == srid
+
+
+@pytest.mark.parametrize("accept_crs", ["EPSG:1", "EPSG:2, OGC:CRS84"])
+def test_unsupported_crs_is_not_acceptable(accept_crs):
+    with pytest.raises(NotAcceptableException):
+        accepted_srid(accept_crs, const.DB_SRID)
+
+
+@pytest.mark.parametrize(
+    "renderer, requested, geo_format",
+    [
+        (JSONRenderer(True), None, "geojson"),
+        (JSONRenderer(True), "wkt", "wkt"),
+        (CSVRenderer(True), None, "ewkb"),
+        (CSVRenderer(True), "geojson", "geojson-text"),
+        (GeoJSONRenderer(True), None, "geojson"),
+        (ArrowRenderer(True), None, "wkb"),
+    ],
+)
+def test_geometry_format(renderer, requested, geo_format):
+    assert geometry_format(renderer, requested) == geo_format
+
+
+@pytest.mark.parametrize(
+    "renderer, requested",
+    [
+        (JSONRenderer(True), "wkb"),
+        (GeoJSONRenderer(True), "wkt"),
+        (ArrowRenderer(True), "geojson"),
+    ],
+)
+def test_unsupported_geometry_format_is_not_acceptable(renderer, requested):
+    with pytest.raises(NotAcceptableException):
+        geometry_format(renderer, requested)
+
+
+def test_geometry_format_is_negotiated():
+    app = flask.Flask(__name__)
+    path = "/?content-type=text/csv&geometry-format=wkt"
+    with app.test_request_context(path, headers={"Accept-Crs": "EPSG:4326"}):
+        negotiated = negotiate(flask.request, True)
+    assert (negotiated.geo_format, negotiated.srid) == ("wkt", 4326)
@@ -0,0 +1,85 @@
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.services import search as search_module
+from dynapi.services.search import SearchService
+
+
+NAMES = ["id", "naam", "geometry"]
+
+
+def make_collection(name):
+    return Collection(
+        CollectionRef("example", name),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        specs={"naam": {"type": "string"}},
+    )
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """ Answers the search of a collection after its delay in seconds """
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def begin(self):
+        return contextlib.nullcontext()
+
+    def execute(self, sql, args=None):
+        if sql.startswith("SET LOCAL"):
+            return None
+        name = sql.split("FROM example.")[1].split()[0]
+        time.sleep(self.delays[name])
+        return FakeResult([{"id": name, "naam": name, "_score": 1.0}])
+
+
+def make_service(monkeypatch, delays):
+    monkeypatch.setattr(const, "SEARCH_TIMEOUT", 0.3)
+    monkeypatch.setattr(const, "PREPARED_STATEMENTS", False)
+    monkeypatch.setattr(search_module, "_executor", ThreadPoolExecutor(1))
+    engine = type("Engine", (), {"connect": lambda self: FakeConnection(delays)})
+    service = SearchService(None, engine)
+    service.collections = lambda names=None: [make_collection(n) for n in delays]
+    return service
+
+
+def test_budget_starts_with_the_query(monkeypatch):
+    # The second query waits 0.2s in the queue, and takes 0.2s itself
+    service = make_service(monkeypatch, {"a": 0.2, "b": 0.2})
+    outcome = service.search(q="x")
+    assert [result.resource.fields.values[0] for result in outcome.results] == [
+        "a",
+        "b",
+    ]
+    assert outcome.timed_out == [] and outcome.queued == []
+
+
+def test_queued_collections_are_reported_apart(monkeypatch):
+    # The first query outlasts the budget, the others never start
+    service = make_service(monkeypatch, {"a": 0.5, "b": 0.0, "c": 0.0})
+    outcome = service.search(q="x")
+    assert list(outcome.results) == []
+    assert outcome.timed_out == ["example:a"]
+    assert outcome.queued == ["example:b", "example:c"]
+    assert outcome.failed == []
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import flask
+import pytest
+from werkzeug.exceptions import NotFound
+
+from dynapi import api, const
+from dynapi.domain.types import TableVersion
+from dynapi.snapshots import (
+    download_name,
+    latest_snapshot,
+    snapshot_etag,
+    snapshot_file,
+)
+
+
+VERSION = TableVersion(3, datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+BODY = b"0123456789"
+
+
+class FakeCatalogService:
+    def __init__(self, version=VERSION):
+        self.version = version
+
+    def table_version(self, catalog, collection):
+        return self.version
+
+
+@pytest.fixture
+def snapshot_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "SNAPSHOT_PATH", str(tmp_path))
+    path = tmp_path / snapshot_file("example", "steden", VERSION, "csv.gz")
+    path.parent.mkdir(parents=True)
+    path.write_bytes(BODY)
+    return tmp_path
+
+
+def download(format_="csv.gz", headers=None, version=VERSION):
+    app = flask.Flask(__name__)
+    with app.test_request_context("/", headers=headers):
+        response = api.download_handler(
+            FakeCatalogService(version), "example", "steden", format_
+        )
+        response.direct_passthrough = False
+        return response
+
+
+def test_snapshot_names():
+    assert snapshot_file("example", "steden", VERSION, "parquet") == (
+        "example/steden/3.parquet"
+    )
+    assert download_name("steden", VERSION, "csv.gz") == "steden-3.csv.gz"
+    assert snapshot_etag("example", "steden", VERSION, "csv.gz") != snapshot_etag(
+        "example", "steden", TableVersion(4, VERSION.updated_at), "csv.gz"
+    )
+
+
+def test_snapshot_is_downloaded(snapshot_path):
+    response = download()
+    assert response.status_code == 200
+    assert response.get_data() == BODY
+    assert response.headers["Content-Disposition"] == (
+        "attachment; filename=steden-3.csv.gz"
+    )
+    assert response.get_etag() == (
+        snapshot_etag("example", "steden", VERSION, "csv.gz"),
+        False,
+    )
+    assert response.cache_control.no_cache
+    assert response.headers["Snapshot-Version"] == "3"
+    assert "Snapshot-Stale" not in response.headers
+
+
+def test_download_is_resumed(snapshot_path):
+    response = download(headers={"Range": "bytes=4-"})
+    assert response.status_code == 206
+    assert response.get_data() == BODY[4:]
+    assert response.headers["Content-Range"] == "bytes 4-9/10"
+
+
+def test_missing_snapshot(snapshot_path):
+    with pytest.raises(NotFound):
+        download("parquet")
+    with pytest.raises(NotFound):
+        download("zip")
+
+
+def test_older_snapshot_while_the_new_one_is_written(snapshot_path):
+    newer = TableVersion(5, VERSION.updated_at)
+    response = download(version=newer)
+    assert response.status_code == 200
+    assert response.get_data() == BODY
+    assert response.headers["Snapshot-Version"] == "3"
+    assert response.headers["Snapshot-Stale"] == "true"
+    assert response.get_etag()[0] == snapshot_etag(
+        "example", "steden", VERSION, "csv.gz"
+    )
+
+
+def test_latest_snapshot(snapshot_path):
+    root = str(snapshot_path)
+    directory = snapshot_path / "example" / "steden"
+    (directory / "1.csv.gz").write_bytes(BODY)
+    (directory / "7.csv.gz").write_bytes(BODY)
+    (directory / ".x.tmp").write_bytes(BODY)
+    assert latest_snapshot(root, "example", "steden", VERSION, "csv.gz") is VERSION
+    version = TableVersion(6, VERSION.updated_at)
+    assert latest_snapshot(root, "example", "steden", version, "csv.gz").version == 3
+    assert latest_snapshot(root, "example", "steden", version, "parquet") is None
+    assert latest_snapshot(root, "example", "wijken", version, "csv.gz") is None
@@ -0,0 +1,106 @@
+import itertools
+import sqlite3
+
+import pytest
+
+from dataservices.amsterdam_schema.sorting import SortKey
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.infra.sql import Query, SQLStrategy
+
+
+NAMES = ["id", "naam", "inwoners"]
+
+# Every combination of NULL and duplicate values, the ids are unique
+ROWS = [
+    (f"{i:02}", naam, inwoners)
+    for i, (naam, inwoners) in enumerate(
+        list(itertools.product([None, "a", "b"], [None, 1, 2])) * 2
+    )
+]
+
+
+def make_strategy():
+    collection = Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=None,
+    )
+    return SQLStrategy(collection, None)
+
+
+@pytest.fixture
+def db():
+    con = sqlite3.connect(":memory:")
+    con.execute('CREATE TABLE steden ("id" text, "naam" text, "inwoners" integer)')
+    con.executemany("INSERT INTO steden VALUES (?, ?, ?)", ROWS)
+    yield con
+    con.close()
+
+
+def select(db, sort_keys, after=None, before=None, limit=None):
+    query = Query(limit=limit)
+    make_strategy().add_keyset_clause(query, sort_keys, after, before)
+    clauses, args = query.clauses()
+    sql = f"SELECT * FROM steden{clauses}".replace("%s", "?")
+    rows = db.execute(sql, args).fetchall()
+    return rows[::-1] if before is not None else rows
+
+
+def key_of(row, sort_keys):
+    return [row[NAMES.index(sort_key.name)] for sort_key in sort_keys]
+
+
+SORTS = [
+    [SortKey("id")],
+    [SortKey("naam"), SortKey("id")],
+    [SortKey("naam", True), SortKey("id")],
+    [SortKey("naam"), SortKey("inwoners", True), SortKey("id")],
+    [SortKey("inwoners", True), SortKey("naam", True), SortKey("id")],
+]
+
+
+@pytest.mark.parametrize("sort_keys", SORTS)
+def test_keyset_pages_forward_through_nulls(db, sort_keys):
+    ordered = select(db, sort_keys)
+    assert len(ordered) == len(ROWS)
+    pages, after = [], None
+    while True:
+        page = select(db, sort_keys, after=after, limit=4)
+        if not page:
+            break
+        pages.extend(page)
+        after = key_of(page[-1], sort_keys)
+    assert pages == ordered
+
+
+@pytest.mark.parametrize("sort_keys", SORTS)
+def test_keyset_pages_backward_through_nulls(db, sort_keys):
+    ordered = select(db, sort_keys)
+    pages, before = [], key_of(ordered[-1], sort_keys)
+    while True:
+        page = select(db, sort_keys, before=before, limit=4)
+        if not page:
+            break
+        pages = page + pages
+        before = key_of(page[0], sort_keys)
+    assert pages == ordered[:-1]
+
+
+def test_keyset_row_comparison_without_nulls():
+    query = Query()
+    sort_keys = [SortKey("naam"), SortKey("id")]
+    make_strategy().add_keyset_clause(query, sort_keys, after=["a", "07"])
+    assert query.where == ['("naam", "id") > (%s, %s)']
+    assert query.where_args == ["a", "07"]
+    assert query.order_by == ['"naam" NULLS FIRST', '"id"']
+
+
+def test_keyset_null_key_is_tested_explicitly():
+    query = Query()
+    sort_keys = [SortKey("naam"), SortKey("id")]
+    make_strategy().add_keyset_clause(query, sort_keys, after=[None, "07"])
+    assert query.where == ['(("naam" IS NOT NULL) OR ("naam" IS NULL AND "id" > %s))']
+    assert query.where_args == ["07"]
@@ -0,0 +1,146 @@
+import json
+
+import pytest
+
+from dynapi import const
+from dynapi.domain.types import Collection, CollectionRef, RowType
+from dynapi.infra.db import Page, encode_cursor
+from dynapi.infra.sql import SQLStrategy
+from dynapi.renderers import CSVRenderer, JSONRenderer, NDJSONRenderer, chunked
+
+
+NAMES = ["id", "naam"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        geometry_name=None,
+    )
+
+
+class FakeResult:
+    def __init__(self, rows, fetches):
+        self.rows = rows
+        self.fetches = fetches
+
+    def fetchmany(self, size):
+        self.fetches.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """ Records the execution options and the fetches """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.options = {}
+        self.fetches = []
+        self.statements = []
+
+    def execution_options(self, **options):
+        self.options.update(options)
+        return self
+
+    def execute(self, sql, args=None):
+        self.statements.append((sql, args))
+        return FakeResult(list(self.rows), self.fetches)
+
+
+def test_rows_are_fetched_in_chunks_while_iterated(monkeypatch):
+    monkeypatch.setattr(const, "FETCH_SIZE", 2)
+    con = FakeConnection([{"id": str(i), "naam": f"stad {i}"} for i in range(5)])
+    rows = SQLStrategy(make_collection(), lambda: con).list()
+    # A list without a limit is streamed from a server-side cursor
+    assert con.options == {"stream_results": True}
+    assert con.fetches == []
+    assert next(rows) == {"id": "0", "naam": "stad 0"}
+    assert con.fetches == [2]
+    assert len(list(rows)) == 4
+    assert con.fetches == [2, 2, 2, 2]
+
+
+def test_chunked_joins_parts():
+    assert list(chunked(["ab", "cd", "e"], 3)) == ["abcd", "e"]
+    assert list(chunked([b"ab", b"c"], 2)) == [b"ab", b"c"]
+    assert list(chunked([], 2)) == []
+
+
+class FakeArgs(dict):
+    def to_dict(self):
+        return dict(self)
+
+
+class FakeRequest:
+    method = "GET"
+    args = FakeArgs()
+
+
+def test_page_is_rendered_while_it_is_iterated():
+    fetched = []
+
+    def rows():
+        for i in range(3):
+            fetched.append(i)
+            yield {"id": str(i), "naam": f"stad {i}"}
+
+    page = Page(make_collection(), rows(), 2)
+    parts = JSONRenderer(True, request=FakeRequest()).rendered(page).parts
+    head = next(parts)
+    assert fetched == []
+    first = next(parts)
+    assert fetched == [0]
+    body = json.loads(head + first + "".join(parts))
+    assert [r["id"] for r in body["_embedded"]["steden"]] == ["0", "1"]
+    assert "next" in body["_links"]
+
+
+def make_page(fetched, next_keys, n_rows=3, page_size=2, direction=None):
+    def rows():
+        for i in range(n_rows):
+            fetched.append(i)
+            yield {"id": str(i), "naam": f"stad {i}"}
+
+    cursor = "x" if direction else None
+    page = Page(make_collection(), rows(), page_size, direction, cursor)
+    page.next_keys = lambda: next_keys
+    return page
+
+
+@pytest.mark.parametrize("renderer", [NDJSONRenderer, CSVRenderer])
+def test_links_are_sent_before_the_rows(renderer):
+    fetched = []
+    page = make_page(fetched, [{"id": "1"}, {"id": "2"}], direction="next")
+    rendered = renderer(True, request=FakeRequest()).rendered(page)
+    # Only the first row is read ahead, for the link to the previous page
+    assert fetched == [0]
+    links = rendered.headers["Link"]
+    assert 'rel="next"' in links and 'rel="previous"' in links
+    assert page.next_cursor == encode_cursor("next", ["1"])
+    assert page.prev_cursor == encode_cursor("prev", ["0"])
+    body = "".join(rendered.parts)
+    assert "stad 1" in body and "stad 2" not in body
+
+
+def test_last_page_has_no_next_link():
+    fetched = []
+    page = make_page(fetched, [{"id": "1"}], n_rows=2)
+    rendered = NDJSONRenderer(True, request=FakeRequest()).rendered(page)
+    assert 'rel="next"' not in rendered.headers["Link"]
+    assert len("".join(rendered.parts).splitlines()) == 2
+
+
+def test_next_keys_reads_the_sort_keys_past_the_page(monkeypatch):
+    monkeypatch.setattr(const, "PREPARED_STATEMENTS", False)
+    con = FakeConnection([{"id": "1"}, {"id": "2"}])
+    strategy = SQLStrategy(make_collection(), lambda: con)
+    assert strategy.next_keys(2, after=["0"]) == [{"id": "1"}, {"id": "2"}]
+    sql, args = con.statements[0]
+    assert sql.startswith('SELECT "id" FROM example.steden WHERE')
+    assert sql.endswith("LIMIT %s OFFSET %s")
+    assert args[-2:] == [2, 1]
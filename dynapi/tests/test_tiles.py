@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+
+import flask
+import pytest
+
+from dataservices.tiles import tile_envelope
+from dynapi import api
+from dynapi.domain.types import Collection, CollectionRef, RowType, TableVersion
+from dynapi.exceptions import InvalidInputException
+from dynapi.infra.cache import ResponseCache
+from dynapi.infra.db import EntityRepository
+from dynapi.infra.sql import SQLStrategy
+
+
+NAMES = ["id", "naam", "tags", "geometry"]
+
+
+def make_collection():
+    return Collection(
+        CollectionRef("example", "steden"),
+        None,
+        primary_name="id",
+        properties=NAMES,
+        row_type=RowType(NAMES),
+        specs={
+            "id": {"type": "string"},
+            "naam": {"type": "string"},
+            "tags": {"type": "array"},
+        },
+    )
+
+
+class FakeResult:
+    def scalar(self):
+        return memoryview(b"tile")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, args=None):
+        self.statements.append((sql, args))
+        return FakeResult()
+
+
+def test_tile_has_the_scalar_fields_as_attributes():
+    con = FakeConnection()
+    collection = make_collection()
+    repo = EntityRepository(collection, SQLStrategy(collection, lambda: con))
+    assert repo.tile(1, 1, 0) == b"tile"
+    ((sql, args),) = con.statements
+    assert 'SELECT "id", "naam", ST_AsMVTGeom(' in sql
+    assert args[:5] == ["steden", *tile_envelope(1, 1, 0)]
+
+
+def test_invalid_tile():
+    with pytest.raises(InvalidInputException):
+        EntityRepository(make_collection(), None).tile(1, 2, 0)
+
+
+class FakeCatalogService:
+    def __init__(self):
+        self.tiles = 0
+
+    def table_version(self, catalog, collection):
+        return TableVersion(3, datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+    def get_tile(self, **params):
+        self.tiles += 1
+        return b"tile"
+
+
+def test_tiles_are_cached(monkeypatch, tmp_path):
+    cache = ResponseCache(str(tmp_path / "tiles.db"), 2 ** 20, 2 ** 20)
+    monkeypatch.setattr(api, "get_tile_cache", lambda: cache)
+    service = FakeCatalogService()
+    app = flask.Flask(__name__)
+    kwargs = dict(catalog="example", collection="steden", z=1, x=1, y=0)
+    responses = []
+    for _ in range(2):
+        with app.test_request_context("/"):
+            responses.append(api.tile_handler(service, **kwargs))
+    assert service.tiles == 1
+    assert [r.headers["X-Cache"] for r in responses] == ["MISS", "HIT"]
+    assert responses[1].get_data() == b"tile"
+    assert responses[1].mimetype == "application/vnd.mapbox-vector-tile"
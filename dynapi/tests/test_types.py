@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+from dynapi.domain.types import Resource, RowType
+
+
+NAMES = ["id", "naam", "inwoners"]
+
+
+def test_values_are_in_the_order_of_the_row_type():
+    row = RowType(NAMES)({"inwoners": 10, "naam": "Amsterdam", "id": "1", "x": 1})
+    assert row.values == ("1", "Amsterdam", 10)
+    assert list(row.keys()) == NAMES
+    assert list(row.items()) == [("id", "1"), ("naam", "Amsterdam"), ("inwoners", 10)]
+
+
+def test_fields_by_name():
+    row = RowType(NAMES)({"id": "1", "naam": "Amsterdam"})
+    assert row.naam == row["naam"] == "Amsterdam"
+    assert row.inwoners is None
+    with pytest.raises(AttributeError):
+        row.onbekend
+    with pytest.raises(KeyError):
+        row["onbekend"]
+
+
+def test_rows_share_their_row_type():
+    row_type = RowType(NAMES)
+    rows = [row_type({"id": str(i)}) for i in range(3)]
+    assert all(row.row_type is row_type for row in rows)
+    with pytest.raises(AttributeError):
+        rows[0].__dict__
+
+
+def test_resource_fields():
+    collection = SimpleNamespace(row_type=RowType(NAMES))
+    resource = Resource(collection, {"id": "1", "naam": "Amsterdam", "inwoners": 10})
+    assert resource.fields.as_dict() == {"id": "1", "naam": "Amsterdam", "inwoners": 10}
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import flask
+from werkzeug.http import http_date
+
+from dynapi.api import cached_response
+from dynapi.domain.types import TableVersion
+from dynapi.validators import (
+    is_not_modified,
+    make_etag,
+    set_validators,
+    set_vary,
+)
+
+
+UPDATED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+VERSION = TableVersion(3, UPDATED_AT)
+
+app = flask.Flask(__name__)
+
+
+def etag(path="/", version=VERSION, content_type="application/json", srid=28992):
+    with app.test_request_context(path):
+        return make_etag(
+            flask.request, version, content_type, srid, None, catalog="example"
+        )
+
+
+def test_etag_is_keyed_on_the_representation():
+    assert etag() == etag()
+    assert etag("/?a=1&b=2") == etag("/?b=2&a=1")
+    assert len({etag(), etag("/?a=1"), etag(content_type="text/csv")}) == 3
+    assert etag(srid=4326) != etag()
+
+
+def test_etag_changes_with_the_version():
+    assert etag(version=TableVersion(4, UPDATED_AT)) != etag()
+
+
+def test_etag_changes_with_the_schema_version():
+    version = TableVersion(3, UPDATED_AT, schema_version='"abc"')
+    assert etag(version=version) != etag()
+
+
+def test_if_none_match():
+    headers = {"If-None-Match": f'"{etag()}"'}
+    with app.test_request_context("/", headers=headers):
+        assert is_not_modified(flask.request, etag(), VERSION)
+        assert not is_not_modified(flask.request, etag("/?a=1"), VERSION)
+
+
+def test_if_modified_since():
+    for delta, not_modified in [(0, True), (1, True), (-1, False)]:
+        since = http_date(UPDATED_AT + timedelta(seconds=delta))
+        headers = {"If-Modified-Since": since}
+        with app.test_request_context("/", headers=headers):
+            assert is_not_modified(flask.request, etag(), VERSION) is not_modified
+
+
+def test_if_none_match_takes_precedence():
+    headers = {"If-None-Match": '"other"', "If-Modified-Since": http_date(UPDATED_AT)}
+    with app.test_request_context("/", headers=headers):
+        assert not is_not_modified(flask.request, etag(), VERSION)
+
+
+def test_validators_are_set():
+    response = set_validators(flask.Response(), etag(), VERSION)
+    assert response.get_etag() == (etag(), False)
+    assert response.last_modified == UPDATED_AT
+    assert response.cache_control.no_cache
+
+
+def test_vary_on_the_negotiated_headers():
+    response = set_vary(flask.Response())
+    assert set(response.vary) == {"Accept", "Accept-Crs", "Accept-Encoding"}
+
+
+def test_not_modified_without_rendering():
+    with app.test_request_context("/", headers={"If-None-Match": f'"{etag()}"'}):
+        response = cached_response(None, etag(), VERSION)
+        assert response.status_code == 304
+    with app.test_request_context("/"):
+        assert cached_response(None, etag(), VERSION) is None
@@ -0,0 +1,134 @@
+"""
+Benchmark of schema crawling against a local stand-in schema server
+
+    python benchmarks/crawl.py --datasets 300 --latency 0.005
+
+The stand-in server mimics the directory listings of the schema server:
+the root lists one directory per dataset, every directory lists one schema
+file. Every request is delayed by `--latency` seconds to simulate the
+round trip to the real server.
+"""
+import argparse
+import http.server
+import json
+import threading
+import time
+
+import requests
+
+from dataservices.amsterdam_schema import (
+    schema_defs_from_url,
+    schema_def_from_url,
+)
+
+
+def make_schema(name):
+    return {
+        "id": name,
+        "type": "dataset",
+        "crs": "EPSG:28992",
+        "tables": [
+            {
+                "id": name,
+                "type": "table",
+                "schema": {
+                    "properties": {
+                        "id": {"type": "string"},
+                        "name": {"type": "string"},
+                        "geometry": {"$ref": "https://geojson.org/schema/Point.json"},
+                    }
+                },
+            }
+        ],
+    }
+
+
+def start_server(n_datasets, latency):
+    names = [f"dataset{i}" for i in range(n_datasets)]
+    files = {"/": [{"name": name} for name in names]}
+    for name in names:
+        files[f"/{name}/"] = [{"name": name}]
+        files[f"/{name}/{name}"] = make_schema(name)
+    bodies = {path: json.dumps(content).encode() for path, content in files.items()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = bodies.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", names
+
+
+def sequential_crawl(schemas_url):
+    """ The crawler as it was: one new connection per request """
+    schema_lookup = {}
+    response = requests.get(schemas_url)
+    response.raise_for_status()
+    for schema_dir_info in response.json():
+        schema_dir_name = schema_dir_info["name"]
+        response = requests.get(f"{schemas_url}{schema_dir_name}/")
+        response.raise_for_status()
+        for schema_file_info in response.json():
+            schema_name = schema_file_info["name"]
+            response = requests.get(f"{schemas_url}{schema_dir_name}/{schema_name}")
+            response.raise_for_status()
+            schema_lookup[schema_name] = response.json()
+    return schema_lookup
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<40} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server, url, names = start_server(args.datasets, args.latency)
+    try:
+        expected = timed("sequential, new connection per GET", sequential_crawl, url)
+        result = timed(
+            f"pooled, concurrency={args.concurrency}",
+            lambda: schema_defs_from_url(url, concurrency=args.concurrency),
+        )
+        assert result == expected
+        timed(
+            "single dataset, sequential full crawl",
+            lambda: sequential_crawl(url)[names[-1]],
+        )
+        timed(
+            "single dataset, direct lookup",
+            schema_def_from_url,
+            url,
+            names[-1],
+        )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
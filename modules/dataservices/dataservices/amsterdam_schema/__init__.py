@@ -1,10 +1,13 @@
 from collections import UserDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+import functools
 import json
 import typing
 
 import jsonschema
 import requests
+from requests.adapters import HTTPAdapter
 
 from . import refs
 
@@ -90,24 +93,91 @@ def schema_def_from_path(schema_path):
         return json.load(fh)
 
 
-def schema_defs_from_url(schemas_url):
-    schema_lookup = {}
-    response = requests.get(schemas_url)
+# Number of concurrent requests used when crawling the schema server
+CRAWL_CONCURRENCY = 8
+
+
+@functools.lru_cache(12)
+def get_session(pool_size: int = CRAWL_CONCURRENCY) -> requests.Session:
+    """ One pooled, keep-alive session per process and pool size """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _get_json(session, url, timeout=None):
+    response = session.get(url, timeout=timeout)
     response.raise_for_status()
-    for schema_dir_info in response.json():
-        schema_dir_name = schema_dir_info["name"]
-        response = requests.get(f"{schemas_url}{schema_dir_name}/")
-        response.raise_for_status()
-        for schema_file_info in response.json():
-            schema_name = schema_file_info["name"]
-            response = requests.get(f"{schemas_url}{schema_dir_name}/{schema_name}")
-            response.raise_for_status()
-            schema_lookup[schema_name] = response.json()
-    return schema_lookup
-
-
-def schema_def_from_url(schemas_url, schema_name):
-    return schema_defs_from_url(schemas_url)[schema_name]
+    return response.json()
+
+
+def _schema_dir_urls(session, schemas_url, schema_dir_name, timeout=None):
+    dir_url = f"{schemas_url}{schema_dir_name}/"
+    return {
+        schema_file_info["name"]: f"{dir_url}{schema_file_info['name']}"
+        for schema_file_info in _get_json(session, dir_url, timeout)
+    }
+
+
+def schema_urls_from_url(
+    schemas_url, timeout=None, session=None, concurrency=CRAWL_CONCURRENCY
+):
+    """ Returns the url of every schema file, keyed on schema name """
+    session = session or get_session(concurrency)
+    schema_dir_names = [
+        schema_dir_info["name"]
+        for schema_dir_info in _get_json(session, schemas_url, timeout)
+    ]
+    schema_urls = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for dir_urls in executor.map(
+            lambda name: _schema_dir_urls(session, schemas_url, name, timeout),
+            schema_dir_names,
+        ):
+            schema_urls.update(dir_urls)
+    return schema_urls
+
+
+def schema_url_from_url(schemas_url, schema_name, timeout=None, session=None):
+    """ Returns the url of one schema file
+
+    Schema directories are normally named after the dataset they contain,
+    so that directory is tried first. Only when the schema is not found
+    there, the complete index is crawled.
+    """
+    session = session or get_session()
+    try:
+        schema_url = _schema_dir_urls(session, schemas_url, schema_name, timeout).get(
+            schema_name
+        )
+    except requests.HTTPError:
+        schema_url = None
+    if schema_url is None:
+        schema_url = schema_urls_from_url(schemas_url, timeout, session)[schema_name]
+    return schema_url
+
+
+def schema_defs_from_url(
+    schemas_url, timeout=None, session=None, concurrency=CRAWL_CONCURRENCY
+):
+    session = session or get_session(concurrency)
+    schema_urls = schema_urls_from_url(schemas_url, timeout, session, concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        schema_defs = executor.map(
+            lambda url: _get_json(session, url, timeout), schema_urls.values()
+        )
+        return dict(zip(schema_urls.keys(), schema_defs))
+
+
+def schema_def_from_url(schemas_url, schema_name, timeout=None, session=None):
+    session = session or get_session()
+    return _get_json(
+        session,
+        schema_url_from_url(schemas_url, schema_name, timeout, session),
+        timeout,
+    )
 
 
 def fetch_schema(schema_def):
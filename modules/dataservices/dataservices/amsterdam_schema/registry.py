@@ -0,0 +1,205 @@
+"""
+Process-wide registry of parsed dataset schemas
+
+Schemas are fetched once from the schema server and kept in memory.
+Entries older than `ttl` seconds are revalidated in the background with a
+conditional GET (If-None-Match / If-Modified-Since), entries older than
+`max_stale` seconds are revalidated before they are returned.
+When the schema server is slow or down, the cached schema is served.
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+
+from . import (
+    CRAWL_CONCURRENCY,
+    DatasetSchema,
+    get_session,
+    schema_urls_from_url,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(data: dict) -> str:
+    """ Hash of the schema document, independent of key order and whitespace """
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+@dataclass
+class RegistryEntry:
+    schema: DatasetSchema
+    url: str
+    etag: typing.Optional[str] = None
+    last_modified: typing.Optional[str] = None
+    fetched_at: float = 0.0
+    # Only changes when the content of the schema changes
+    digest: str = ""
+
+    def age(self, now: float) -> float:
+        return now - self.fetched_at
+
+
+class SchemaRegistry:
+    """ Holds parsed `DatasetSchema` objects for one schema server """
+
+    def __init__(
+        self,
+        schemas_url: str,
+        ttl: float = 60.0,
+        max_stale: float = 3600.0,
+        timeout: float = 5.0,
+    ):
+        self.schemas_url = schemas_url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.session = get_session()
+        # Bumped every time a schema is added or its content changes
+        self.generation = 0
+        self._entries: typing.Dict[str, RegistryEntry] = {}
+        self._index: typing.Dict[str, str] = {}
+        self._index_fetched_at = None
+        self._lock = threading.RLock()
+        self._in_flight: typing.Set[str] = set()
+
+    def get(self, schema_name: str) -> DatasetSchema:
+        """ Returns the schema, raises KeyError for unknown schemas """
+        now = time.monotonic()
+        entry = self._entries.get(schema_name)
+        if entry is None:
+            return self._load(schema_name)
+        age = entry.age(now)
+        if age >= self.max_stale:
+            self._revalidate(schema_name)
+        elif age >= self.ttl:
+            self._revalidate_in_background(schema_name)
+        return self._entries[schema_name].schema
+
+    def all(self) -> typing.Dict[str, DatasetSchema]:
+        """ Returns all schemas known to the schema server """
+        index = self._fetch_index()
+        missing = [name for name in index if name not in self._entries]
+        with ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY) as executor:
+            # Results are consumed to surface errors of the initial loads
+            list(executor.map(self._load, missing))
+        return {name: self.get(name) for name in index}
+
+    def versions(self) -> typing.Dict[str, str]:
+        """ Returns a version marker per cached schema
+
+        The marker is a hash of the schema document, so it stays the same when
+        a schema is refetched with the same content.
+        """
+        return {name: entry.digest for name, entry in self._entries.items()}
+
+    def _fetch_index(self, force=False) -> typing.Dict[str, str]:
+        now = time.monotonic()
+        with self._lock:
+            fresh = (
+                self._index_fetched_at is not None
+                and now - self._index_fetched_at < self.ttl
+            )
+            if fresh and not force:
+                return self._index
+            try:
+                self._index = schema_urls_from_url(
+                    self.schemas_url, timeout=self.timeout, session=self.session
+                )
+                self._index_fetched_at = now
+            except requests.RequestException:
+                if self._index_fetched_at is None:
+                    raise
+                logger.warning(
+                    "Schema index at %s unavailable, using cached index",
+                    self.schemas_url,
+                )
+            return self._index
+
+    def _load(self, schema_name: str) -> DatasetSchema:
+        # The index is crawled at most once per ttl, also for unknown names
+        url = self._fetch_index().get(schema_name)
+        if url is None:
+            raise KeyError(schema_name)
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        with self._lock:
+            # Another thread could have loaded it in the meantime
+            entry = self._entries.get(schema_name)
+            if entry is None:
+                self._store(schema_name, url, response)
+            return self._entries[schema_name].schema
+
+    def _store(self, schema_name: str, url: str, response):
+        data = response.json()
+        self._entries[schema_name] = RegistryEntry(
+            schema=DatasetSchema.from_dict(data),
+            url=url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            fetched_at=time.monotonic(),
+            digest=content_digest(data),
+        )
+        self.generation += 1
+
+    def _revalidate(self, schema_name: str):
+        entry = self._entries[schema_name]
+        headers = {}
+        if entry.etag is not None:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified is not None:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            response = self.session.get(
+                entry.url, headers=headers, timeout=self.timeout
+            )
+            if response.status_code == 304:
+                entry.fetched_at = time.monotonic()
+                return
+            response.raise_for_status()
+        except requests.RequestException:
+            logger.warning(
+                "Revalidation of schema %s failed, serving cached version",
+                schema_name,
+            )
+            return
+        with self._lock:
+            if response.json() == entry.schema.data:
+                entry.fetched_at = time.monotonic()
+                entry.etag = response.headers.get("ETag")
+                entry.last_modified = response.headers.get("Last-Modified")
+            else:
+                self._store(schema_name, entry.url, response)
+
+    def _revalidate_in_background(self, schema_name: str):
+        with self._lock:
+            if schema_name in self._in_flight:
+                return
+            self._in_flight.add(schema_name)
+
+        def run():
+            try:
+                self._revalidate(schema_name)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(schema_name)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+@functools.lru_cache(12)
+def get_registry(
+    schemas_url: str, ttl: float = 60.0, max_stale: float = 3600.0
+) -> SchemaRegistry:
+    """ Registries should be defined once per process """
+    return SchemaRegistry(schemas_url, ttl=ttl, max_stale=max_stale)
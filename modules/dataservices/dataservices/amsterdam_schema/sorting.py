@@ -0,0 +1,45 @@
+"""
+Sort specifications, as used by the `sorteer` query parameter (NL-API API-31)
+
+    sorteer=-inwoners,name
+
+A leading `-` sorts descending. The same specification is used to create
+the matching indexes when a dataset is ingested.
+"""
+import typing
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SortKey:
+    name: str
+    descending: bool = False
+
+    def __str__(self):
+        return f"-{self.name}" if self.descending else self.name
+
+
+def parse_sort(spec: str) -> typing.List[SortKey]:
+    """ Parses a comma separated sort specification, raises ValueError """
+    sort_keys = []
+    for part in spec.split(","):
+        part = part.strip()
+        descending = part.startswith("-")
+        name = part[1:] if descending else part
+        if not name or name in [key.name for key in sort_keys]:
+            raise ValueError(f"Invalid sort specification: {spec}")
+        sort_keys.append(SortKey(name, descending))
+    return sort_keys
+
+
+def with_tiebreaker(
+    sort_keys: typing.List[SortKey], primary_name: str
+) -> typing.List[SortKey]:
+    """ Adds the primary key, so the order is stable and usable as a keyset """
+    if primary_name in [key.name for key in sort_keys]:
+        return list(sort_keys)
+    return list(sort_keys) + [SortKey(primary_name)]
+
+
+def format_sort(sort_keys: typing.List[SortKey]) -> str:
+    return ",".join(str(key) for key in sort_keys)
@@ -0,0 +1,45 @@
+"""
+Web mercator (EPSG:3857) tile grid, as used by vector tile clients
+
+Tiles are addressed as z/x/y, with y counted from the top (XYZ scheme).
+"""
+import math
+import typing
+
+WEB_MERCATOR_SRID = 3857
+
+# Half the circumference of the earth in web mercator meters
+ORIGIN_SHIFT = 20037508.342789244
+
+MAX_ZOOM = 24
+
+
+def tile_envelope(z: int, x: int, y: int) -> typing.List[float]:
+    """ Bounds (xmin, ymin, xmax, ymax) of a tile, raises ValueError """
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Invalid tile {z}/{x}/{y}")
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return [xmin, ymax - size, xmin + size, ymax]
+
+
+def lon_lat_to_tile(lon: float, lat: float, z: int) -> typing.Tuple[int, int]:
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(
+    bbox: typing.Sequence[float], min_zoom: int, max_zoom: int
+) -> typing.Iterator[typing.Tuple[int, int, int]]:
+    """ All tiles covering a (min lon, min lat, max lon, max lat) bounding box """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    for z in range(min_zoom, max_zoom + 1):
+        xmin, ymin = lon_lat_to_tile(min_lon, max_lat, z)
+        xmax, ymax = lon_lat_to_tile(max_lon, min_lat, z)
+        for x in range(xmin, xmax + 1):
+            for y in range(ymin, ymax + 1):
+                yield z, x, y
@@ -7,7 +7,7 @@ def main(setup_func=setup):
     test_requires = ["pytest", "pylint", "flake8", "requests"]
 
     setup_func(
-        version="1.0.1",
+        version="1.0.7",
         name="dataservices",
         packages=find_packages(),
         install_requires=install_requires,
@@ -0,0 +1,52 @@
+from dataservices.amsterdam_schema import registry
+from dataservices.amsterdam_schema.registry import SchemaRegistry
+
+
+URL = "https://schemas.example.com/datasets/example/example"
+
+
+class FakeResponse:
+    def __init__(self, data, etag):
+        self.data = data
+        self.status_code = 200
+        self.headers = {"ETag": etag}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """ Serves the current document with a new ETag on every request """
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests += 1
+        return FakeResponse(self.data, f'"{self.requests}"')
+
+
+def make_registry(monkeypatch, data):
+    monkeypatch.setattr(
+        registry, "schema_urls_from_url", lambda *args, **kwargs: {"example": URL}
+    )
+    schemas = SchemaRegistry("https://schemas.example.com/datasets/")
+    schemas.session = FakeSession(data)
+    return schemas
+
+
+def test_version_only_changes_with_the_content(monkeypatch):
+    schemas = make_registry(monkeypatch, {"id": "example", "tables": []})
+    schemas.get("example")
+    version = schemas.versions()["example"]
+    # Refetched with a new ETag, the same document in another key order
+    schemas.session.data = {"tables": [], "id": "example"}
+    schemas._revalidate("example")
+    assert schemas.versions()["example"] == version
+    schemas.session.data = {"id": "example", "tables": [{"id": "steden"}]}
+    schemas._revalidate("example")
+    assert schemas.versions()["example"] != version
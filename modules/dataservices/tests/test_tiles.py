@@ -0,0 +1,39 @@
+import pytest
+
+from dataservices.tiles import (
+    ORIGIN_SHIFT,
+    lon_lat_to_tile,
+    tile_envelope,
+    tiles_for_bbox,
+)
+
+
+def test_tile_envelope():
+    assert tile_envelope(0, 0, 0) == [
+        -ORIGIN_SHIFT,
+        -ORIGIN_SHIFT,
+        ORIGIN_SHIFT,
+        ORIGIN_SHIFT,
+    ]
+    # y is counted from the top
+    assert tile_envelope(1, 1, 0) == [0.0, 0.0, ORIGIN_SHIFT, ORIGIN_SHIFT]
+
+
+@pytest.mark.parametrize("z, x, y", [(-1, 0, 0), (25, 0, 0), (1, 2, 0), (1, 0, -1)])
+def test_invalid_tile(z, x, y):
+    with pytest.raises(ValueError):
+        tile_envelope(z, x, y)
+
+
+def test_lon_lat_to_tile():
+    # Amsterdam
+    assert lon_lat_to_tile(4.9, 52.37, 10) == (525, 336)
+    # Clamped at the edges of the grid
+    assert lon_lat_to_tile(180, -90, 2) == (3, 3)
+
+
+def test_tiles_for_bbox():
+    tiles = list(tiles_for_bbox([4.85, 52.33, 4.95, 52.40], 0, 12))
+    assert tiles[0] == (0, 0, 0)
+    assert {z for z, _, _ in tiles} == set(range(13))
+    assert len([tile for tile in tiles if tile[0] == 12]) == 4
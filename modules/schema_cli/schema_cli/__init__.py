@@ -1,22 +1,40 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import click
 from sqlalchemy import create_engine
 
-from dataservices.amsterdam_schema import schema_def_from_path, fetch_schema
+from dataservices.amsterdam_schema import (
+    schema_def_from_path,
+    fetch_schema,
+    get_session,
+)
+from dataservices.tiles import tiles_for_bbox
 
 from schema_ingest import (
     create_table,
     set_grants,
     create_rows,
+    create_indexes,
+    create_srid_columns,
+    fetch_index_create_stmts,
+    fetch_srid_column_stmts,
     fetch_table_create_stmts,
     fetch_row_insert_stmts,
     fetch_rows,
 )
+from schema_ingest.snapshots import write_snapshots
 
 from shape_convert import convert_shapes_from_zip
 
 DB_URI = os.getenv("DATABASE_URL")
 
+snapshot_path_option = click.option(
+    "--snapshot-path",
+    envvar="SNAPSHOT_PATH",
+    help="Write download snapshots of the ingested tables under this directory",
+)
+
 
 @click.group()
 def schema():
@@ -31,15 +49,30 @@ def ingest():
 @ingest.command()
 @click.argument("schema_path")
 @click.option("--dry-run", default=False)
-def table(schema_path, dry_run):
+@click.option(
+    "--srid",
+    "srids",
+    type=int,
+    multiple=True,
+    help="Precompute the geometries in this SRID too, e.g. 4326",
+)
+@snapshot_path_option
+def table(schema_path, dry_run, srids, snapshot_path):
     schema = fetch_schema(schema_def_from_path(schema_path))
     if not dry_run:
         engine = create_engine(DB_URI)
         with engine.begin() as connection:
             create_table(schema, connection)
+            create_srid_columns(schema, srids, connection)
             set_grants(schema, connection)
+        if snapshot_path:
+            for dataset_table in schema.tables:
+                write_snapshots(schema, dataset_table, engine, snapshot_path)
     else:
         print(fetch_table_create_stmts(schema))
+        for dataset_table in schema.tables:
+            for stmt in fetch_srid_column_stmts(schema, dataset_table, srids):
+                print(f"{stmt};")
 
 
 @ingest.command()
@@ -47,7 +80,8 @@ def table(schema_path, dry_run):
 @click.argument("schema_path")
 @click.argument("ndjson_path")
 @click.option("--dry-run", is_flag=True, default=False)
-def records(dataset_table_name, schema_path, ndjson_path, dry_run):
+@snapshot_path_option
+def records(dataset_table_name, schema_path, ndjson_path, dry_run, snapshot_path):
     # Add batching for rows.
     schema = fetch_schema(schema_def_from_path(schema_path))
     srid = schema["crs"].split(":")[-1]
@@ -58,10 +92,95 @@ def records(dataset_table_name, schema_path, ndjson_path, dry_run):
         engine = create_engine(DB_URI)
         with engine.begin() as connection:
             create_rows(schema, dataset_table, data, connection)
+        if snapshot_path:
+            write_snapshots(schema, dataset_table, engine, snapshot_path)
     else:
         print(fetch_row_insert_stmts(schema, dataset_table, data))
 
 
+@ingest.command()
+@click.argument("dataset_table_name")
+@click.argument("schema_path")
+@click.option(
+    "--sort",
+    "sort_specs",
+    multiple=True,
+    help="Sort specification as used in sorteer, e.g. -inwoners,name",
+)
+@click.option("--dry-run", is_flag=True, default=False)
+def indexes(dataset_table_name, schema_path, sort_specs, dry_run):
+    """ Creates indexes for the sort orders reported by dynapi /status/sorts """
+    schema = fetch_schema(schema_def_from_path(schema_path))
+    dataset_table = schema.get_table_by_id(dataset_table_name)
+    if not dry_run:
+        engine = create_engine(DB_URI)
+        with engine.begin() as connection:
+            create_indexes(schema, dataset_table, sort_specs, connection)
+    else:
+        print(";\n".join(fetch_index_create_stmts(schema, dataset_table, sort_specs)))
+
+
+@schema.group()
+def tiles():
+    pass
+
+
+def fetch_extent(schema, dataset_table):
+    """ Bounding box of the table in lon/lat """
+    engine = create_engine(DB_URI)
+    with engine.connect() as connection:
+        return list(
+            connection.execute(
+                "SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM "
+                "(SELECT ST_Transform(ST_SetSRID(ST_Extent(geometry), %s), 4326) e "
+                f"FROM {schema.id}.{dataset_table.id}) extent",
+                [int(schema["crs"].split(":")[-1])],
+            ).first()
+        )
+
+
+@tiles.command()
+@click.argument("dataset_table_name")
+@click.argument("schema_path")
+@click.option("--api-url", required=True, help="dynapi base url, e.g. http://host/api/")
+@click.option("--min-zoom", type=int, default=10)
+@click.option("--max-zoom", type=int, default=16)
+@click.option(
+    "--bbox",
+    help="min lon,min lat,max lon,max lat, defaults to the extent of the table",
+)
+@click.option("--concurrency", type=int, default=8)
+def seed(
+    dataset_table_name, schema_path, api_url, min_zoom, max_zoom, bbox, concurrency
+):
+    """ Renders the vector tiles of a table into the tile cache of dynapi """
+    schema = fetch_schema(schema_def_from_path(schema_path))
+    dataset_table = schema.get_table_by_id(dataset_table_name)
+    if bbox is not None:
+        bbox = [float(c) for c in bbox.split(",")]
+    else:
+        bbox = fetch_extent(schema, dataset_table)
+    if None in bbox:
+        click.echo("Table has no geometries, nothing to seed")
+        return
+    base_url = f"{api_url.rstrip('/')}/{schema.id}/{dataset_table.id}/tiles"
+    session = get_session(concurrency)
+
+    def fetch_tile(tile):
+        response = session.get(f"{base_url}/{'/'.join(map(str, tile))}.mvt")
+        response.raise_for_status()
+        return response.headers.get("X-Cache")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(fetch_tile, tiles_for_bbox(bbox, min_zoom, max_zoom))
+        )
+    click.echo(
+        f"{len(results)} tiles, {results.count('MISS')} rendered, "
+        f"{results.count('HIT')} already cached"
+    )
+
+
 @click.group()
 def shape():
     pass
@@ -3,7 +3,7 @@ from setuptools import find_packages
 
 setup(
     name="schema_cli",
-    version="0.0.2",
+    version="0.0.6",
     description="Module to use schema code through cli",
     long_description="Module to use schema code through cli",
     author="Jan Murre",
@@ -12,7 +12,8 @@ setup(
     packages=find_packages(),
     install_requires=[
         "click",
-        "schema_ingest",
+        "dataservices>=1.0.5",
+        "schema_ingest>=0.0.7",
         "shape_convert",
     ],
     extras_require={"tests": ["pytest"]},
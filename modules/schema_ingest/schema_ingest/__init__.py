@@ -4,6 +4,7 @@ import jsonschema
 import ndjson
 # from geoalchemy2.shape import from_shape
 from shapely.geometry import shape
+from dataservices.amsterdam_schema.sorting import parse_sort, with_tiebreaker
 from schema_db import DBTable
 
 
@@ -11,6 +12,13 @@ from schema_db import DBTable
 # But somewhat problematic with the re-creation of DBTable on every request
 metadata = MetaData()
 
+GEOMETRY_REF_PREFIX = "https://geojson.org/schema/"
+ID_REF_SUFFIX = "#/definitions/id"
+
+# Version marker per dataset table, bumped on every ingest. dynapi uses it
+# for ETags and cache invalidation without touching the data tables.
+VERSIONS_TABLE = "meta.table_versions"
+
 
 def fetch_rows(fh, srid):
     data = ndjson.load(fh)
@@ -39,6 +47,87 @@ def create_table(schema, connection):
         f"DROP SCHEMA IF EXISTS {dataset_name} CASCADE; CREATE SCHEMA {dataset_name}"
     )
     connection.execute(fetch_table_create_stmts(schema))
+    bump_versions(schema, [table.id for table in schema.tables], connection)
+
+
+def fetch_primary_name(dataset_table):
+    """ Name of the field that refers to the id definition, the primary key
+    dynapi uses. The `$ref` differs per version of Amsterdam Schema.
+    """
+    for field in dataset_table.fields:
+        if field.type.endswith(ID_REF_SUFFIX):
+            return field.name
+    return None
+
+
+def fetch_index_create_stmts(schema, dataset_table, sort_specs, primary_name=None):
+    """ Indexes that match `sorteer` specifications like "-inwoners,name"
+
+    The primary key is added as last column, dynapi uses it as tiebreaker
+    for a stable order and for keyset pagination. dynapi sorts the NULLs of
+    the other columns first, in both directions, the indexes do the same.
+    """
+    primary_name = primary_name or fetch_primary_name(dataset_table)
+    create_stmts = []
+    for sort_spec in sort_specs:
+        sort_keys = parse_sort(sort_spec)
+        if primary_name is not None:
+            sort_keys = with_tiebreaker(sort_keys, primary_name)
+        columns = ", ".join(
+            f'"{key.name}"'
+            + (" DESC" if key.descending else "")
+            + ("" if key.name == primary_name else " NULLS FIRST")
+            for key in sort_keys
+        )
+        name_parts = [
+            f"{key.name}_desc" if key.descending else key.name for key in sort_keys
+        ]
+        # Named apart from the indexes without NULLS FIRST, which do not match
+        index_name = f"{dataset_table.id}_{'_'.join(name_parts)}_sort_idx".lower()[:63]
+        create_stmts.append(
+            f"CREATE INDEX IF NOT EXISTS {index_name} "
+            f"ON {schema.id}.{dataset_table.id} ({columns})"
+        )
+    return create_stmts
+
+
+def fetch_srid_column_stmts(schema, dataset_table, srids):
+    """ Geometry columns precomputed in other SRIDs, with their spatial indexes
+
+    A column `<geometry>_<srid>` is generated from the geometry column, so it
+    is kept up to date by every insert (Postgres 12+). dynapi finds it through
+    the `geometry_columns` of PostGIS and renders it without `ST_Transform`.
+    """
+    create_stmts = []
+    for field in dataset_table.fields:
+        if not field.type.startswith(GEOMETRY_REF_PREFIX):
+            continue
+        for srid in srids:
+            column = f"{field.name}_{srid}"
+            create_stmts.append(
+                f"ALTER TABLE {schema.id}.{dataset_table.id} "
+                f'ADD COLUMN IF NOT EXISTS "{column}" geometry(Geometry, {srid}) '
+                f'GENERATED ALWAYS AS (ST_Transform("{field.name}", {srid})) STORED'
+            )
+            index_name = f"{dataset_table.id}_{column}_idx".lower()[:63]
+            create_stmts.append(
+                f"CREATE INDEX IF NOT EXISTS {index_name} "
+                f'ON {schema.id}.{dataset_table.id} USING gist ("{column}")'
+            )
+    return create_stmts
+
+
+def create_srid_columns(schema, srids, connection):
+    for dataset_table in schema.tables:
+        for stmt in fetch_srid_column_stmts(schema, dataset_table, srids):
+            connection.execute(stmt)
+
+
+def create_indexes(schema, dataset_table, sort_specs, connection, primary_name=None):
+    for stmt in fetch_index_create_stmts(
+        schema, dataset_table, sort_specs, primary_name
+    ):
+        connection.execute(stmt)
 
 
 # XXX could be made more fine-grained, GRANTS at col level SELECT(colname)
@@ -61,3 +150,44 @@ def create_rows(schema, dataset_table, data, connection):
             except jsonschema.exceptions.ValidationError as e:
                 print(f"error: {e.message} for {row}")
     connection.execute(db_table.pg_table.insert().values(), data)
+    bump_versions(schema, [dataset_table.id], connection, added_rows=len(data))
+
+
+def create_versions_table(connection):
+    connection.execute(
+        "CREATE SCHEMA IF NOT EXISTS meta; "
+        f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} ("
+        "dataset varchar NOT NULL, "
+        "table_name varchar NOT NULL, "
+        "version bigint NOT NULL, "
+        "updated_at timestamptz NOT NULL, "
+        "PRIMARY KEY (dataset, table_name)); "
+        f"ALTER TABLE {VERSIONS_TABLE} ADD COLUMN IF NOT EXISTS row_count bigint; "
+        "GRANT USAGE ON SCHEMA meta TO PUBLIC; "
+        f"GRANT SELECT ON {VERSIONS_TABLE} TO PUBLIC"
+    )
+
+
+def bump_versions(schema, table_ids, connection, added_rows=None):
+    """ Bumps the version of the tables, in the transaction of the ingest
+
+    Versions only go up, also when a dataset is dropped and re-created,
+    so an ETag is never reused for different content.
+
+    The row count of a table is kept along, dynapi uses it as the total of
+    an unfiltered collection. Without `added_rows` the tables were created
+    and are empty. The count of a table that was loaded before it was kept
+    stays unknown (NULL) until the table is created again.
+    """
+    create_versions_table(connection)
+    for table_id in table_ids:
+        connection.execute(
+            f"INSERT INTO {VERSIONS_TABLE} AS v "
+            "(dataset, table_name, version, updated_at, row_count) "
+            "VALUES (%s, %s, 1, date_trunc('second', now()), %s) "
+            "ON CONFLICT (dataset, table_name) DO UPDATE "
+            "SET version = v.version + 1, updated_at = EXCLUDED.updated_at, "
+            "row_count = CASE WHEN %s THEN v.row_count + EXCLUDED.row_count "
+            "ELSE EXCLUDED.row_count END",
+            [schema["id"], table_id, added_rows or 0, added_rows is not None],
+        )
@@ -0,0 +1,251 @@
+"""
+Download snapshots of the dataset tables, written after every ingest
+
+A snapshot is a whole table in a file, `<root>/<dataset>/<table>/<version>.<format>`
+for the version of the table in `meta.table_versions`. dynapi serves the file
+of the current version from disk, see `dynapi.snapshots`, so a bulk download
+does not touch the database. The files of older versions are removed once the
+new ones are in place.
+
+The formats are NDJSON and CSV, both gzipped, and GeoParquet. Geometries are
+in the SRID they are stored in: GeoJSON in NDJSON, hex EWKB in CSV and WKB in
+GeoParquet. GeoParquet needs pyarrow, `pip install schema_ingest[snapshots]`,
+without it only the other formats are written.
+"""
+import functools
+import gzip
+import json
+import os
+import tempfile
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from . import GEOMETRY_REF_PREFIX, VERSIONS_TABLE
+
+SNAPSHOT_FORMATS = ("ndjson.gz", "csv.gz", "parquet")
+
+# Rows fetched per round trip, and per row group of a GeoParquet file
+FETCH_SIZE = int(os.getenv("SNAPSHOT_FETCH_SIZE", 10000))
+GZIP_LEVEL = int(os.getenv("SNAPSHOT_GZIP_LEVEL", 6))
+PARQUET_COMPRESSION = os.getenv("SNAPSHOT_PARQUET_COMPRESSION", "zstd")
+
+
+def snapshot_path(root, dataset, table, version, format_):
+    return os.path.join(root, dataset, table, f"{version}.{format_}")
+
+
+def available_formats():
+    """ The formats that can be written, GeoParquet only with pyarrow """
+    return [f for f in SNAPSHOT_FORMATS if f != "parquet" or pa is not None]
+
+
+def _is_geometry(field):
+    return field.type.startswith(GEOMETRY_REF_PREFIX)
+
+
+def _srid(schema):
+    return int(schema["crs"].split(":")[-1])
+
+
+def _columns(dataset_table, geometry_function, cast=""):
+    return ", ".join(
+        f'{geometry_function}("{field.name}"){cast} AS "{field.name}"'
+        if _is_geometry(field)
+        else f'"{field.name}"'
+        for field in dataset_table.fields
+    )
+
+
+def _table_name(schema, dataset_table):
+    return f'"{schema.id}"."{dataset_table.id}"'
+
+
+def ndjson_sql(schema, dataset_table):
+    """ Rows as JSON text, rendered by Postgres. `row_to_json` has no limit on
+    the number of columns, unlike the arguments of `json_build_object`.
+    """
+    return (
+        f"SELECT row_to_json(t)::text FROM ("
+        f"SELECT {_columns(dataset_table, 'ST_AsGeoJSON', '::json')} "
+        f"FROM {_table_name(schema, dataset_table)}) t"
+    )
+
+
+def csv_sql(schema, dataset_table):
+    select = (
+        f"SELECT {_columns(dataset_table, 'ST_AsHEXEWKB')} "
+        f"FROM {_table_name(schema, dataset_table)}"
+    )
+    return f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+
+def parquet_sql(schema, dataset_table):
+    return (
+        f"SELECT {_columns(dataset_table, 'ST_AsBinary')} "
+        f"FROM {_table_name(schema, dataset_table)}"
+    )
+
+
+def arrow_type(field):
+    if _is_geometry(field):
+        return pa.binary()
+    return {
+        "integer": pa.int64(),
+        "number": pa.float64(),
+        "boolean": pa.bool_(),
+    }.get(field.type, pa.string())
+
+
+def geo_metadata(field, srid):
+    """ GeoParquet metadata of the geometry column, WKB in the given SRID """
+    geometry_type = field.type[len(GEOMETRY_REF_PREFIX) :].split(".")[0]
+    if geometry_type == "Geometry":
+        geometry_type = None
+    return {
+        "version": "1.0.0",
+        "primary_column": field.name,
+        "columns": {
+            field.name: {
+                "encoding": "WKB",
+                "geometry_types": [geometry_type] if geometry_type else [],
+                "crs": {"id": {"authority": "EPSG", "code": srid}},
+            }
+        },
+    }
+
+
+def write_ndjson(fh, connection, schema, dataset_table):
+    result = connection.execution_options(stream_results=True).execute(
+        ndjson_sql(schema, dataset_table)
+    )
+    with gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=GZIP_LEVEL) as out:
+        while True:
+            rows = result.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            out.write("".join(f"{row[0]}\n" for row in rows).encode())
+
+
+def write_csv(fh, connection, schema, dataset_table):
+    """ Written by COPY, the rows do not pass through Python objects """
+    with gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=GZIP_LEVEL) as out:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(csv_sql(schema, dataset_table), out)
+        finally:
+            cursor.close()
+
+
+def write_parquet(fh, connection, schema, dataset_table):
+    """ GeoParquet, a row group per fetch """
+    fields = dataset_table.fields
+    metadata = None
+    geometry_fields = [field for field in fields if _is_geometry(field)]
+    if geometry_fields:
+        geo = geo_metadata(geometry_fields[0], _srid(schema))
+        metadata = {"geo": json.dumps(geo)}
+    arrow_schema = pa.schema(
+        [pa.field(field.name, arrow_type(field)) for field in fields],
+        metadata=metadata,
+    )
+    result = connection.execution_options(stream_results=True).execute(
+        parquet_sql(schema, dataset_table)
+    )
+    with pq.ParquetWriter(fh, arrow_schema, compression=PARQUET_COMPRESSION) as out:
+        while True:
+            rows = result.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            columns = zip(*rows)
+            arrays = [
+                pa.array(
+                    [
+                        bytes(value) if isinstance(value, memoryview) else value
+                        for value in values
+                    ],
+                    type=field.type,
+                )
+                for values, field in zip(columns, arrow_schema)
+            ]
+            out.write_batch(pa.RecordBatch.from_arrays(arrays, schema=arrow_schema))
+
+
+WRITERS = {
+    "ndjson.gz": write_ndjson,
+    "csv.gz": write_csv,
+    "parquet": write_parquet,
+}
+
+
+def _write_atomically(path, write):
+    """ The file appears complete or not at all, a reader never sees a part """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write(fh)
+        # Readable by dynapi, which may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _snapshot_version(name):
+    """ The table version of a snapshot file, None for other files """
+    version, _, format_ = name.partition(".")
+    if format_ not in SNAPSHOT_FORMATS or not version.isdigit():
+        return None
+    return int(version)
+
+
+def prune_snapshots(root, dataset, table, version):
+    """ Removes the snapshots of older versions. A download of one of them that
+    is in progress keeps its open file. Newer snapshots are kept, they may have
+    been written in the meantime by a later ingest.
+    """
+    directory = os.path.join(root, dataset, table)
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        name_version = _snapshot_version(name)
+        if name_version is not None and name_version < version:
+            os.unlink(os.path.join(directory, name))
+
+
+def write_snapshots(schema, dataset_table, engine, root, formats=None):
+    """ Snapshots of the committed table, returns their version
+
+    The version and the rows are read in one repeatable read transaction, so a
+    snapshot holds the rows of its version also when an ingest commits in the
+    meantime. A snapshot that exists already is kept, it has the same rows.
+    """
+    formats = available_formats() if formats is None else formats
+    engine = engine.execution_options(isolation_level="REPEATABLE READ")
+    with engine.connect() as connection, connection.begin():
+        version = connection.execute(
+            f"SELECT version FROM {VERSIONS_TABLE} "
+            "WHERE dataset = %s AND table_name = %s",
+            [schema.id, dataset_table.id],
+        ).scalar()
+        if version is None:
+            return None
+        for format_ in formats:
+            path = snapshot_path(root, schema.id, dataset_table.id, version, format_)
+            if os.path.exists(path):
+                continue
+            write = functools.partial(
+                WRITERS[format_],
+                connection=connection,
+                schema=schema,
+                dataset_table=dataset_table,
+            )
+            _write_atomically(path, write)
+    prune_snapshots(root, schema.id, dataset_table.id, version)
+    return version
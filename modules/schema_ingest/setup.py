@@ -3,7 +3,7 @@ from setuptools import find_packages
 
 setup(
     name="schema_ingest",
-    version="0.0.2",
+    version="0.0.9",
     description="Module to ingest amsterdam schema",
     long_description="Module to ingest amsterdam schema",
     author="Jan Murre",
@@ -14,10 +14,10 @@ setup(
         "requests",
         "SQLAlchemy",
         "jsonschema",
-        "dataservices>=0.0.3",
+        "dataservices>=1.0.4",
         "ndjson",
         "shapely",
         "schema_db",
     ],
-    extras_require={"tests": ["pytest"]},
+    extras_require={"tests": ["pytest"], "snapshots": ["pyarrow"]},
 )
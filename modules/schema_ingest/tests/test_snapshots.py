@@ -0,0 +1,129 @@
+import gzip
+import os
+
+from dataservices.amsterdam_schema import DatasetSchema
+from schema_ingest.snapshots import (
+    ndjson_sql,
+    prune_snapshots,
+    snapshot_path,
+    write_snapshots,
+)
+
+
+SCHEMA = DatasetSchema.from_dict(
+    {
+        "id": "example",
+        "type": "dataset",
+        "crs": "EPSG:28992",
+        "tables": [
+            {
+                "id": "steden",
+                "type": "table",
+                "schema": {
+                    "properties": {
+                        "id": {"type": "string"},
+                        "naam": {"type": "string"},
+                        "geometry": {"$ref": "https://geojson.org/schema/Point.json"},
+                    }
+                },
+            }
+        ],
+    }
+)
+
+STEDEN = SCHEMA.get_table_by_id("steden")
+
+
+class FakeResult:
+    def __init__(self, rows=(), scalar=None):
+        self.rows = list(rows)
+        self._scalar = scalar
+
+    def scalar(self):
+        return self._scalar
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """ A table at `version` with JSON rows, the statements are recorded """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def begin(self):
+        return self
+
+    def execution_options(self, **options):
+        return self
+
+    def execute(self, sql, args=None):
+        self.statements.append(sql)
+        if "table_versions" in sql:
+            return FakeResult(scalar=self.version)
+        return FakeResult([(row,) for row in self.rows])
+
+
+class FakeEngine:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execution_options(self, **options):
+        return self
+
+    def connect(self):
+        return self.connection
+
+
+def test_ndjson_is_rendered_by_postgres():
+    sql = ndjson_sql(SCHEMA, STEDEN)
+    assert sql.startswith("SELECT row_to_json(t)::text FROM (SELECT ")
+    assert 'ST_AsGeoJSON("geometry")::json AS "geometry"' in sql
+    assert sql.endswith('FROM "example"."steden") t')
+
+
+def test_snapshot_of_the_current_version(tmp_path):
+    rows = ['{"id":"1"}', '{"id":"2"}']
+    engine = FakeEngine(FakeConnection(3, rows))
+    assert write_snapshots(SCHEMA, STEDEN, engine, str(tmp_path), ["ndjson.gz"]) == 3
+    path = snapshot_path(str(tmp_path), "example", "steden", 3, "ndjson.gz")
+    with gzip.open(path) as fh:
+        assert fh.read() == b'{"id":"1"}\n{"id":"2"}\n'
+    assert os.listdir(os.path.dirname(path)) == ["3.ndjson.gz"]
+
+
+def test_existing_snapshot_is_kept(tmp_path):
+    path = snapshot_path(str(tmp_path), "example", "steden", 3, "ndjson.gz")
+    os.makedirs(os.path.dirname(path))
+    open(path, "wb").close()
+    connection = FakeConnection(3, ['{"id":"1"}'])
+    engine = FakeEngine(connection)
+    write_snapshots(SCHEMA, STEDEN, engine, str(tmp_path), ["ndjson.gz"])
+    assert os.path.getsize(path) == 0
+    assert len(connection.statements) == 1
+
+
+def test_table_without_a_version(tmp_path):
+    engine = FakeEngine(FakeConnection(None, []))
+    assert write_snapshots(SCHEMA, STEDEN, engine, str(tmp_path)) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_older_versions_are_pruned(tmp_path):
+    directory = tmp_path / "example" / "steden"
+    directory.mkdir(parents=True)
+    names = ["2.csv.gz", "3.csv.gz", "3.parquet", "4.csv.gz", ".5.tmp", "x.csv.gz"]
+    for name in names:
+        (directory / name).touch()
+    prune_snapshots(str(tmp_path), "example", "steden", 3)
+    assert sorted(os.listdir(directory)) == sorted(names[1:])
@@ -1,3 +1,8 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from schema_ingest.snapshots import write_snapshots
+
 from .generators.mapfile import (
     MapfileGenerator
 )
@@ -19,3 +24,26 @@ class CreateMapfileFromDataset:
     def __call__(self, dataset_json: str):
         dataset = self._dataset_from_json(dataset_json)
         return self._generator(dataset)
+
+
+class WriteSnapshots:
+    """ Writes the download snapshots of tables after an ingest, in a
+    background thread so the request that ingested does not wait for them.
+    One snapshot is written at a time, a later ingest queues behind it.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, engine, root):
+        self.engine = engine
+        self.root = root
+
+    def __call__(self, schema, dataset_tables):
+        return self._executor.submit(self._write, schema, dataset_tables)
+
+    def _write(self, schema, dataset_tables):
+        for dataset_table in dataset_tables:
+            try:
+                write_snapshots(schema, dataset_table, self.engine, self.root)
+            except Exception:
+                logging.exception("Snapshots of %s not written", dataset_table.id)
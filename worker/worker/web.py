@@ -31,9 +31,16 @@ DB_DSN = os.getenv(
 
 SCHEMA_URL = os.getenv("SCHEMA_URL")
 
+# Directory of the download snapshots written after an ingest, none without it
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+
 # Change this to use aproach as in dynapi
 engine = create_engine(DB_DSN)
 
+write_snapshots = (
+    executors.WriteSnapshots(engine, SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+)
+
 
 @app.route("/mapfiles", methods=["POST"])
 def create_mapfile():
@@ -44,6 +51,7 @@ def create_mapfile():
 @app.route("/datasets", methods=["POST"])
 def create_dataset():
     schema = fetch_schema(request.json)
+    # The new tables are empty, their snapshots are written once rows are added
     with engine.begin() as connection:
         create_table(schema, connection)
     return "", http.client.NO_CONTENT
@@ -60,6 +68,8 @@ def add_rows(dataset, table):
     data = list(fetch_rows(buf, srid))
     with engine.begin() as connection:
         create_rows(schema, dataset_table, data, connection)
+    if write_snapshots is not None:
+        write_snapshots(schema, [dataset_table])
     return "", http.client.NO_CONTENT
 
 